@@ -1,10 +1,25 @@
 import streamlit as st
 from audio_recorder_streamlit import audio_recorder
-import requests
-import pandas as pd
-import io
+import os
+import functools
+import operator
+import tempfile
 import time
+import hashlib
 from datetime import datetime
+from bookbuddy.audio import AUDIO_FORMATS, FFMPEG_PATH, analyze_wav, assemble_takes, decode_wav, encode_audio, resolve_assembly_order, trim_silence
+from bookbuddy.lazy import lazy_import
+from bookbuddy.memory import SpillableStore
+from bookbuddy.tracing import span
+from bookbuddy.ui import (
+    apply_page_style, error_message, get_spill_cache, govern_session_memory, init_session_state,
+    render_header, render_trace_panel, start_rerun_trace, success_message
+)
+from bookbuddy.webhook import send_recording_to_webhook, send_recordings_concurrently
+
+# Loaded on first use, so the recorder renders before any recording exists
+pd = lazy_import('pandas')
+px = lazy_import('plotly.express')
 
 # Page configuration
 st.set_page_config(
@@ -14,18 +29,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+start_rerun_trace("Recorder")
+
 # Custom CSS for better styling
-st.markdown("""
-<style>
-    .main-header {
-        text-align: center;
-        padding: 2rem 0;
-        background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border-radius: 10px;
-        margin-bottom: 2rem;
-    }
-    
+apply_page_style(('#667eea', '#764ba2'), """
     .recording-section {
         background: #f8f9fa;
         padding: 2rem;
@@ -42,40 +49,33 @@ st.markdown("""
         text-align: center;
         margin: 0.5rem;
     }
-    
-    .success-message {
-        background: #d4edda;
-        color: #155724;
-        padding: 1rem;
-        border-radius: 8px;
-        border: 1px solid #c3e6cb;
-        margin: 1rem 0;
-    }
-    
-    .error-message {
-        background: #f8d7da;
-        color: #721c24;
-        padding: 1rem;
-        border-radius: 8px;
-        border: 1px solid #f5c6cb;
-        margin: 1rem 0;
-    }
-</style>
-""", unsafe_allow_html=True)
+""")
 
 # Initialize session state
-if 'recordings' not in st.session_state:
-    st.session_state.recordings = []
-if 'total_duration' not in st.session_state:
-    st.session_state.total_duration = 0
+init_session_state({
+    'recordings': [],
+    'total_duration': 0,
+    # Takes by hash; the memory governor moves old ones to disk under pressure
+    'audio_store': SpillableStore(get_spill_cache())
+})
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def encode_recording(audio_hash, audio_format, bitrate_kbps, _wav_bytes):
+    """Cached encode keyed by the hash of the original WAV"""
+    return encode_audio(_wav_bytes, audio_format, bitrate_kbps)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def process_recording(audio_hash, threshold_db, min_silence_s, split, _wav_bytes):
+    """Cached silence trimming keyed by the hash of the original recording"""
+    return trim_silence(_wav_bytes, threshold_db, min_silence_s, split)
+
+@st.cache_data(show_spinner=False, max_entries=1024)
+def analyze_recording(audio_hash, _load_wav):
+    """Cached take analytics keyed by the recording hash; the take is only loaded on a cache miss"""
+    return analyze_wav(_load_wav())
 
 # Main header
-st.markdown("""
-<div class="main-header">
-    <h1>🎙️ AI Book Buddy - Audiobook Recorder</h1>
-    <p>Professional audiobook recording and management platform</p>
-</div>
-""", unsafe_allow_html=True)
+render_header("🎙️ AI Book Buddy - Audiobook Recorder", "Professional audiobook recording and management platform")
 
 # Sidebar configuration
 with st.sidebar:
@@ -114,6 +114,60 @@ with st.sidebar:
         help="Time to wait before stopping recording automatically"
     )
     
+    # Silence trimming settings
+    st.subheader("✂️ Silence Trimming")
+    trim_enabled = st.checkbox("Trim leading/trailing silence", value=True)
+    silence_threshold_db = st.slider(
+        "Silence Threshold (dBFS)",
+        min_value=-70,
+        max_value=-20,
+        value=-45,
+        help="Frames quieter than this are treated as silence",
+        disabled=not trim_enabled
+    )
+    split_on_silence = st.checkbox(
+        "Split takes on long pauses",
+        value=False,
+        disabled=not trim_enabled,
+        help="Save each spoken segment as its own recording"
+    )
+    min_silence_s = st.slider(
+        "Min Pause to Split (seconds)",
+        min_value=0.3,
+        max_value=5.0,
+        value=1.5,
+        step=0.1,
+        disabled=not (trim_enabled and split_on_silence)
+    )
+    
+    # Output encoding settings
+    st.subheader("🗜️ Output Encoding")
+    upload_format = st.selectbox(
+        "Upload Format",
+        list(AUDIO_FORMATS.keys()),
+        index=1 if FFMPEG_PATH else 0,
+        help="FLAC is lossless; Opus and MP3 are lossy with a selectable bitrate"
+    )
+    upload_bitrate = st.select_slider(
+        "Bitrate (kbps)",
+        options=[32, 48, 64, 96, 128, 192, 256],
+        value=64 if upload_format == 'Opus' else 128,
+        disabled=not AUDIO_FORMATS[upload_format]['lossy']
+    )
+    if upload_format != 'WAV' and FFMPEG_PATH is None:
+        st.warning("ffmpeg not found, recordings will be sent as WAV")
+        upload_format = 'WAV'
+    
+    # Bulk upload settings
+    st.subheader("🚀 Bulk Upload")
+    max_concurrent_uploads = st.slider(
+        "Max Concurrent Uploads",
+        min_value=1,
+        max_value=16,
+        value=4,
+        help="Number of recordings sent to the webhook in parallel"
+    )
+    
     # Recording statistics
     st.subheader("📊 Session Statistics")
     col1, col2 = st.columns(2)
@@ -167,6 +221,15 @@ with col2:
         st.session_state.recording_type = "retake"
         st.warning("Retake mode activated")
     
+    retake_target = None
+    if st.session_state.get('recording_type') == 'retake' and st.session_state.recordings:
+        originals = {
+            f"{rec['name']} ({rec['timestamp']})": rec['hash']
+            for rec in st.session_state.recordings
+        }
+        retake_label = st.selectbox("Retake replaces", list(originals.keys()))
+        retake_target = originals[retake_label]
+    
     # Recording tips
     st.markdown("### 💡 Recording Tips")
     st.markdown("""
@@ -179,11 +242,33 @@ with col2:
 
 # Handle audio output
 if audio_bytes:
-    st.markdown("""
-    <div class="success-message">
-        ✅ Audio recorded successfully! Duration: {:.1f} seconds
-    </div>
-    """.format(len(audio_bytes) / (sample_rate * 2)), unsafe_allow_html=True)
+    original_hash = hashlib.sha256(audio_bytes).hexdigest()
+    segments = [audio_bytes]
+    trim_result = None
+    if trim_enabled:
+        try:
+            trim_result = process_recording(
+                original_hash, silence_threshold_db, min_silence_s, split_on_silence, audio_bytes
+            )
+            segments = trim_result['segments']
+            audio_bytes = trim_result['trimmed']
+        except Exception as e:
+            st.warning(f"Silence trimming skipped: {str(e)}")
+    
+    try:
+        pcm, wav_rate, wav_channels, _ = decode_wav(audio_bytes)
+        duration = len(pcm) / wav_channels / wav_rate
+    except Exception:
+        duration = len(audio_bytes) / (sample_rate * 2)
+    
+    success_message(f"✅ Audio recorded successfully! Duration: {duration:.1f} seconds")
+    
+    if trim_result:
+        st.caption(
+            f"✂️ Trimmed {trim_result['original_duration'] - trim_result['trimmed_duration']:.1f}s of silence "
+            f"({trim_result['bytes_saved'] / 1024:.1f} KB saved) in {trim_result['seconds'] * 1000:.0f} ms"
+            + (f" · {len(segments)} segments will be saved" if split_on_silence else "")
+        )
     
     # Audio playback
     st.audio(audio_bytes, format="audio/wav")
@@ -192,20 +277,45 @@ if audio_bytes:
     recording_info = {
         'name': filename,
         'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'duration': len(audio_bytes) / (sample_rate * 2),
+        'duration': duration,
         'sample_rate': sample_rate,
-        'size_kb': len(audio_bytes) / 1024
+        'size_kb': len(audio_bytes) / 1024,
+        'hash': hashlib.sha256(audio_bytes).hexdigest(),
+        'original_hash': original_hash,
+        'recording_type': st.session_state.get('recording_type', 'chapter'),
+        'replaces': retake_target
     }
     
+    # Encode for download and upload
+    format_spec = AUDIO_FORMATS[upload_format]
+    try:
+        encoded_bytes, encode_seconds = encode_recording(
+            recording_info['hash'], upload_format, upload_bitrate, audio_bytes
+        )
+    except Exception as e:
+        error_message(f"⚠️ Encoding to {upload_format} failed, falling back to WAV: {str(e)}")
+        upload_format = 'WAV'
+        format_spec = AUDIO_FORMATS['WAV']
+        encoded_bytes, encode_seconds = audio_bytes, 0.0
+    
     # Display recording info
-    col1, col2, col3, col4 = st.columns(4)
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
     with col1:
         st.metric("Duration", f"{recording_info['duration']:.1f}s")
     with col2:
         st.metric("Sample Rate", f"{recording_info['sample_rate']} Hz")
     with col3:
-        st.metric("File Size", f"{recording_info['size_kb']:.1f} KB")
+        st.metric("WAV Size", f"{recording_info['size_kb']:.1f} KB")
     with col4:
+        st.metric(
+            f"{upload_format} Size",
+            f"{len(encoded_bytes) / 1024:.1f} KB",
+            delta=f"{(len(encoded_bytes) / len(audio_bytes) - 1) * 100:.0f}%",
+            delta_color="inverse"
+        )
+    with col5:
+        st.metric("Encode Time", f"{encode_seconds * 1000:.0f} ms")
+    with col6:
         st.metric("Quality", "High" if sample_rate >= 44100 else "Standard")
     
     # Action buttons
@@ -215,17 +325,32 @@ if audio_bytes:
         # Download button
         st.download_button(
             label="⬇️ Download Audio",
-            data=audio_bytes,
-            file_name=f"{filename}.wav",
-            mime="audio/wav",
+            data=encoded_bytes,
+            file_name=f"{filename}.{format_spec['ext']}",
+            mime=format_spec['mime'],
             use_container_width=True
         )
     
     with col2:
         # Save to session
         if st.button("💾 Save to Session", use_container_width=True):
-            st.session_state.recordings.append(recording_info)
-            st.session_state.total_duration += recording_info['duration']
+            if len(segments) > 1:
+                for i, segment in enumerate(segments, start=1):
+                    pcm, wav_rate, wav_channels, _ = decode_wav(segment)
+                    segment_info = dict(
+                        recording_info,
+                        name=f"{filename}_part{i}",
+                        duration=len(pcm) / wav_channels / wav_rate,
+                        size_kb=len(segment) / 1024,
+                        hash=hashlib.sha256(segment).hexdigest()
+                    )
+                    st.session_state.recordings.append(segment_info)
+                    st.session_state.audio_store[segment_info['hash']] = segment
+                    st.session_state.total_duration += segment_info['duration']
+            else:
+                st.session_state.recordings.append(recording_info)
+                st.session_state.audio_store[recording_info['hash']] = audio_bytes
+                st.session_state.total_duration += recording_info['duration']
             st.success("Recording saved to session!")
             st.rerun()
     
@@ -234,33 +359,16 @@ if audio_bytes:
         if webhook_url and st.button("🚀 Send to n8n", use_container_width=True):
             try:
                 with st.spinner("Sending to n8n webhook..."):
-                    files = {"file": (f"{filename}.wav", audio_bytes, "audio/wav")}
-                    data = {
-                        "name": filename,
-                        "timestamp": recording_info['timestamp'],
-                        "duration": recording_info['duration'],
-                        "sample_rate": recording_info['sample_rate']
-                    }
-                    response = requests.post(webhook_url, files=files, data=data, timeout=30)
+                    status_code, _ = send_recording_to_webhook(
+                        webhook_url, recording_info, encoded_bytes, upload_format
+                    )
                     
-                    if response.status_code == 200:
-                        st.markdown("""
-                        <div class="success-message">
-                            ✅ Audio sent to n8n successfully!
-                        </div>
-                        """, unsafe_allow_html=True)
+                    if status_code == 200:
+                        success_message("✅ Audio sent to n8n successfully!")
                     else:
-                        st.markdown(f"""
-                        <div class="error-message">
-                            ❌ Failed with status code {response.status_code}
-                        </div>
-                        """, unsafe_allow_html=True)
+                        error_message(f"❌ Failed with status code {status_code}")
             except Exception as e:
-                st.markdown(f"""
-                <div class="error-message">
-                    ⚠️ Error sending to webhook: {str(e)}
-                </div>
-                """, unsafe_allow_html=True)
+                error_message(f"⚠️ Error sending to webhook: {str(e)}")
 
 # Recording history
 if st.session_state.recordings:
@@ -278,10 +386,66 @@ if st.session_state.recordings:
             "timestamp": "Recorded At",
             "duration": st.column_config.NumberColumn("Duration (s)", format="%.1f"),
             "sample_rate": "Sample Rate (Hz)",
-            "size_kb": st.column_config.NumberColumn("Size (KB)", format="%.1f")
+            "size_kb": st.column_config.NumberColumn("Size (KB)", format="%.1f"),
+            "hash": None,
+            "original_hash": None,
+            "recording_type": "Type",
+            "replaces": None
         }
     )
     
+    # Bulk send to webhook
+    with st.expander("🚀 Bulk Send to n8n"):
+        labels = {
+            f"{rec['name']} ({rec['timestamp']})": rec
+            for rec in st.session_state.recordings
+            if rec.get('hash') in st.session_state.audio_store
+        }
+        selected_labels = st.multiselect(
+            "Recordings to send",
+            list(labels.keys()),
+            default=list(labels.keys())
+        )
+        
+        if not webhook_url:
+            st.info("Enter an n8n webhook URL in the sidebar to enable bulk sending")
+        elif st.button("🚀 Send Selected", disabled=not selected_labels):
+            selected = [labels[label] for label in selected_labels]
+            progress = st.progress(0.0, text="Starting uploads...")
+            status_table = st.empty()
+            rows = []
+            
+            def on_result(result, done, total):
+                rows.append({
+                    'Recording': result['name'],
+                    'Status': result['status'] if result['error'] is None else "error",
+                    'Time (s)': result['seconds'],
+                    'Size (KB)': result['size_kb'],
+                    'Error': result['error'] or ""
+                })
+                progress.progress(done / total, text=f"Sent {done} of {total}")
+                status_table.dataframe(pd.DataFrame(rows), use_container_width=True)
+            
+            results, elapsed = send_recordings_concurrently(
+                webhook_url,
+                selected,
+                st.session_state.audio_store,
+                max_concurrent_uploads,
+                audio_format=upload_format,
+                bitrate_kbps=upload_bitrate,
+                on_result=on_result
+            )
+            
+            succeeded = sum(1 for r in results if r['status'] == 200)
+            total_mb = sum(r['size_kb'] for r in results) / 1024
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Delivered", f"{succeeded}/{len(results)}")
+            with col2:
+                st.metric("Throughput", f"{total_mb / elapsed:.2f} MB/s" if elapsed else "n/a")
+            with col3:
+                st.metric("Wall Time", f"{elapsed:.1f}s")
+    
     # Bulk actions
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -297,12 +461,151 @@ if st.session_state.recordings:
     with col2:
         if st.button("🗑️ Clear History"):
             st.session_state.recordings = []
+            st.session_state.audio_store.clear()
             st.session_state.total_duration = 0
             st.rerun()
     
     with col3:
         if st.button("📈 View Analytics"):
-            st.info("Analytics feature coming soon!")
+            st.session_state.show_analytics = not st.session_state.get('show_analytics', False)
+    
+    # Chapter / book assembly
+    with st.expander("🎬 Assemble Chapter / Book"):
+        assembly_labels = {
+            f"{rec['name']} ({rec['timestamp']})": rec
+            for rec in resolve_assembly_order(st.session_state.recordings)
+            if rec.get('hash') in st.session_state.audio_store
+        }
+        assembly_selection = st.multiselect(
+            "Takes in order (retakes already substituted)",
+            list(assembly_labels.keys()),
+            default=list(assembly_labels.keys()),
+            help="Selection order is the assembly order"
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            assembly_name = st.text_input("Output Name", value="audiobook")
+        with col2:
+            crossfade_ms = st.slider("Crossfade (ms)", min_value=0, max_value=500, value=50, step=10)
+        
+        if st.button("🎬 Assemble", disabled=not assembly_selection):
+            previous = st.session_state.get('assembly_result')
+            if previous and os.path.exists(previous['path']):
+                os.unlink(previous['path'])
+            
+            fd, output_path = tempfile.mkstemp(suffix='.wav', prefix='bookbuddy_')
+            os.close(fd)
+            # Loaders rather than bytes, so spilled takes are read back one at a time
+            takes = [
+                (assembly_labels[label]['name'],
+                 functools.partial(operator.getitem, st.session_state.audio_store, assembly_labels[label]['hash']))
+                for label in assembly_selection
+            ]
+            try:
+                with st.spinner("Assembling takes..."):
+                    result = assemble_takes(takes, output_path, crossfade_ms)
+                result['path'] = output_path
+                result['name'] = assembly_name
+                st.session_state.assembly_result = result
+            except Exception as e:
+                os.unlink(output_path)
+                error_message(f"❌ Assembly failed: {str(e)}")
+        
+        result = st.session_state.get('assembly_result')
+        if result and os.path.exists(result['path']):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Assembled Duration", f"{result['duration']:.1f}s")
+            with col2:
+                st.metric("Assembly Time", f"{result['seconds'] * 1000:.0f} ms")
+            with col3:
+                st.metric("Speed", f"{result['realtime_factor']:.0f}× real-time")
+            
+            st.dataframe(
+                pd.DataFrame(result['chapters']),
+                use_container_width=True,
+                column_config={
+                    "label": "Chapter Marker",
+                    "start": st.column_config.NumberColumn("Starts At (s)", format="%.2f")
+                }
+            )
+            with open(result['path'], 'rb') as f:
+                st.download_button(
+                    "⬇️ Download Assembled Audio",
+                    f,
+                    f"{result['name']}.wav",
+                    "audio/wav"
+                )
+    
+    # Recording analytics
+    if st.session_state.get('show_analytics'):
+        st.markdown("### 📈 Recording Analytics")
+        
+        rows = []
+        start = time.perf_counter()
+        for rec in st.session_state.recordings:
+            if rec.get('hash') not in st.session_state.audio_store:
+                continue
+            try:
+                # A loader rather than the bytes, so cached takes aren't read back from the spill cache
+                stats = analyze_recording(
+                    rec['hash'], functools.partial(operator.getitem, st.session_state.audio_store, rec['hash'])
+                )
+            except KeyError:
+                # Spill file pruned since the check above
+                continue
+            except Exception as e:
+                st.warning(f"Could not analyze {rec['name']}: {str(e)}")
+                continue
+            rows.append({'name': rec['name'], **stats})
+        analysis_seconds = time.perf_counter() - start
+        
+        if rows:
+            analytics_df = pd.DataFrame(rows)
+            
+            col1, col2, col3, col4, col5 = st.columns(5)
+            with col1:
+                st.metric("Avg Loudness", f"{analytics_df['lufs_approx'].mean():.1f} LUFS")
+            with col2:
+                st.metric("Max Peak", f"{analytics_df['peak_dbfs'].max():.1f} dBFS")
+            with col3:
+                st.metric("Clipped Samples", f"{analytics_df['clipped_samples'].sum():,}")
+            with col4:
+                # Takes without pauses have no noise floor
+                noise_floor = analytics_df['noise_floor_dbfs'].median()
+                st.metric("Median Noise Floor", f"{noise_floor:.1f} dBFS" if pd.notna(noise_floor) else "n/a")
+            with col5:
+                st.metric("Avg Speaking Rate", f"{analytics_df['syllables_per_min'].mean():.0f} syl/min")
+            
+            st.dataframe(
+                analytics_df,
+                use_container_width=True,
+                column_config={
+                    "name": "Recording Name",
+                    "duration": st.column_config.NumberColumn("Duration (s)", format="%.1f"),
+                    "rms_dbfs": st.column_config.NumberColumn("RMS (dBFS)", format="%.1f"),
+                    "lufs_approx": st.column_config.NumberColumn("Loudness (LUFS≈)", format="%.1f"),
+                    "peak_dbfs": st.column_config.NumberColumn("Peak (dBFS)", format="%.1f"),
+                    "clipped_samples": "Clipped Samples",
+                    "noise_floor_dbfs": st.column_config.NumberColumn("Noise Floor (dBFS)", format="%.1f"),
+                    "speech_ratio": st.column_config.ProgressColumn("Speech Ratio", min_value=0.0, max_value=1.0),
+                    "syllables_per_min": st.column_config.NumberColumn("Syllables/min", format="%.0f")
+                }
+            )
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                with span('chart.duration_histogram'):
+                    fig = px.histogram(analytics_df, x='duration', nbins=20, title="Take Duration Distribution")
+                    st.plotly_chart(fig, use_container_width=True)
+            with col2:
+                with span('chart.loudness_bar'):
+                    fig = px.bar(analytics_df, x='name', y='lufs_approx', title="Loudness per Take")
+                    st.plotly_chart(fig, use_container_width=True)
+            
+            st.caption(f"Analyzed {len(rows)} takes in {analysis_seconds * 1000:.0f} ms (cached per recording hash)")
+        else:
+            st.info("No saved audio available for analysis")
 
 # Footer
 st.markdown("---")
@@ -314,3 +617,5 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+govern_session_memory(spill_keys=('audio_store',))
+render_trace_panel()
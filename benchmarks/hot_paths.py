@@ -0,0 +1,127 @@
+"""Offline timings for the bookbuddy hot paths on synthetic inputs.
+
+Exercises the same functions the pages call (silence trimming, take
+analytics, Sheets conversion and diffing, Docs extraction and paragraph
+diffs, CSV parsing and analysis, API rate limiting) without Streamlit or
+network access, so a regression in one stage shows up here before it
+shows up in a page.
+
+    python benchmarks/hot_paths.py
+    python benchmarks/hot_paths.py --scale 4 --runs 9
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from bookbuddy.audio import analyze_wav, encode_wav, trim_silence
+from bookbuddy.csv_tools import analyze_data, parse_csv
+from bookbuddy.docs import diff_paragraphs, iter_blocks, join_blocks, split_paragraphs, split_sections
+from bookbuddy.google_api import TokenBucket
+from bookbuddy.sheets import diff_snapshots, snapshot_hashes, values_to_dataframe
+
+SAMPLE_RATE = 44100
+
+def speech_like_wav(seconds, seed=0):
+    """Mono 16-bit WAV of noise bursts separated by near-silent gaps"""
+    rng = np.random.default_rng(seed)
+    samples = int(seconds * SAMPLE_RATE)
+    envelope = (np.sin(np.arange(samples) / SAMPLE_RATE * 2 * np.pi * 0.7) > -0.3).astype(np.float64)
+    signal = rng.normal(0, 0.2, samples) * envelope + rng.normal(0, 0.001, samples)
+    pcm = (np.clip(signal, -1, 1) * 32767).astype('<i2')
+    return encode_wav(pcm, SAMPLE_RATE, 1, 2)
+
+def sheet_values(rows):
+    """Sheets-style string grid with a header row"""
+    statuses = ['Complete', 'In Progress', 'Not Started', 'Blocked']
+    values = [['Chapter', 'Narrator', 'Status', 'Words', 'Due']]
+    for i in range(rows):
+        values.append([f"C{i}", f"Narrator {i % 17}", statuses[i % 4], str(1000 + i % 5000), f"2026-{i % 12 + 1:02d}-01"])
+    return values
+
+def doc_body(paragraphs):
+    """Docs API body.content with headings every 50 paragraphs and one table"""
+    def paragraph(text, style='NORMAL_TEXT'):
+        return {'paragraph': {'elements': [{'textRun': {'content': text + '\n'}}],
+                              'paragraphStyle': {'namedStyleType': style}}}
+    content = []
+    for i in range(paragraphs):
+        if i % 50 == 0:
+            content.append(paragraph(f"Chapter {i // 50 + 1}", 'HEADING_1'))
+        content.append(paragraph(f"Paragraph {i} of the manuscript with a handful of ordinary words in it."))
+    content.append({'table': {'tableRows': [
+        {'tableCells': [{'content': [paragraph(f"cell {r}.{c}")]} for c in range(4)]} for r in range(20)
+    ]}})
+    return content
+
+def csv_bytes(rows):
+    lines = ['Name,Email,Chapter,Words,Recorded']
+    for i in range(rows):
+        lines.append(f"Name {i},user{i}@example.com,{i % 40},{1000 + i % 5000},2026-01-{i % 28 + 1:02d}")
+    return ('\n'.join(lines) + '\n').encode()
+
+def timed(fn, runs):
+    """Median milliseconds of ``runs`` calls"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiply every input size by this factor")
+    parser.add_argument('--runs', type=int, default=5, help="Calls per case; the median is reported")
+    args = parser.parse_args()
+
+    audio_seconds = int(600 * args.scale)
+    sheet_rows = int(100000 * args.scale)
+    doc_paragraphs = int(5000 * args.scale)
+    csv_rows = int(100000 * args.scale)
+
+    wav = speech_like_wav(audio_seconds)
+    values = sheet_values(sheet_rows)
+    sheet_df = values_to_dataframe(values)
+    edited = values_to_dataframe(values[:1] + [row[:2] + ['Complete'] + row[3:] if i % 100 == 0 else row
+                                               for i, row in enumerate(values[1:])])
+    hashes = snapshot_hashes(sheet_df, 'Chapter')
+    body = doc_body(doc_paragraphs)
+    stats = {'words': 0, 'chars': 0, 'blocks': 0}
+    content, spans = join_blocks(iter_blocks(body, stats))
+    revised = split_paragraphs(content)
+    revised[::97] = [p + ' (revised)' for p in revised[::97]]
+    raw_csv = csv_bytes(csv_rows)
+    csv_df, _ = parse_csv(io.BytesIO(raw_csv))
+
+    cases = [
+        (f"trim_silence ({audio_seconds}s take)", lambda: trim_silence(wav, -40.0, 0.5)),
+        (f"analyze_wav ({audio_seconds}s take)", lambda: analyze_wav(wav)),
+        (f"values_to_dataframe ({sheet_rows:,} rows)", lambda: values_to_dataframe(values)),
+        (f"snapshot_hashes + diff ({sheet_rows:,} rows)",
+         lambda: diff_snapshots('Sheet1', sheet_df, hashes, edited, snapshot_hashes(edited, 'Chapter'))),
+        (f"iter_blocks ({doc_paragraphs:,} paragraphs)",
+         lambda: list(iter_blocks(body, {'words': 0, 'chars': 0, 'blocks': 0}))),
+        (f"split_sections ({len(spans):,} blocks)", lambda: split_sections(content, spans, 1)),
+        (f"diff_paragraphs ({len(revised):,} paragraphs)",
+         lambda: diff_paragraphs(split_paragraphs(content), revised)),
+        (f"parse_csv ({csv_rows:,} rows)", lambda: parse_csv(io.BytesIO(raw_csv))),
+        (f"analyze_data ({csv_rows:,} rows)", lambda: analyze_data(csv_df)),
+        # A batch bigger than the bucket must be taken in pieces, not wait forever
+        ("TokenBucket.acquire (100 calls, capacity 40)", lambda: TokenBucket(2000.0, 40).acquire(100)),
+    ]
+
+    print(f"Median of {args.runs} runs\n")
+    print("| Hot path | Time (ms) |")
+    print("|---|---:|")
+    for label, fn in cases:
+        print(f"| {label} | {timed(fn, args.runs):.1f} |")
+
+if __name__ == '__main__':
+    main()
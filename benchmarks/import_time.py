@@ -0,0 +1,90 @@
+"""Cold-start import profile for each BookBuddy page.
+
+Runs every page's module-level imports in a fresh interpreter with
+``-X importtime`` and reports the median wall time, the time on top of
+``import streamlit`` (which every page pays anyway), and the heaviest
+top-level modules. Lazily imported modules only show up once the code
+path that needs them runs, so they don't count here.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 9 --top 5 pages/3_📁_CSV_Upload_Manager.py
+"""
+import argparse
+import ast
+import glob
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = 'import streamlit'
+
+def module_imports(path):
+    """Source of the module-level import statements of a script"""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    return '\n'.join(
+        ast.unparse(node) for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+def profile(code):
+    """Import ``code`` in a fresh interpreter; returns (wall ms, {top-level module: cumulative ms})"""
+    timed = (
+        "import sys, time\n"
+        f"sys.path.insert(0, {ROOT!r})\n"
+        "start = time.perf_counter()\n"
+        f"exec({code!r})\n"
+        "print((time.perf_counter() - start) * 1000)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', timed],
+        capture_output=True, text=True, cwd=ROOT, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented under their importer; keep the top level only
+        if not name.startswith('  '):
+            modules[name.strip()] = int(cumulative) / 1000
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+def median_profile(code, runs):
+    samples = [profile(code) for _ in range(runs)]
+    wall = statistics.median(ms for ms, _ in samples)
+    modules = {
+        name: statistics.median(sample[1].get(name, 0.0) for sample in samples)
+        for name in samples[0][1]
+    }
+    return wall, modules
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scripts', nargs='*', help="Scripts to profile (default: App.py and every page)")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per script; the median is reported")
+    parser.add_argument('--top', type=int, default=3, help="Heaviest top-level modules to list per script")
+    args = parser.parse_args()
+
+    scripts = args.scripts or [os.path.join(ROOT, 'App.py')] + sorted(glob.glob(os.path.join(ROOT, 'pages', '*.py')))
+    # Modules the interpreter loads before any user code (site, encodings, ...)
+    startup = set(profile('pass')[1])
+    baseline, _ = median_profile(BASELINE, args.runs)
+    print(f"Baseline `{BASELINE}`: {baseline:.0f} ms (median of {args.runs})\n")
+    print("| Script | Imports (ms) | Beyond streamlit (ms) | Heaviest top-level imports |")
+    print("|---|---:|---:|---|")
+    for script in scripts:
+        wall, modules = median_profile(module_imports(script), args.runs)
+        heaviest = sorted(
+            ((ms, name) for name, ms in modules.items() if name != 'streamlit' and name not in startup),
+            reverse=True
+        )[:args.top]
+        print(
+            f"| {os.path.relpath(script, ROOT)} | {wall:.0f} | {max(wall - baseline, 0):.0f} | "
+            + ', '.join(f"{name} {ms:.0f}" for ms, name in heaviest) + " |"
+        )
+
+if __name__ == '__main__':
+    main()
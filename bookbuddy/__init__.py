@@ -0,0 +1,5 @@
+"""BookBuddy core: the logic behind the Streamlit pages, importable without Streamlit.
+
+Everything except ``bookbuddy.ui`` runs without a Streamlit script context, so
+it can be cached, reused across reruns and benchmarked offline.
+"""
@@ -0,0 +1,345 @@
+"""WAV decoding, silence trimming, take analytics, chapter assembly and ffmpeg transcoding."""
+import io
+import os
+import wave
+import struct
+import time
+import shutil
+import subprocess
+from bookbuddy.lazy import lazy_import
+from bookbuddy.tracing import traced
+
+np = lazy_import('numpy')
+
+# Upload/download encodings; each entry maps to ffmpeg output arguments
+AUDIO_FORMATS = {
+    'WAV': {'ext': 'wav', 'mime': 'audio/wav', 'args': None, 'lossy': False},
+    'FLAC': {'ext': 'flac', 'mime': 'audio/flac', 'args': ['-c:a', 'flac', '-f', 'flac'], 'lossy': False},
+    'Opus': {'ext': 'opus', 'mime': 'audio/ogg', 'args': ['-c:a', 'libopus', '-f', 'ogg'], 'lossy': True},
+    'MP3': {'ext': 'mp3', 'mime': 'audio/mpeg', 'args': ['-c:a', 'libmp3lame', '-f', 'mp3'], 'lossy': True}
+}
+
+FFMPEG_PATH = shutil.which('ffmpeg')
+
+@traced('audio.encode')
+def encode_audio(wav_bytes, audio_format, bitrate_kbps):
+    """Transcode WAV bytes through an ffmpeg pipe and return (data, seconds)"""
+    spec = AUDIO_FORMATS[audio_format]
+    if spec['args'] is None:
+        return wav_bytes, 0.0
+    if FFMPEG_PATH is None:
+        raise RuntimeError("ffmpeg is not installed")
+    
+    cmd = [FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0']
+    cmd += spec['args']
+    if spec['lossy']:
+        cmd += ['-b:a', f'{bitrate_kbps}k']
+    cmd.append('pipe:1')
+    
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, input=wav_bytes, capture_output=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode(errors='replace').strip() or "ffmpeg failed")
+    return proc.stdout, time.perf_counter() - start
+
+# Silence detection settings
+SILENCE_FRAME_MS = 20
+SILENCE_PAD_MS = 150
+SILENCE_BLOCK_FRAMES = 4096
+PCM_DTYPES = {2: '<i2', 4: '<i4'}
+
+def decode_wav(wav_bytes):
+    """Decode WAV bytes into an interleaved integer PCM array and its format"""
+    with wave.open(io.BytesIO(wav_bytes), 'rb') as wav:
+        channels = wav.getnchannels()
+        sampwidth = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+    if sampwidth not in PCM_DTYPES:
+        raise ValueError(f"Unsupported sample width: {sampwidth * 8}-bit")
+    pcm = np.frombuffer(raw, dtype=PCM_DTYPES[sampwidth])
+    return pcm, sample_rate, channels, sampwidth
+
+def encode_wav(pcm, sample_rate, channels, sampwidth):
+    """Encode an interleaved integer PCM array as WAV bytes"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sampwidth)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+def frame_energy(pcm, channels, sampwidth, frame_len):
+    """Per-frame mean-square energy (full scale = 1.0), computed block-wise to bound memory"""
+    samples_per_frame = frame_len * channels
+    n_frames = len(pcm) // samples_per_frame
+    full_scale = float(2 ** (8 * sampwidth - 1))
+    frames = pcm[:n_frames * samples_per_frame].reshape(n_frames, samples_per_frame)
+    
+    energy = np.empty(n_frames, dtype=np.float64)
+    for start in range(0, n_frames, SILENCE_BLOCK_FRAMES):
+        block = frames[start:start + SILENCE_BLOCK_FRAMES].astype(np.float32) / full_scale
+        energy[start:start + len(block)] = np.einsum('ij,ij->i', block, block) / samples_per_frame
+    return energy
+
+def to_db(energy):
+    """Convert mean-square energy to dB"""
+    return 10 * np.log10(np.maximum(energy, 1e-12))
+
+def find_voiced_regions(energy_db, threshold_db, min_silence_frames, pad_frames):
+    """Return (start, end) frame ranges above the threshold, merging short gaps"""
+    voiced = energy_db > threshold_db
+    if not voiced.any():
+        return []
+    
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    
+    # Merge regions separated by less than the minimum silence
+    keep = np.concatenate(([True], starts[1:] - ends[:-1] >= min_silence_frames))
+    starts = starts[keep]
+    ends = np.concatenate((ends[np.flatnonzero(keep)[1:] - 1], [ends[-1]]))
+    
+    starts = np.maximum(starts - pad_frames, 0)
+    ends = np.minimum(ends + pad_frames, len(energy_db))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+@traced('audio.trim_silence')
+def trim_silence(wav_bytes, threshold_db, min_silence_s, split=False):
+    """Trim leading/trailing silence and optionally split on long pauses"""
+    start_time = time.perf_counter()
+    pcm, sample_rate, channels, sampwidth = decode_wav(wav_bytes)
+    frame_len = max(1, int(sample_rate * SILENCE_FRAME_MS / 1000))
+    original_duration = len(pcm) / channels / sample_rate
+    
+    energy_db = to_db(frame_energy(pcm, channels, sampwidth, frame_len))
+    regions = find_voiced_regions(
+        energy_db,
+        threshold_db,
+        min_silence_frames=max(1, int(min_silence_s * 1000 / SILENCE_FRAME_MS)),
+        pad_frames=int(SILENCE_PAD_MS / SILENCE_FRAME_MS)
+    )
+    if not regions:
+        regions = [(0, len(energy_db))]
+    
+    step = frame_len * channels
+    first, last = regions[0][0], regions[-1][1]
+    trimmed = encode_wav(pcm[first * step:last * step], sample_rate, channels, sampwidth)
+    if split and len(regions) > 1:
+        segments = [
+            encode_wav(pcm[start * step:end * step], sample_rate, channels, sampwidth)
+            for start, end in regions
+        ]
+    else:
+        segments = [trimmed]
+    return {
+        'trimmed': trimmed,
+        'segments': segments,
+        'original_duration': original_duration,
+        'trimmed_duration': (last - first) * frame_len / sample_rate,
+        'bytes_saved': len(wav_bytes) - len(trimmed),
+        'seconds': time.perf_counter() - start_time
+    }
+
+# Analytics settings
+ANALYTICS_FRAME_MS = 10
+LOUDNESS_BLOCK_FRAMES = 40   # 400 ms gating blocks
+LOUDNESS_STEP_FRAMES = 10    # 75% overlap
+SYLLABLE_MIN_GAP_FRAMES = 12  # peaks closer than 120 ms count once
+SYLLABLE_PROMINENCE_DB = 6.0  # a nucleus must rise this far above the dips around it
+NOISE_GATE_DBFS = -45.0       # only frames below this (and well below speech) measure the noise floor
+NOISE_GATE_BELOW_SPEECH_DB = 20.0
+
+def gated_loudness(energy, channels):
+    """BS.1770-style gated loudness over frame energies (no K-weighting, so an approximation)"""
+    if len(energy) < LOUDNESS_BLOCK_FRAMES:
+        blocks = np.array([energy.mean()]) if len(energy) else np.array([0.0])
+    else:
+        cumulative = np.concatenate(([0.0], np.cumsum(energy)))
+        starts = np.arange(0, len(energy) - LOUDNESS_BLOCK_FRAMES + 1, LOUDNESS_STEP_FRAMES)
+        blocks = (cumulative[starts + LOUDNESS_BLOCK_FRAMES] - cumulative[starts]) / LOUDNESS_BLOCK_FRAMES
+    blocks = blocks * channels
+    block_lufs = -0.691 + to_db(blocks)
+    
+    gated = blocks[block_lufs > -70]
+    if len(gated) == 0:
+        return -70.0
+    relative_gate = -0.691 + to_db(gated.mean()) - 10
+    gated = blocks[(block_lufs > -70) & (block_lufs > relative_gate)]
+    return float(-0.691 + to_db(gated.mean())) if len(gated) else -70.0
+
+def count_syllable_peaks(energy_db, threshold_db):
+    """Count prominent energy maxima above ``threshold_db`` as syllable nuclei, at most one per gap"""
+    if len(energy_db) < 3:
+        return 0
+    smoothed = np.convolve(energy_db, np.ones(5) / 5, mode='same')
+    gap = SYLLABLE_MIN_GAP_FRAMES
+    n = len(smoothed)
+    windows = np.lib.stride_tricks.sliding_window_view
+    # For every frame, the extremes of the ``gap`` frames before and after it
+    highest = windows(np.pad(smoothed, gap, constant_values=-np.inf), gap).max(axis=1)
+    lowest = windows(np.pad(smoothed, gap, constant_values=np.inf), gap).min(axis=1)
+    # Strictly above the frames before, so a flat stretch (a held tone) never repeats a peak
+    peaks = (smoothed > highest[:n]) & (smoothed >= highest[gap + 1:])
+    prominence = smoothed - np.maximum(lowest[:n], lowest[gap + 1:])
+    peaks &= (prominence >= SYLLABLE_PROMINENCE_DB) & (smoothed > threshold_db)
+    return int(np.count_nonzero(peaks))
+
+@traced('audio.analyze')
+def analyze_wav(wav_bytes):
+    """Compute loudness, peak, clipping, noise floor and speaking-rate stats for one take"""
+    pcm, sample_rate, channels, sampwidth = decode_wav(wav_bytes)
+    full_scale = 2 ** (8 * sampwidth - 1)
+    duration = len(pcm) / channels / sample_rate
+    frame_len = max(1, int(sample_rate * ANALYTICS_FRAME_MS / 1000))
+    
+    energy = frame_energy(pcm, channels, sampwidth, frame_len)
+    energy_db = to_db(energy)
+    peak = max(int(pcm.max(initial=0)), -int(pcm.min(initial=0)))
+    # The noise floor is only measured in pauses; a take without any has none (None)
+    gate = NOISE_GATE_DBFS
+    if len(energy_db):
+        gate = min(gate, float(np.percentile(energy_db, 95)) - NOISE_GATE_BELOW_SPEECH_DB)
+    quiet = energy_db[energy_db < gate]
+    noise_floor = float(np.median(quiet)) if len(quiet) else None
+    speech_threshold = noise_floor + 12 if noise_floor is not None else gate
+    voiced_seconds = np.count_nonzero(energy_db > speech_threshold) * ANALYTICS_FRAME_MS / 1000
+    syllables = count_syllable_peaks(energy_db, speech_threshold)
+    
+    return {
+        'duration': duration,
+        'rms_dbfs': float(to_db(energy.mean())) if len(energy) else -120.0,
+        'lufs_approx': gated_loudness(energy, channels),
+        'peak_dbfs': float(20 * np.log10(max(peak, 1) / full_scale)),
+        'clipped_samples': int(np.count_nonzero((pcm >= full_scale - 1) | (pcm <= -full_scale))),
+        'noise_floor_dbfs': noise_floor,
+        'speech_ratio': voiced_seconds / duration if duration else 0.0,
+        'syllables_per_min': syllables / voiced_seconds * 60 if voiced_seconds else 0.0
+    }
+
+# Chapter assembly settings
+ASSEMBLY_CHUNK_FRAMES = 65536
+
+def resolve_assembly_order(recordings):
+    """Order takes for assembly, substituting each original with its latest retake"""
+    replacements = {}
+    for rec in recordings:
+        if rec.get('recording_type') == 'retake' and rec.get('replaces'):
+            replacements[rec['replaces']] = rec
+    
+    ordered = []
+    for rec in recordings:
+        if rec.get('recording_type') == 'retake' and rec.get('replaces'):
+            continue
+        seen = {rec['hash']}
+        while rec['hash'] in replacements and replacements[rec['hash']]['hash'] not in seen:
+            rec = replacements[rec['hash']]
+            seen.add(rec['hash'])
+        ordered.append(rec)
+    return ordered
+
+def crossfade(tail, head, channels):
+    """Linearly crossfade two interleaved PCM blocks of equal length"""
+    frames = len(head) // channels
+    fade_out = np.linspace(1.0, 0.0, frames, dtype=np.float32)[:, None]
+    mixed = (tail.reshape(frames, channels) * fade_out
+             + head.reshape(frames, channels) * (1.0 - fade_out))
+    info = np.iinfo(head.dtype)
+    return np.clip(np.rint(mixed), info.min, info.max).astype(head.dtype).ravel()
+
+def write_cue_markers(path, markers):
+    """Append RIFF cue points and labels to a finished WAV file and patch its size"""
+    cue = struct.pack('<I', len(markers))
+    labels = b''
+    for cue_id, (frame, label) in enumerate(markers, start=1):
+        cue += struct.pack('<II4sIII', cue_id, frame, b'data', 0, 0, frame)
+        text = label.encode('utf-8') + b'\0'
+        chunk = struct.pack('<I', cue_id) + text
+        labels += b'labl' + struct.pack('<I', len(chunk)) + chunk + (b'\0' if len(chunk) % 2 else b'')
+    adtl = b'adtl' + labels
+    
+    with open(path, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        f.write(b'cue ' + struct.pack('<I', len(cue)) + cue)
+        f.write(b'LIST' + struct.pack('<I', len(adtl)) + adtl)
+        riff_size = f.tell() - 8
+        f.seek(4)
+        f.write(struct.pack('<I', riff_size))
+
+@traced('audio.assemble')
+def assemble_takes(takes, output_path, crossfade_ms=50):
+    """Stream takes into one WAV with crossfades and a cue marker per take.
+
+    ``takes`` is a list of (label, wav_bytes) where wav_bytes may also be a
+    zero-argument callable returning them; callables are called one take at
+    a time, so spilled takes are loaded only while they are written. Only
+    one chunk plus one crossfade window is held in memory at a time,
+    independent of total book length.
+    """
+    start_time = time.perf_counter()
+    params = None
+    carry = None
+    frames_written = 0
+    markers = []
+    
+    with wave.open(output_path, 'wb') as out:
+        for index, (label, wav_bytes) in enumerate(takes):
+            if callable(wav_bytes):
+                wav_bytes = wav_bytes()
+            with wave.open(io.BytesIO(wav_bytes), 'rb') as reader:
+                take_params = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+                if take_params[1] not in PCM_DTYPES:
+                    raise ValueError(f"{label}: unsupported sample width {take_params[1] * 8}-bit")
+                if params is None:
+                    params = take_params
+                    out.setnchannels(params[0])
+                    out.setsampwidth(params[1])
+                    out.setframerate(params[2])
+                elif take_params != params:
+                    raise ValueError(
+                        f"{label}: format {take_params} does not match {params} "
+                        "(channels, sample width, sample rate)"
+                    )
+                channels, sampwidth, rate = params
+                dtype = PCM_DTYPES[sampwidth]
+                remaining = reader.getnframes()
+                fade_frames = min(int(rate * crossfade_ms / 1000), remaining // 2)
+                
+                # Overlap the head of this take with the held-back tail of the previous one
+                if carry is not None and len(carry):
+                    head_frames = min(fade_frames, len(carry) // channels)
+                    head = np.frombuffer(reader.readframes(head_frames), dtype=dtype)
+                    remaining -= head_frames
+                    split = len(carry) - len(head)
+                    out.writeframes(carry[:split].tobytes())
+                    frames_written += split // channels
+                    markers.append((frames_written, label))
+                    out.writeframes(crossfade(carry[split:], head, channels).tobytes())
+                    frames_written += head_frames
+                else:
+                    markers.append((frames_written, label))
+                
+                # Hold back the tail for the next crossfade unless this is the last take
+                hold = fade_frames if index < len(takes) - 1 else 0
+                while remaining > hold:
+                    count = min(ASSEMBLY_CHUNK_FRAMES, remaining - hold)
+                    out.writeframes(reader.readframes(count))
+                    frames_written += count
+                    remaining -= count
+                carry = np.frombuffer(reader.readframes(hold), dtype=dtype) if hold else None
+    
+    if markers:
+        write_cue_markers(output_path, markers)
+    
+    elapsed = time.perf_counter() - start_time
+    duration = frames_written / params[2] if params else 0.0
+    return {
+        'duration': duration,
+        'seconds': elapsed,
+        'realtime_factor': duration / elapsed if elapsed else float('inf'),
+        'chapters': [
+            {'label': label, 'start': frame / params[2]} for frame, label in markers
+        ]
+    }
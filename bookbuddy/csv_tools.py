@@ -0,0 +1,105 @@
+"""CSV parsing, type conversion and column analysis for uploaded data."""
+import warnings
+from bookbuddy.lazy import lazy_import
+from bookbuddy.tracing import count, traced
+
+pd = lazy_import('pandas')
+
+@traced('csv.analyze')
+def analyze_data(df):
+    """Perform comprehensive data analysis"""
+    analysis = {
+        'basic_info': {
+            'rows': len(df),
+            'columns': len(df.columns),
+            'memory_usage': df.memory_usage(deep=True).sum(),
+            'missing_values': df.isnull().sum().sum(),
+            'duplicate_rows': df.duplicated().sum()
+        },
+        'column_info': {},
+        'data_quality': {}
+    }
+    
+    # Analyze each column
+    for col in df.columns:
+        col_data = df[col]
+        analysis['column_info'][col] = {
+            'dtype': str(col_data.dtype),
+            'non_null_count': col_data.count(),
+            'null_count': col_data.isnull().sum(),
+            'unique_count': col_data.nunique(),
+            'memory_usage': col_data.memory_usage(deep=True)
+        }
+        
+        # Additional stats for numeric columns
+        if pd.api.types.is_numeric_dtype(col_data):
+            analysis['column_info'][col].update({
+                'mean': col_data.mean(),
+                'median': col_data.median(),
+                'std': col_data.std(),
+                'min': col_data.min(),
+                'max': col_data.max(),
+                'q25': col_data.quantile(0.25),
+                'q75': col_data.quantile(0.75)
+            })
+        
+        # Additional stats for text columns
+        elif is_text_column(col_data):
+            analysis['column_info'][col].update({
+                'avg_length': col_data.astype(str).str.len().mean(),
+                'max_length': col_data.astype(str).str.len().max(),
+                'most_common': col_data.mode().iloc[0] if len(col_data.mode()) > 0 else None
+            })
+    
+    return analysis
+
+def is_text_column(series):
+    """Object or string dtype; pandas 3 reads text as ``str`` rather than ``object``"""
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+def convert_column(series):
+    """Convert a text column to numbers or datetimes when every value parses; else return it unchanged"""
+    try:
+        return pd.to_numeric(series)
+    except (ValueError, TypeError):
+        pass
+    try:
+        with warnings.catch_warnings():
+            # Columns that are not dates warn about format inference before failing
+            warnings.simplefilter('ignore', UserWarning)
+            return pd.to_datetime(series)
+    except (ValueError, TypeError, OverflowError):
+        return series
+
+@traced('csv.parse')
+def parse_csv(source, encoding='utf-8', delimiter=',', has_header=True, skip_rows=0,
+              remove_empty_rows=True, remove_empty_cols=False, convert_types=True):
+    """Read and clean a CSV from a path or file-like object; returns (df, error message)"""
+    try:
+        # Read CSV with specified options
+        df = pd.read_csv(
+            source,
+            encoding=encoding,
+            delimiter=delimiter,
+            header=0 if has_header else None,
+            skiprows=skip_rows
+        )
+        count('csv.rows', len(df))
+        
+        # Data cleaning
+        if remove_empty_rows:
+            df = df.dropna(how='all')
+        
+        if remove_empty_cols:
+            df = df.dropna(axis=1, how='all')
+        
+        # Auto-convert data types
+        if convert_types:
+            for col in df.columns:
+                if is_text_column(df[col]):
+                    df[col] = convert_column(df[col])
+        
+        return df, None
+        
+    except Exception as e:
+        return None, str(e)
@@ -0,0 +1,411 @@
+"""Google Docs fetching, block extraction, sectioning, paragraph diffs and the shared document cache."""
+import os
+import json
+import difflib
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bookbuddy.google_api import execute_measured
+from bookbuddy.token_store import write_private
+from bookbuddy.tracing import annotate, bind, traced
+
+# Only the parts of a document the viewer actually reads
+PARAGRAPH_FIELDS = 'paragraph(elements/textRun/content,paragraphStyle/namedStyleType,bullet/nestingLevel)'
+DOC_FIELDS = (
+    'title,documentId,revisionId,'
+    f'body.content({PARAGRAPH_FIELDS},table/tableRows/tableCells/content,tableOfContents/content)'
+)
+
+# Shared document cache configuration
+DOC_CACHE_TTL_SECONDS = int(os.environ.get('BOOKBUDDY_DOC_CACHE_TTL', 3600))
+DOC_CACHE_MAX_BYTES = int(os.environ.get('BOOKBUDDY_DOC_CACHE_MAX_MB', 256)) * 1024 * 1024
+DOC_CACHE_DIR = os.environ.get('BOOKBUDDY_DOC_CACHE_DIR')
+
+# Drive accepts at most 100 calls per batch request
+DRIVE_BATCH_SIZE = 100
+
+# Sections longer than this are paged further so each rerun stays small
+MAX_SECTION_BLOCKS = 150
+
+class DocumentCache:
+    """Process-wide LRU of parsed documents keyed by (doc_id, revision).
+
+    Entries expire after ``ttl_seconds`` and the least recently used ones are
+    evicted once ``max_bytes`` is exceeded. With ``disk_dir`` set, entries are
+    also written as owner-only JSON files so they survive restarts; expired
+    files are deleted and the directory is pruned oldest-first to ``max_bytes``.
+    """
+    
+    def __init__(self, max_bytes, ttl_seconds, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Disk entries oldest-first: path -> (written_at, size)
+        self._disk_files = OrderedDict()
+        self._disk_size = 0
+        if disk_dir:
+            os.makedirs(disk_dir, mode=0o700, exist_ok=True)
+            self._adopt_disk_files()
+    
+    def _disk_path(self, key):
+        digest = hashlib.sha256(f"{key[0]}:{key[1]}".encode()).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.json")
+    
+    def _adopt_disk_files(self):
+        """Index files left by earlier processes, deleting expired and half-written ones"""
+        cutoff = time.time() - self.ttl_seconds
+        found = []
+        for entry in os.scandir(self.disk_dir):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if stat.st_mtime < cutoff or not entry.name.endswith('.json'):
+                self._remove_file(entry.path)
+            else:
+                found.append((stat.st_mtime, entry.path, stat.st_size))
+        with self._lock:
+            for written_at, path, size in sorted(found):
+                self._disk_files[path] = (written_at, size)
+                self._disk_size += size
+        self._prune_disk()
+    
+    def _prune_disk(self):
+        """Delete expired files, then the oldest until the directory fits max_bytes, always keeping the newest"""
+        cutoff = time.time() - self.ttl_seconds
+        pruned = []
+        with self._lock:
+            while self._disk_files:
+                path, (written_at, size) = next(iter(self._disk_files.items()))
+                over_budget = self._disk_size > self.max_bytes and len(self._disk_files) > 1
+                if written_at >= cutoff and not over_budget:
+                    break
+                del self._disk_files[path]
+                self._disk_size -= size
+                pruned.append(path)
+        for path in pruned:
+            self._remove_file(path)
+    
+    def _forget_disk_file(self, path):
+        entry = self._disk_files.pop(path, None)
+        if entry:
+            self._disk_size -= entry[1]
+    
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    
+    def _insert(self, key, stored_at, content, metadata):
+        size = len(content.encode('utf-8')) + len(json.dumps(metadata))
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[1]
+        self._entries[key] = (stored_at, size, content, metadata)
+        self._size += size
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_size, _, _) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+    
+    def get(self, doc_id, revision):
+        """Return (content, metadata) for a revision, or None on a miss"""
+        key = (doc_id, revision)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2], dict(entry[3])
+            if entry:
+                self._size -= self._entries.pop(key)[1]
+            
+            if self.disk_dir:
+                path = self._disk_path(key)
+                if os.path.exists(path):
+                    if now - os.path.getmtime(path) > self.ttl_seconds:
+                        self._forget_disk_file(path)
+                        self._remove_file(path)
+                    else:
+                        try:
+                            with open(path) as f:
+                                stored = json.load(f)
+                            self._insert(key, os.path.getmtime(path), stored['content'], stored['metadata'])
+                            self.hits += 1
+                            return stored['content'], dict(stored['metadata'])
+                        except (OSError, ValueError, KeyError):
+                            pass
+            self.misses += 1
+            return None
+    
+    def put(self, doc_id, revision, content, metadata):
+        """Store a parsed document revision"""
+        key = (doc_id, revision)
+        with self._lock:
+            self._insert(key, time.time(), content, dict(metadata))
+        if self.disk_dir:
+            path = self._disk_path(key)
+            data = json.dumps({'content': content, 'metadata': metadata}).encode()
+            try:
+                write_private(path, data)
+            except OSError:
+                return
+            with self._lock:
+                self._forget_disk_file(path)
+                self._disk_files[path] = (time.time(), len(data))
+                self._disk_size += len(data)
+            self._prune_disk()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+def iter_blocks(elements, stats, container=None):
+    """Walk Docs structural elements recursively, yielding typed text blocks.
+
+    Tables and tables of contents are descended into. Word and character
+    counts accumulate in ``stats`` as blocks are produced, so a single pass
+    yields both the blocks and the document statistics.
+    """
+    for element in elements:
+        if 'paragraph' in element:
+            paragraph = element['paragraph']
+            text = ''.join(
+                run['textRun'].get('content', '')
+                for run in paragraph.get('elements', [])
+                if 'textRun' in run
+            ).rstrip('\n')
+            style = paragraph.get('paragraphStyle', {}).get('namedStyleType', 'NORMAL_TEXT')
+            
+            if container:
+                block = {'type': container, 'level': 0}
+            elif style == 'TITLE':
+                block = {'type': 'heading', 'level': 0}
+            elif style.startswith('HEADING_'):
+                block = {'type': 'heading', 'level': int(style.rsplit('_', 1)[1])}
+            elif 'bullet' in paragraph:
+                block = {'type': 'list_item', 'level': paragraph['bullet'].get('nestingLevel', 0)}
+            else:
+                block = {'type': 'paragraph', 'level': 0}
+            block['text'] = text
+            
+            stats['words'] += len(text.split())
+            stats['chars'] += len(text)
+            stats['blocks'] += 1
+            yield block
+        
+        elif 'table' in element:
+            for row in element['table'].get('tableRows', []):
+                for cell in row.get('tableCells', []):
+                    yield from iter_blocks(cell.get('content', []), stats, container or 'table_cell')
+        
+        elif 'tableOfContents' in element:
+            yield from iter_blocks(element['tableOfContents'].get('content', []), stats, 'toc_entry')
+
+def join_blocks(blocks):
+    """Join extracted blocks into the document text; returns (content, spans).
+
+    Each span is (type, level, start, end): the block's kind plus character
+    offsets into ``content``, so the text isn't stored a second time.
+    """
+    texts = []
+    spans = []
+    offset = 0
+    for block in blocks:
+        end = offset + len(block['text'])
+        spans.append((block['type'], block['level'], offset, end))
+        texts.append(block['text'])
+        offset = end + 1
+    return ''.join(text + '\n' for text in texts), spans
+
+def section_blocks(content, spans, start, end):
+    """Blocks ``start:end`` as dicts with their text sliced from ``content``"""
+    return [
+        {'type': kind, 'level': level, 'text': content[first:last]}
+        for kind, level, first, last in spans[start:end]
+    ]
+
+def block_to_markdown(block):
+    """Render one extracted block as a markdown line"""
+    if block['type'] == 'heading' and block['text'].strip():
+        return f"{'#' * min(block['level'] + 1, 6)} {block['text']}"
+    if block['type'] == 'list_item':
+        return f"{'  ' * block['level']}- {block['text']}"
+    if block['type'] == 'toc_entry':
+        return f"- *{block['text']}*"
+    return block['text']
+
+def split_sections(content, spans, section_level):
+    """Group block spans into (title, start, end) sections at headings up to ``section_level``"""
+    if not spans:
+        return []
+    
+    def heading_title(span):
+        kind, level, first, last = span
+        return content[first:last].strip() if kind == 'heading' and level <= section_level else ''
+    
+    breaks = [i for i, span in enumerate(spans) if i > 0 and heading_title(span)]
+    sections = []
+    for start, end in zip([0] + breaks, breaks + [len(spans)]):
+        kind, _, first, last = spans[start]
+        title = content[first:last].strip() if kind == 'heading' else ''
+        title = title or "Beginning"
+        parts = range(start, end, MAX_SECTION_BLOCKS)
+        for part, part_start in enumerate(parts, start=1):
+            label = title if len(parts) == 1 else f"{title} ({part}/{len(parts)})"
+            sections.append((label, part_start, min(part_start + MAX_SECTION_BLOCKS, end)))
+    return sections
+
+@traced('docs.fetch_document')
+def fetch_document(service, quota, doc_id):
+    """Fetch and extract one document; safe to call from worker threads.
+
+    Returns (content, metadata, measured) where ``measured`` holds the
+    response size and timing recorded by ``execute_measured``.
+    """
+    # Retrieve only the fields the viewer uses
+    document, measured = execute_measured(
+        service.documents().get(documentId=doc_id, fields=DOC_FIELDS),
+        quota,
+        coalesce_key=('documents.get', doc_id, DOC_FIELDS)
+    )
+    
+    # Extract typed blocks and text statistics in one pass
+    text_stats = {'words': 0, 'chars': 0, 'blocks': 0}
+    content, spans = join_blocks(iter_blocks(document.get('body', {}).get('content', []), text_stats))
+    annotate(doc_id=doc_id, response_bytes=measured['response_bytes'], blocks=text_stats['blocks'])
+    
+    # Document metadata
+    metadata = {
+        'title': document.get('title', 'Untitled'),
+        'document_id': document.get('documentId'),
+        'revision_id': document.get('revisionId'),
+        'created_time': document.get('createdTime'),
+        'modified_time': document.get('modifiedTime'),
+        'word_count': text_stats['words'],
+        'char_count': text_stats['chars'],
+        'block_spans': spans
+    }
+    
+    return content, metadata, measured
+
+@traced('drive.batch_metadata')
+def batch_drive_metadata(drive_service, quota, doc_ids):
+    """Fetch Drive metadata for many files with batched requests.
+
+    Returns {doc_id: file metadata or exception} and the wall time in seconds.
+    """
+    results = {}
+    
+    def on_response(request_id, response, exception):
+        results[request_id] = exception if exception is not None else response
+    
+    start = time.perf_counter()
+    for offset in range(0, len(doc_ids), DRIVE_BATCH_SIZE):
+        chunk = doc_ids[offset:offset + DRIVE_BATCH_SIZE]
+        batch = drive_service.new_batch_http_request(callback=on_response)
+        for doc_id in chunk:
+            batch.add(
+                drive_service.files().get(fileId=doc_id, fields='id,name,modifiedTime,version'),
+                request_id=doc_id
+            )
+        quota.execute_batch(batch, len(chunk))
+    return results, time.perf_counter() - start
+
+@traced('docs.check_watch_list')
+def check_watch_list(drive_service, docs_service, drive_quota, docs_quota, doc_cache, doc_ids, max_workers):
+    """Check every watched doc in one batch and fetch changed ones in parallel.
+
+    Returns (summary rows in ``doc_ids`` order, stats).
+    """
+    drive_info, batch_seconds = batch_drive_metadata(drive_service, drive_quota, doc_ids)
+    rows = {}
+    to_fetch = []
+    for doc_id in doc_ids:
+        info = drive_info.get(doc_id)
+        if isinstance(info, Exception) or info is None:
+            rows[doc_id] = {'Doc ID': doc_id, 'Title': None, 'Revision': None, 'Modified': None,
+                            'Words': None, 'Latency (ms)': None, 'Source': f"error: {info}"}
+            continue
+        rows[doc_id] = {'Doc ID': doc_id, 'Title': info.get('name'), 'Revision': info.get('version'),
+                        'Modified': info.get('modifiedTime'), 'Words': None,
+                        'Latency (ms)': None, 'Source': 'cache'}
+        cached = doc_cache.get(doc_id, info.get('version'))
+        if cached is not None:
+            rows[doc_id]['Words'] = cached[1].get('word_count')
+        else:
+            to_fetch.append(doc_id)
+    
+    start = time.perf_counter()
+    if to_fetch:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(bind(fetch_document), docs_service, docs_quota, doc_id): doc_id for doc_id in to_fetch}
+            for future in as_completed(futures):
+                doc_id = futures[future]
+                row = rows[doc_id]
+                try:
+                    content, metadata, measured = future.result()
+                except Exception as e:
+                    row['Source'] = f"error: {e}"
+                    continue
+                metadata['drive_version'] = row['Revision']
+                metadata['modified_time'] = row['Modified']
+                doc_cache.put(doc_id, row['Revision'], content, metadata)
+                row.update({'Title': metadata['title'], 'Words': metadata['word_count'],
+                            'Latency (ms)': measured['request_ms'], 'Source': 'fetched'})
+    
+    return [rows[doc_id] for doc_id in doc_ids], {
+        'docs': len(doc_ids),
+        'fetched': len(to_fetch),
+        'batch_ms': batch_seconds * 1000,
+        'fetch_ms': (time.perf_counter() - start) * 1000
+    }
+
+def split_paragraphs(content):
+    """Split extracted text back into the document's paragraphs"""
+    paragraphs = content.split('\n')
+    if paragraphs and paragraphs[-1] == '':
+        paragraphs.pop()
+    return paragraphs
+
+def paragraph_hash(paragraph):
+    return hashlib.blake2b(paragraph.encode('utf-8'), digest_size=8).digest()
+
+@traced('docs.diff_paragraphs')
+def diff_paragraphs(old_paragraphs, new_paragraphs):
+    """Diff two paragraph lists by hash; returns inserted/removed/modified change records"""
+    matcher = difflib.SequenceMatcher(
+        None,
+        [paragraph_hash(p) for p in old_paragraphs],
+        [paragraph_hash(p) for p in new_paragraphs],
+        autojunk=False
+    )
+    changes = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        # Pair up replaced paragraphs as modifications; any surplus is a pure insert/remove
+        paired = min(i2 - i1, j2 - j1) if tag == 'replace' else 0
+        for k in range(paired):
+            changes.append({'type': 'modified', 'index': j1 + k,
+                            'old': old_paragraphs[i1 + k], 'new': new_paragraphs[j1 + k]})
+        for k in range(i1 + paired, i2):
+            changes.append({'type': 'removed', 'index': j1 + paired, 'old': old_paragraphs[k], 'new': None})
+        for k in range(j1 + paired, j2):
+            changes.append({'type': 'inserted', 'index': k, 'old': None, 'new': new_paragraphs[k]})
+    return changes
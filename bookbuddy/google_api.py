@@ -0,0 +1,235 @@
+"""Google API client factory with pooled transports, rate limiting, retries and request coalescing."""
+import hashlib
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from bookbuddy.lazy import lazy_import
+from bookbuddy.tracing import annotate, count, span, traced
+
+httplib2 = lazy_import('httplib2')
+google_auth_httplib2 = lazy_import('google_auth_httplib2')
+discovery = lazy_import('googleapiclient.discovery')
+errors = lazy_import('googleapiclient.errors')
+googleapiclient_http = lazy_import('googleapiclient.http')
+
+# Google API configuration
+API_VERSIONS = {'docs': 'v1', 'drive': 'v3', 'sheets': 'v4'}
+
+# Client-side rate limits per API and credential: (requests per second, burst)
+API_RATE_LIMITS = {'docs': (5.0, 10), 'drive': (20.0, 40), 'sheets': (1.0, 10)}
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 32.0
+
+def credentials_key(credentials):
+    """Stable, non-secret identity for a stored credential set"""
+    identity = f"{credentials.client_id}:{credentials.refresh_token or credentials.token}"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+@traced('google.build_service')
+def build_service(api, credentials):
+    """Build a Google API service for ``credentials``.
+
+    Uses the bundled static discovery document and gives each thread its own
+    authorized httplib2 connection, since httplib2.Http is not thread-safe.
+    Pass the token store's live credentials so background refreshes reach
+    the service. Returns {'service', 'build_seconds'}.
+    """
+    creds = credentials
+    thread_local = threading.local()
+    
+    def authorized_http():
+        http = getattr(thread_local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=30))
+            thread_local.http = http
+        return http
+    
+    def request_builder(_http, *args, **kwargs):
+        return googleapiclient_http.HttpRequest(authorized_http(), *args, **kwargs)
+    
+    start = time.perf_counter()
+    service = discovery.build(
+        api,
+        API_VERSIONS[api],
+        http=authorized_http(),
+        requestBuilder=request_builder,
+        static_discovery=True,
+        cache_discovery=False
+    )
+    return {'service': service, 'build_seconds': time.perf_counter() - start}
+
+class TokenBucket:
+    """Blocking token bucket refilled at ``rate`` tokens per second up to ``capacity``"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens=1):
+        """Take ``tokens``, sleeping until they are available; returns seconds waited.
+
+        The bucket never holds more than ``capacity``, so larger requests (a
+        100-call Drive batch against a 40-token bucket) are taken in pieces.
+        """
+        waited = 0.0
+        while tokens > self.capacity:
+            waited += self._take(self.capacity)
+            tokens -= self.capacity
+        return waited + self._take(tokens)
+    
+    def _take(self, tokens):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+def is_retryable(error):
+    """Whether an API error is worth retrying after a backoff"""
+    if isinstance(error, errors.HttpError):
+        status = error.resp.status
+        if status in RETRYABLE_STATUS:
+            return True
+        return status == 403 and any(reason in str(error.content) for reason in RATE_LIMIT_REASONS)
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+class QuotaGuard:
+    """Shared rate limiting, retry and request coalescing for Google API calls.
+
+    One token bucket exists per (api, credential). Retryable failures back off
+    exponentially with full jitter, honouring Retry-After when present.
+    Identical requests in flight at the same time share a single API call.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._inflight = {}
+        self.counters = defaultdict(lambda: defaultdict(float))
+    
+    def _bucket(self, key):
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(*API_RATE_LIMITS.get(key[0], (5.0, 10)))
+            return self._buckets[key]
+    
+    def _count(self, key, name, amount=1):
+        with self._lock:
+            self.counters[key][name] += amount
+    
+    def _execute_with_retry(self, key, execute, cost):
+        with span(f"{key[0]}.request", calls=cost):
+            return self._attempt(key, execute, cost)
+    
+    def _attempt(self, key, execute, cost):
+        for attempt in range(MAX_RETRIES + 1):
+            waited = self._bucket(key).acquire(cost)
+            self._count(key, 'calls', cost)
+            count(f"{key[0]}.calls", cost)
+            if waited:
+                self._count(key, 'throttled')
+                self._count(key, 'wait_seconds', waited)
+                annotate(throttle_wait_ms=waited * 1000)
+            try:
+                return execute()
+            except Exception as e:
+                if attempt == MAX_RETRIES or not is_retryable(e):
+                    self._count(key, 'errors')
+                    raise
+                self._count(key, 'retries')
+                count(f"{key[0]}.retries")
+                annotate(retries=attempt + 1)
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+                resp = getattr(e, 'resp', None)
+                retry_after = resp.get('retry-after') if resp is not None else None
+                if retry_after and str(retry_after).isdigit():
+                    delay = max(delay, float(retry_after))
+                time.sleep(delay)
+    
+    def execute(self, api, cred_key, request, coalesce_key=None):
+        """Execute ``request`` under the (api, credential) quota"""
+        key = (api, cred_key)
+        if coalesce_key is None:
+            return self._execute_with_retry(key, request.execute, 1)
+        
+        inflight_key = (key, coalesce_key)
+        with self._lock:
+            future = self._inflight.get(inflight_key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[inflight_key] = future
+        if not owner:
+            self._count(key, 'coalesced')
+            count(f"{api}.coalesced")
+            with span(f"{api}.coalesced_wait"):
+                return future.result()
+        
+        try:
+            result = self._execute_with_retry(key, request.execute, 1)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(inflight_key, None)
+    
+    def execute_batch(self, api, cred_key, batch, calls):
+        """Execute a batch request; every call inside it counts against the quota"""
+        return self._execute_with_retry((api, cred_key), batch.execute, calls)
+    
+    def usage(self, cred_key):
+        """Counters for one credential, keyed by API"""
+        with self._lock:
+            return {api: dict(counters) for (api, key), counters in self.counters.items() if key == cred_key}
+
+class ApiQuota:
+    """A QuotaGuard bound to one API and credential, safe to pass to worker threads"""
+    
+    def __init__(self, guard, api, cred_key):
+        self.guard = guard
+        self.api = api
+        self.cred_key = cred_key
+    
+    def execute(self, request, coalesce_key=None):
+        return self.guard.execute(self.api, self.cred_key, request, coalesce_key)
+    
+    def execute_batch(self, batch, calls):
+        return self.guard.execute_batch(self.api, self.cred_key, batch, calls)
+
+def execute_measured(request, quota, coalesce_key=None):
+    """Execute an API request under ``quota``, recording response size, parse time and total time"""
+    # A coalesced caller shares another request's response and never parses it
+    measured = {'response_bytes': 0, 'parse_ms': 0.0}
+    postproc = request.postproc
+    
+    def measuring_postproc(resp, content):
+        measured['response_bytes'] = len(content)
+        start = time.perf_counter()
+        result = postproc(resp, content)
+        measured['parse_ms'] = (time.perf_counter() - start) * 1000
+        return result
+    
+    request.postproc = measuring_postproc
+    start = time.perf_counter()
+    result = quota.execute(request, coalesce_key)
+    measured['request_ms'] = (time.perf_counter() - start) * 1000
+    count(f"{quota.api}.response_bytes", measured['response_bytes'])
+    return result, measured
@@ -0,0 +1,30 @@
+"""Deferred imports for heavy modules."""
+import importlib
+
+class LazyModule:
+    """Module stand-in that imports the real module on first attribute access.
+
+    Pages bind their heavy dependencies through this so a cold start only
+    pays for the modules that the code path actually being rendered uses.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        # Only called for names not on the proxy itself, i.e. the module's own
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
+
+def lazy_import(name):
+    """Return a proxy for ``name`` that imports it the first time it is used"""
+    return LazyModule(name)
@@ -0,0 +1,423 @@
+"""Session-state memory accounting, with spill-to-disk and eviction under per-session and global budgets."""
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import types
+import uuid
+import weakref
+from collections import OrderedDict, deque
+from collections.abc import Mapping, MutableMapping
+from bookbuddy.token_store import write_private
+
+logger = logging.getLogger(__name__)
+
+# Budget configuration
+SESSION_BUDGET_BYTES = int(os.environ.get('BOOKBUDDY_SESSION_BUDGET_MB', 256)) * 1024 * 1024
+GLOBAL_BUDGET_BYTES = int(os.environ.get('BOOKBUDDY_GLOBAL_BUDGET_MB', 2048)) * 1024 * 1024
+SPILL_DIR = os.environ.get('BOOKBUDDY_SPILL_DIR', os.path.join(tempfile.gettempdir(), 'bookbuddy_spill'))
+SPILL_MAX_BYTES = int(os.environ.get('BOOKBUDDY_SPILL_MAX_MB', 4096)) * 1024 * 1024
+
+# Sessions that haven't reported for this long are assumed closed
+SESSION_STALE_SECONDS = 3600
+
+# Plain objects are only followed this many attributes deep
+MAX_SIZE_DEPTH = 8
+
+SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+# DataFrames in session state are replaced, not mutated, so their size is measured once
+_frame_sizes = {}
+_frame_sizes_lock = threading.Lock()
+
+def frame_size(obj):
+    """Deep memory usage of a pandas object, cached for as long as the object lives"""
+    with _frame_sizes_lock:
+        cached = _frame_sizes.get(id(obj))
+        if cached is not None and cached[0]() is obj:
+            return cached[1]
+    usage = obj.memory_usage(deep=True)
+    size = int(usage.sum() if hasattr(usage, 'sum') else usage)
+    try:
+        ref = weakref.ref(obj, lambda _, key=id(obj): _frame_sizes.pop(key, None))
+    except TypeError:
+        return size
+    with _frame_sizes_lock:
+        _frame_sizes[id(obj)] = (ref, size)
+    return size
+
+def deep_size(obj, seen=None, depth=0):
+    """Approximate bytes held in memory by ``obj``, counting shared objects once"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, SKIPPED_TYPES):
+        return 0
+    seen.add(id(obj))
+
+    module = type(obj).__module__ or ''
+    if module.startswith('pandas') and hasattr(obj, 'memory_usage'):
+        return frame_size(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None), Spilled)):
+        return sys.getsizeof(obj)
+    if isinstance(obj, SpillableStore):
+        return sys.getsizeof(obj) + sum(deep_size(value, seen, depth + 1) for value in obj.resident_values())
+
+    size = sys.getsizeof(obj)
+    try:
+        if isinstance(obj, Mapping):
+            for key, value in list(obj.items()):
+                size += deep_size(key, seen, depth + 1) + deep_size(value, seen, depth + 1)
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            for item in list(obj):
+                size += deep_size(item, seen, depth + 1)
+        elif depth < MAX_SIZE_DEPTH and hasattr(obj, '__dict__'):
+            size += deep_size(vars(obj), seen, depth + 1)
+    except Exception:
+        # Some library containers refuse iteration (e.g. urllib3's thread-safe headers); count the shell only
+        pass
+    return size
+
+def is_empty(value):
+    """Whether a session value holds nothing worth evicting"""
+    return value is None or (isinstance(value, (str, bytes, list, tuple, dict)) and not value)
+
+def format_bytes(size):
+    """Human-readable size, e.g. 12.3 MB"""
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GB"
+
+class Spilled:
+    """Reference to a value written out to the spill cache"""
+
+    __slots__ = ('path', 'nbytes', 'kind')
+
+    def __init__(self, path, nbytes, kind):
+        self.path = path
+        self.nbytes = nbytes
+        self.kind = kind
+
+class SpillCache:
+    """Process-wide directory of spilled values, pruned oldest-first beyond ``max_bytes``"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._adopt_existing()
+
+    def _adopt_existing(self):
+        """Count files left by earlier processes against max_bytes, deleting those too old to be in use"""
+        cutoff = time.time() - SESSION_STALE_SECONDS
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if stat.st_mtime < cutoff:
+                self._remove(entry.path)
+            elif not entry.name.endswith('.tmp'):
+                found.append((stat.st_mtime, entry.path, stat.st_size))
+        with self._lock:
+            for _, path, size in sorted(found):
+                self._files[path] = size
+                self.bytes += size
+        if found:
+            logger.info("Spill cache adopted %d files (%s) from %s", len(found), format_bytes(self.bytes), self.directory)
+        self._prune()
+
+    def _prune(self):
+        """Delete the oldest files until the cache fits max_bytes, always keeping the newest"""
+        pruned = []
+        with self._lock:
+            while self.bytes > self.max_bytes and len(self._files) > 1:
+                old_path, size = self._files.popitem(last=False)
+                self.bytes -= size
+                pruned.append((old_path, size))
+        for old_path, size in pruned:
+            self._remove(old_path)
+            logger.warning("Spill cache over %s, dropped %s", format_bytes(self.max_bytes), format_bytes(size))
+
+    def put(self, value):
+        """Write ``value`` to disk and return its Spilled handle"""
+        if isinstance(value, (bytes, bytearray)):
+            data, kind = bytes(value), 'bytes'
+        else:
+            data, kind = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 'pickle'
+        path = os.path.join(self.directory, uuid.uuid4().hex)
+        write_private(path, data)
+        with self._lock:
+            self._files[path] = len(data)
+            self.bytes += len(data)
+        self._prune()
+        return Spilled(path, len(data), kind)
+
+    def exists(self, spilled):
+        with self._lock:
+            return spilled.path in self._files
+
+    def load(self, spilled):
+        """The spilled value, or None if it was pruned"""
+        try:
+            with open(spilled.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return data if spilled.kind == 'bytes' else pickle.loads(data)
+
+    def discard(self, spilled):
+        with self._lock:
+            size = self._files.pop(spilled.path, None)
+            if size is not None:
+                self.bytes -= size
+        self._remove(spilled.path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+class SpillableStore(MutableMapping):
+    """Dict whose values the governor can move to the spill cache; reads load them back transparently.
+
+    Values read back from disk are not kept in memory again, so reading an
+    old take for an upload or an analysis doesn't undo the spill.
+    """
+
+    def __init__(self, spill_cache, data=None):
+        self.spill_cache = spill_cache
+        self._data = {}
+        if data:
+            self.update(data)
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if isinstance(value, Spilled):
+            loaded = self.spill_cache.load(value)
+            if loaded is None:
+                del self._data[key]
+                raise KeyError(key)
+            return loaded
+        return value
+
+    def __setitem__(self, key, value):
+        self._discard(key)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        self._discard(key)
+        del self._data[key]
+
+    def __contains__(self, key):
+        # Checked without loading spilled values
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        # MutableMapping.clear() pops, and so reads back, every spilled value
+        for value in self._data.values():
+            if isinstance(value, Spilled):
+                self.spill_cache.discard(value)
+        self._data.clear()
+
+    def _discard(self, key):
+        old = self._data.get(key)
+        if isinstance(old, Spilled):
+            self.spill_cache.discard(old)
+
+    def drop_pruned(self):
+        """Forget values whose spill file the cache has since pruned; returns their keys"""
+        pruned = [key for key, value in self._data.items()
+                  if isinstance(value, Spilled) and not self.spill_cache.exists(value)]
+        for key in pruned:
+            del self._data[key]
+        return pruned
+
+    def resident_values(self):
+        return [value for value in self._data.values() if not isinstance(value, Spilled)]
+
+    def spilled_values(self):
+        return [value for value in self._data.values() if isinstance(value, Spilled)]
+
+    def spill_oldest(self, needed):
+        """Spill values in insertion order until ``needed`` bytes are freed; returns [(key, bytes)]"""
+        spilled = []
+        freed = 0
+        for key, value in list(self._data.items()):
+            if freed >= needed:
+                break
+            if isinstance(value, Spilled):
+                continue
+            size = deep_size(value)
+            self._data[key] = self.spill_cache.put(value)
+            freed += size
+            spilled.append((key, size))
+        return spilled
+
+class MemoryGovernor:
+    """Process-wide session-state accounting that enforces per-session and global budgets.
+
+    Each session reports its size at the end of a rerun. A session over its
+    target first spills history data and store values to disk, oldest first,
+    then evicts whole history entries, and as a last resort drops state the
+    page can rebuild (e.g. by refetching).
+    """
+
+    def __init__(self, session_budget, global_budget, spill_cache):
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.spill_cache = spill_cache
+        self.events = deque(maxlen=200)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def usage(self):
+        """(bytes across live sessions, number of live sessions); forgets stale sessions and their spill files"""
+        cutoff = time.time() - SESSION_STALE_SECONDS
+        stale_spills = []
+        with self._lock:
+            stale = [s for s, entry in self._sessions.items() if entry['updated'] < cutoff]
+            for session_id in stale:
+                stale_spills.extend(self._sessions.pop(session_id)['spills'])
+            total, sessions = sum(entry['bytes'] for entry in self._sessions.values()), len(self._sessions)
+        for spilled in stale_spills:
+            self.spill_cache.discard(spilled)
+        if stale:
+            logger.info("memory: forgot %d stale sessions and %d spill files", len(stale), len(stale_spills))
+        return total, sessions
+
+    def session_target(self, session_id, session_bytes):
+        """This session's budget, shrunk to what the global budget leaves it"""
+        total, sessions = self.usage()
+        with self._lock:
+            reported = self._sessions.get(session_id)
+        others = total - (reported['bytes'] if reported else 0)
+        if others + session_bytes <= self.global_budget:
+            return self.session_budget
+        fair_share = self.global_budget // max(sessions + (0 if reported else 1), 1)
+        return min(self.session_budget, max(self.global_budget - others, fair_share))
+
+    def _event(self, session_id, action, key, item, size):
+        event = {'time': time.time(), 'session': session_id, 'action': action,
+                 'key': key, 'item': item, 'bytes': size}
+        self.events.append(event)
+        logger.info("memory %s: session=%s key=%s item=%s size=%s",
+                    action, session_id[:8], key, item, format_bytes(size))
+        return event
+
+    def enforce(self, session_id, state, spill_keys=(), history_keys=(), evict_keys=()):
+        """Measure ``state`` and bring it under this session's target.
+
+        ``history_keys`` name lists of dicts with a ``'data'`` entry (oldest
+        first); ``spill_keys`` name SpillableStores. ``evict_keys`` lists
+        rebuildable state, least valuable first; a tuple of keys is evicted
+        together, and the page re-initialises them on its next run.
+        Returns a usage report.
+        """
+        seen = set()
+        by_key = {key: deep_size(state[key], seen) for key in list(state.keys())}
+        session_bytes = sum(by_key.values())
+        target = self.session_target(session_id, session_bytes)
+        actions = []
+
+        # Entries whose spill file was pruned from disk are gone for good
+        for key in history_keys:
+            history = state.get(key) or []
+            for item in [i for i in history if isinstance(i.get('data'), Spilled)]:
+                if not self.spill_cache.exists(item['data']):
+                    history.remove(item)
+                    actions.append(self._event(session_id, 'evicted', key, item.get('name'), 0))
+        for key in spill_keys:
+            store = state.get(key)
+            if isinstance(store, SpillableStore):
+                for item in store.drop_pruned():
+                    actions.append(self._event(session_id, 'evicted', key, item, 0))
+
+        excess = session_bytes - target
+        if excess > 0 and self.spill_cache.max_bytes > 0:
+            for key in history_keys:
+                for item in state.get(key) or []:
+                    if excess <= 0:
+                        break
+                    if isinstance(item.get('data'), Spilled) or item.get('data') is None:
+                        continue
+                    size = deep_size(item['data'])
+                    item['data'] = self.spill_cache.put(item['data'])
+                    excess -= size
+                    by_key[key] -= size
+                    actions.append(self._event(session_id, 'spilled', key, item.get('name'), size))
+            for key in spill_keys:
+                store = state.get(key)
+                if excess <= 0 or not isinstance(store, SpillableStore):
+                    continue
+                for item, size in store.spill_oldest(excess):
+                    excess -= size
+                    by_key[key] -= size
+                    actions.append(self._event(session_id, 'spilled', key, item, size))
+
+        if excess > 0:
+            for key in history_keys:
+                history = state.get(key) or []
+                while excess > 0 and history:
+                    item = history.pop(0)
+                    data = item.get('data')
+                    if isinstance(data, Spilled):
+                        self.spill_cache.discard(data)
+                        size = 0
+                    else:
+                        size = deep_size(data)
+                    excess -= size
+                    by_key[key] -= size
+                    actions.append(self._event(session_id, 'evicted', key, item.get('name'), size))
+
+        for group in evict_keys:
+            if excess <= 0:
+                break
+            keys = [key for key in ((group,) if isinstance(group, str) else group)
+                    if key in state and not is_empty(state[key])]
+            if not keys:
+                continue
+            size = sum(by_key.pop(key, 0) for key in keys)
+            for key in keys:
+                del state[key]
+            excess -= size
+            actions.append(self._event(session_id, 'evicted', ', '.join(keys), None, size))
+
+        if excess > 0:
+            logger.warning("memory: session=%s still %s over its %s budget with nothing left to spill",
+                           session_id[:8], format_bytes(excess), format_bytes(target))
+
+        # Remember what this session has on disk, so it can be deleted once the session goes stale
+        spills = [item['data'] for key in history_keys for item in state.get(key) or []
+                  if isinstance(item.get('data'), Spilled)]
+        for key in spill_keys:
+            if isinstance(state.get(key), SpillableStore):
+                spills.extend(state[key].spilled_values())
+
+        session_bytes = sum(by_key.values())
+        with self._lock:
+            self._sessions[session_id] = {'bytes': session_bytes, 'updated': time.time(), 'spills': spills}
+        global_bytes, sessions = self.usage()
+        return {
+            'bytes': session_bytes,
+            'by_key': by_key,
+            'target': target,
+            'global_bytes': global_bytes,
+            'sessions': sessions,
+            'spilled_bytes': self.spill_cache.bytes,
+            'actions': actions
+        }
@@ -0,0 +1,226 @@
+"""Local SQLite/DuckDB mirror of fetched sheet ranges."""
+import os
+import json
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import time
+from datetime import datetime
+from bookbuddy.lazy import lazy_import
+from bookbuddy.tracing import traced
+
+pd = lazy_import('pandas')
+
+# Holds private spreadsheet data, so it lives in an owner-only directory
+SHEET_MIRROR_PATH = os.environ.get(
+    'BOOKBUDDY_SHEET_MIRROR',
+    os.path.join(tempfile.gettempdir(), 'bookbuddy_mirror', 'sheets.db')
+)
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def sql_type(dtype):
+    """Column type for a pandas dtype; names both SQLite and DuckDB understand"""
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOLEAN'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'BIGINT'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'DOUBLE'
+    return 'TEXT'
+
+def typed_value(value, kind):
+    """Parse a filter value picked from the UI into the column's SQL type"""
+    try:
+        if kind == 'BIGINT':
+            return int(float(value))
+        if kind == 'DOUBLE':
+            return float(value)
+        if kind == 'BOOLEAN':
+            return str(value).lower() in ('true', '1')
+    except ValueError:
+        pass
+    return str(value)
+
+def connect_mirror(path):
+    """Open the mirror database readable only by this user, preferring DuckDB when it is installed"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+    try:
+        import duckdb
+        duckdb_path = os.path.splitext(path)[0] + '.duckdb'
+        connection = duckdb.connect(duckdb_path)
+        os.chmod(duckdb_path, 0o600)
+        return connection, 'duckdb'
+    except ImportError:
+        # Create the file 0600 up front; SQLite gives its -wal and -shm files the same mode
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+        os.chmod(path, 0o600)
+        connection = sqlite3.connect(path, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection, 'sqlite'
+
+class SheetMirror:
+    """Local SQL copy of fetched ranges, kept in sync by row-hash upserts.
+
+    Every range gets its own table keyed by the poller's row key, with the
+    row's sheet position and content hash alongside the data columns. A sync
+    only touches rows whose hash or position changed; a schema change
+    rebuilds the table.
+    """
+    
+    def __init__(self, path):
+        self.connection, self.backend = connect_mirror(path)
+        self.lock = threading.Lock()
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS mirror_tables ('
+            'name TEXT PRIMARY KEY, spreadsheet_id TEXT, range_name TEXT, '
+            'schema TEXT, rows BIGINT, synced_at TEXT)'
+        )
+    
+    @staticmethod
+    def table_name(spreadsheet_id, range_name):
+        return 'sheet_' + hashlib.sha1(f"{spreadsheet_id}|{range_name}".encode()).hexdigest()[:16]
+    
+    def ensure_index(self, table, column):
+        index = f"idx_{table}_{hashlib.sha1(str(column).encode()).hexdigest()[:8]}"
+        self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({quote_identifier(column)})"
+        )
+    
+    @traced('mirror.sync')
+    def sync(self, spreadsheet_id, range_name, df, hashes, key_column=None):
+        """Bring the mirror table in line with a fetched frame; returns upsert counts"""
+        start = time.perf_counter()
+        table = self.table_name(spreadsheet_id, range_name)
+        schema = [[str(col), sql_type(dtype)] for col, dtype in df.dtypes.items()]
+        keys = hashes.index.tolist()
+        # Store hashes as signed 64-bit so both backends accept them
+        row_hashes = hashes.to_numpy().view('int64').tolist()
+        
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT schema FROM mirror_tables WHERE name = ?', [table]
+            ).fetchone()
+            rebuild = row is None or json.loads(row[0]) != schema
+            if rebuild:
+                self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+                columns = ', '.join(f"{quote_identifier(name)} {kind}" for name, kind in schema)
+                self.connection.execute(
+                    f"CREATE TABLE {table} (_key TEXT PRIMARY KEY, _row BIGINT, _hash BIGINT"
+                    f"{', ' + columns if columns else ''})"
+                )
+                self.ensure_index(table, '_row')
+                stored = {}
+            else:
+                stored = {
+                    key: (position, row_hash) for key, position, row_hash in
+                    self.connection.execute(f"SELECT _key, _row, _hash FROM {table}").fetchall()
+                }
+            if key_column and key_column in df.columns:
+                self.ensure_index(table, key_column)
+            
+            changed = []
+            moved = []
+            for i, (key, row_hash) in enumerate(zip(keys, row_hashes)):
+                previous = stored.get(key)
+                if previous is None or previous[1] != row_hash:
+                    changed.append(i)
+                elif previous[0] != i:
+                    moved.append([i, key])
+            removed = set(stored) - set(keys)
+            if removed:
+                self.connection.executemany(f"DELETE FROM {table} WHERE _key = ?", [[key] for key in removed])
+            if moved:
+                # Rows inserted or deleted above only shift position, not content
+                self.connection.executemany(f"UPDATE {table} SET _row = ? WHERE _key = ?", moved)
+            if changed:
+                subset = df.iloc[changed].copy()
+                for col in subset.columns[subset.dtypes.map(pd.api.types.is_datetime64_any_dtype)]:
+                    subset[col] = subset[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+                subset = subset.astype(object).where(subset.notna(), None)
+                placeholders = ', '.join(['?'] * (len(schema) + 3))
+                self.connection.executemany(
+                    f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})",
+                    [
+                        [keys[i], i, row_hashes[i], *values]
+                        for i, values in zip(changed, subset.itertuples(index=False, name=None))
+                    ]
+                )
+            self.connection.execute(
+                'INSERT OR REPLACE INTO mirror_tables VALUES (?, ?, ?, ?, ?, ?)',
+                [table, spreadsheet_id, range_name, json.dumps(schema), len(keys), datetime.now().isoformat()]
+            )
+            self.connection.commit()
+        return {
+            'rebuilt': rebuild,
+            'upserted': len(changed),
+            'moved': len(moved),
+            'deleted': len(removed),
+            'sync_ms': (time.perf_counter() - start) * 1000
+        }
+    
+    @traced('mirror.distinct')
+    def distinct_values(self, spreadsheet_id, range_name, column, limit=1000):
+        """Sorted distinct non-empty values of a mirrored column, as strings for a picker"""
+        table = self.table_name(spreadsheet_id, range_name)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT schema FROM mirror_tables WHERE name = ?', [table]
+            ).fetchone()
+            if row is None or str(column) not in [name for name, _ in json.loads(row[0])]:
+                return []
+            # The column index lets both backends answer from the index alone
+            self.ensure_index(table, column)
+            name = quote_identifier(column)
+            rows = self.connection.execute(
+                f"SELECT DISTINCT {name} FROM {table} WHERE {name} IS NOT NULL ORDER BY {name} LIMIT {int(limit)}"
+            ).fetchall()
+        return [str(value) for value, in rows]
+    
+    @traced('mirror.query')
+    def query(self, spreadsheet_id, range_name, filters=None, search=None,
+              group_by=None, sum_column=None, limit=1000):
+        """Filter, search or aggregate a mirrored range; returns (DataFrame, query ms)"""
+        table = self.table_name(spreadsheet_id, range_name)
+        where = []
+        params = []
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT schema FROM mirror_tables WHERE name = ?', [table]
+            ).fetchone()
+            if row is None:
+                return pd.DataFrame(), 0.0
+            schema = json.loads(row[0])
+            kinds = dict((name, kind) for name, kind in schema)
+            for column, values in (filters or {}).items():
+                if values:
+                    # Compare in the column's own type so the index can be used
+                    self.ensure_index(table, column)
+                    where.append(f"{quote_identifier(column)} IN ({', '.join(['?'] * len(values))})")
+                    params.extend(typed_value(v, kinds.get(str(column), 'TEXT')) for v in values)
+            if search:
+                text_columns = [name for name, kind in schema if kind == 'TEXT'] or [name for name, _ in schema]
+                where.append('(' + ' OR '.join(
+                    f"LOWER(CAST({quote_identifier(name)} AS TEXT)) LIKE ?" for name in text_columns
+                ) + ')')
+                params.extend([f"%{search.lower()}%"] * len(text_columns))
+            
+            clause = f" WHERE {' AND '.join(where)}" if where else ''
+            if group_by:
+                group = quote_identifier(group_by)
+                total = f", SUM({quote_identifier(sum_column)}) AS total" if sum_column else ''
+                sql = (f"SELECT {group}, COUNT(*) AS count{total} FROM {table}{clause}"
+                       f" GROUP BY {group} ORDER BY count DESC LIMIT {int(limit)}")
+            else:
+                columns = ', '.join(quote_identifier(name) for name, _ in schema) or '*'
+                sql = f"SELECT {columns} FROM {table}{clause} ORDER BY _row LIMIT {int(limit)}"
+            
+            start = time.perf_counter()
+            cursor = self.connection.execute(sql, params)
+            rows = cursor.fetchall()
+            query_ms = (time.perf_counter() - start) * 1000
+            names = [d[0] for d in cursor.description]
+        return pd.DataFrame(rows, columns=names), query_ms
@@ -0,0 +1,521 @@
+"""Google Sheets reads into typed DataFrames, row-hash diffs and batched write-back."""
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bookbuddy.lazy import lazy_import
+from bookbuddy.tracing import annotate, bind, count, traced
+
+pd = lazy_import('pandas')
+
+A1_START = re.compile(r'^\$?([A-Za-z]+)\$?(\d+)')
+A1_CELLS = re.compile(r'^\$?([A-Za-z]*)\$?(\d*)(?::\$?([A-Za-z]*)\$?(\d*))?$')
+ISO_DATETIME = '%Y-%m-%dT%H:%M:%S'
+
+def unique_headers(header, width):
+    """Pad and de-duplicate a header row so it can label every column"""
+    names = []
+    seen = {}
+    for i in range(width):
+        name = str(header[i]).strip() if i < len(header) and str(header[i]).strip() else f"Column {i + 1}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def infer_column_types(df):
+    """Convert object columns to numeric or datetime when every value parses"""
+    for col in df.columns:
+        series = df[col]
+        if not (series.dtype == object or pd.api.types.is_string_dtype(series.dtype)):
+            continue
+        # Empty cells arrive as '' and would block every conversion
+        series = series.mask(series == '')
+        non_empty = series.dropna()
+        if non_empty.empty:
+            continue
+        if non_empty.map(type).eq(bool).all():
+            df[col] = series.astype('boolean')
+            continue
+        numeric = pd.to_numeric(non_empty.iloc[:1], errors='coerce')
+        if numeric.notna().all():
+            numeric = pd.to_numeric(non_empty, errors='coerce')
+        if len(numeric) == len(non_empty) and numeric.notna().all():
+            converted = pd.to_numeric(series, errors='coerce')
+            df[col] = converted.astype('Int64') if (numeric % 1 == 0).all() else converted
+            continue
+        if non_empty.map(type).eq(str).all():
+            # Probe one value first; pandas then infers a single format for the column
+            if pd.isna(pd.to_datetime(non_empty.iloc[:1], errors='coerce')).all():
+                continue
+            parsed = pd.to_datetime(non_empty, errors='coerce')
+            if parsed.notna().all():
+                df[col] = pd.to_datetime(series, errors='coerce')
+    return df
+
+@traced('sheets.to_dataframe')
+def values_to_dataframe(values, header=True):
+    """Turn a ValueRange's ragged row lists into a typed DataFrame"""
+    if not values:
+        return pd.DataFrame()
+    width = max(len(row) for row in values)
+    if header:
+        columns = unique_headers(values[0], width)
+        rows = values[1:]
+    else:
+        columns = unique_headers([], width)
+        rows = values
+    # Sheets trims trailing empty cells, so rows are ragged; pandas pads them
+    df = pd.DataFrame(rows).reindex(columns=range(width))
+    df.columns = columns
+    return infer_column_types(df)
+
+def column_letter(index):
+    """1-based column number to A1 letters"""
+    letters = ''
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def column_number(letters):
+    """A1 column letters to a 1-based column number"""
+    number = 0
+    for char in letters.upper():
+        number = number * 26 + ord(char) - 64
+    return number
+
+def split_a1(a1_range):
+    """Split 'Sheet!B2:D9' into (sheet name, first row, first column)"""
+    if '!' in a1_range:
+        sheet, cells = a1_range.rsplit('!', 1)
+    else:
+        sheet, cells = a1_range, ''
+    if sheet.startswith("'") and sheet.endswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+    match = A1_START.match(cells)
+    if not match:
+        return sheet, 1, 1
+    return sheet, int(match.group(2)), column_number(match.group(1))
+
+def range_bounds(a1_range):
+    """Split an A1 range into (sheet, first_row, first_col, last_row, last_col); open ends are None"""
+    if '!' in a1_range:
+        sheet, cells = a1_range.rsplit('!', 1)
+    else:
+        sheet, cells = a1_range, ''
+    if sheet.startswith("'") and sheet.endswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+    match = A1_CELLS.match(cells)
+    if not cells or not match:
+        return sheet, None, None, None, None
+    first_col, first_row, last_col, last_row = match.groups()
+    if last_col is None and last_row is None:
+        last_col, last_row = first_col, first_row
+    return (
+        sheet,
+        int(first_row) if first_row else None,
+        column_number(first_col) if first_col else None,
+        int(last_row) if last_row else None,
+        column_number(last_col) if last_col else None
+    )
+
+def quote_sheet(sheet):
+    return "'" + sheet.replace("'", "''") + "'"
+
+@traced('sheets.plan_pages')
+def plan_pages(service, quota, spreadsheet_id, ranges, page_rows):
+    """Split each range into row windows of at most page_rows, using the sheet grid size.
+
+    Returns {requested range: [page A1 ranges]}. Ranges that fit in one page,
+    or that don't name a known sheet (e.g. named ranges), stay as one page.
+    """
+    grid = {}
+    response = quota.execute(service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        fields='sheets.properties(title,gridProperties(rowCount,columnCount))'
+    ))
+    for sheet in response.get('sheets', []):
+        props = sheet['properties']
+        grid[props['title']] = props.get('gridProperties', {})
+    
+    plan = {}
+    for requested in ranges:
+        sheet, first_row, first_col, last_row, last_col = range_bounds(requested)
+        if sheet not in grid:
+            plan[requested] = [requested]
+            continue
+        first_row = first_row or 1
+        last_row = last_row or grid[sheet].get('rowCount', first_row)
+        first_col = first_col or 1
+        last_col = last_col or grid[sheet].get('columnCount', first_col)
+        if last_row - first_row + 1 <= page_rows:
+            plan[requested] = [requested]
+            continue
+        plan[requested] = [
+            f"{quote_sheet(sheet)}!{column_letter(first_col)}{start}:"
+            f"{column_letter(last_col)}{min(start + page_rows - 1, last_row)}"
+            for start in range(first_row, last_row + 1, page_rows)
+        ]
+    return plan
+
+@traced('sheets.fetch_pages')
+def fetch_page_group(service, quota, spreadsheet_id, page_ranges):
+    """Fetch a group of page ranges with one batchGet"""
+    start = time.perf_counter()
+    response = quota.execute(service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=page_ranges,
+        majorDimension='ROWS',
+        valueRenderOption='UNFORMATTED_VALUE',
+        dateTimeRenderOption='FORMATTED_STRING'
+    ))
+    annotate(pages=len(page_ranges))
+    count('sheets.pages', len(page_ranges))
+    return response.get('valueRanges', []), (time.perf_counter() - start) * 1000
+
+@traced('sheets.fetch_ranges')
+def fetch_sheet_ranges(service, quota, spreadsheet_id, ranges, header=True, page_rows=10000,
+                       max_workers=4, on_chunk=None):
+    """Fetch ranges in row-window pages and convert each page as it arrives.
+
+    Ranges that fit in a single page share one batchGet; longer ranges are
+    split into pages read concurrently with at most max_workers in flight.
+    Every call goes through ``quota``, so a 429 on one page is retried
+    instead of failing the whole fetch.
+    on_chunk(requested, page_index, chunk, pages_done, pages_total) is called
+    from this thread for every converted page, so callers can render early.
+    
+    Returns ({range: DataFrame}, stats) where stats holds fetch timings and a
+    per-range breakdown of size, page count and conversion time.
+    """
+    start = time.perf_counter()
+    plan = plan_pages(service, quota, spreadsheet_id, ranges, page_rows)
+    
+    # (requested, page index) for every page, grouped into batchGet calls
+    single = [(requested, 0) for requested, pages in plan.items() if len(pages) == 1]
+    groups = [single] if single else []
+    groups += [
+        [(requested, i)] for requested, pages in plan.items() if len(pages) > 1
+        for i in range(len(pages))
+    ]
+    pages_total = sum(len(pages) for pages in plan.values())
+    
+    chunks = {requested: {} for requested in ranges}
+    columns = {}
+    resolved = {}
+    convert_ms = {requested: 0.0 for requested in ranges}
+    first_page_ms = None
+    pages_done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(bind(fetch_page_group), service, quota, spreadsheet_id,
+                            [plan[requested][i] for requested, i in group]): group
+            for group in groups
+        }
+        for future in as_completed(futures):
+            value_ranges, _ = future.result()
+            for (requested, i), value_range in zip(futures[future], value_ranges):
+                convert_start = time.perf_counter()
+                values = value_range.get('values', [])
+                if i == 0:
+                    resolved[requested] = value_range.get('range', requested)
+                    chunk = values_to_dataframe(values, header)
+                    columns[requested] = list(chunk.columns)
+                else:
+                    chunk = values_to_dataframe(values, header=False)
+                chunks[requested][i] = chunk
+                convert_ms[requested] += (time.perf_counter() - convert_start) * 1000
+                pages_done += 1
+                if first_page_ms is None:
+                    first_page_ms = (time.perf_counter() - start) * 1000
+                if on_chunk:
+                    on_chunk(requested, i, chunk, pages_done, pages_total)
+    fetch_ms = (time.perf_counter() - start) * 1000
+    
+    frames = {}
+    per_range = []
+    for requested in ranges:
+        convert_start = time.perf_counter()
+        df = assemble_pages(plan[requested], chunks[requested], columns.get(requested, []), header)
+        convert_ms[requested] += (time.perf_counter() - convert_start) * 1000
+        frames[requested] = df
+        per_range.append({
+            'Range': resolved.get(requested, requested),
+            'Pages': len(plan[requested]),
+            'Rows': len(df),
+            'Columns': len(df.columns),
+            'Cells': df.size,
+            'Convert (ms)': convert_ms[requested]
+        })
+    count('sheets.rows', sum(row['Rows'] for row in per_range))
+    annotate(ranges=len(ranges), pages=pages_total)
+    return frames, {
+        'fetch_ms': fetch_ms,
+        'first_page_ms': first_page_ms or fetch_ms,
+        'pages': pages_total,
+        'ranges': per_range,
+        'resolved': resolved
+    }
+
+@traced('sheets.assemble_pages')
+def assemble_pages(page_ranges, chunks, columns, header=True):
+    """Concatenate converted pages in sheet order, keeping row positions aligned.
+
+    Sheets drops trailing empty rows from each page, so every page before the
+    last non-empty one is padded back to its window height.
+    """
+    if len(page_ranges) == 1:
+        return chunks.get(0, pd.DataFrame())
+    last = max((i for i, chunk in chunks.items() if len(chunk)), default=0)
+    parts = []
+    for i in range(last + 1):
+        chunk = chunks.get(i, pd.DataFrame())
+        if i < last:
+            _, first_row, _, last_row, _ = range_bounds(page_ranges[i])
+            height = last_row - first_row + 1 - (1 if header and i == 0 else 0)
+            chunk = chunk.reindex(range(height))
+        chunk = chunk.copy()
+        chunk.columns = range(len(chunk.columns))
+        parts.append(chunk)
+    df = pd.concat(parts, ignore_index=True)
+    df.columns = unique_headers(columns, len(df.columns))
+    # Pages that disagreed on a column's type fall back to object; infer once more
+    return infer_column_types(df)
+
+def row_keys(df, key_column):
+    """Identify rows by the key column (or position), disambiguating duplicate keys"""
+    if key_column and key_column in df.columns:
+        base = df[key_column].astype(str)
+    else:
+        base = pd.Series(df.index.astype(str), index=df.index)
+    occurrence = base.groupby(base).cumcount()
+    return base.where(occurrence == 0, base + '#' + occurrence.astype(str))
+
+def cell_text(value):
+    """A cell of an object column as dtype-independent text"""
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (int, float)):
+        return repr(float(value))
+    if isinstance(value, pd.Timestamp):
+        return value.strftime(ISO_DATETIME)
+    return str(value)
+
+def column_text(series):
+    """A column as text that doesn't depend on its inferred dtype; empty cells become ''"""
+    if pd.api.types.is_bool_dtype(series.dtype):
+        text = series.astype(object).astype(str)
+    elif pd.api.types.is_numeric_dtype(series.dtype):
+        # Sheets numbers are doubles, so Int64 5 and float 5.0 are the same cell
+        text = series.astype('float64').map(repr)
+    elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+        if series.dt.tz is not None:
+            series = series.dt.tz_localize(None)
+        text = pd.Series(series.to_numpy(dtype='datetime64[s]').astype(str), index=series.index)
+    elif pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+        text = series
+    else:
+        text = series.map(cell_text, na_action='ignore')
+    return text.astype(object).where(series.notna(), '') if series.hasnans else text
+
+def plain_records(df):
+    """Rows as JSON-ready dicts: None for empty cells, ISO strings for dates"""
+    df = df.copy()
+    for col in df.columns[df.dtypes.map(pd.api.types.is_datetime64_any_dtype)]:
+        df[col] = df[col].dt.strftime(ISO_DATETIME)
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def snapshot_hashes(df, key_column):
+    """One 64-bit content hash per row, indexed by row key.
+    
+    Rows are hashed as cell text, so a column whose inferred type changes
+    between polls (Int64 to float once a 5.5 is entered) doesn't mark every
+    row modified.
+    """
+    text = pd.DataFrame({col: column_text(df[col]) for col in df.columns}, index=df.index)
+    hashes = pd.util.hash_pandas_object(text, index=False)
+    hashes.index = pd.Index(row_keys(df, key_column))
+    return hashes
+
+@traced('sheets.diff')
+def diff_snapshots(range_name, old_df, old_hashes, new_df, new_hashes):
+    """Compare two snapshots of a range and return its change set"""
+    old_keys = old_hashes.index
+    new_keys = new_hashes.index
+    added = new_keys.difference(old_keys, sort=False)
+    removed = old_keys.difference(new_keys, sort=False)
+    common = new_keys.intersection(old_keys, sort=False)
+    changed = common[old_hashes.loc[common].to_numpy() != new_hashes.loc[common].to_numpy()]
+    
+    def records(df, hashes, keys):
+        return plain_records(df.iloc[hashes.index.get_indexer(keys)])
+    
+    return {
+        'range': range_name,
+        'added': records(new_df, new_hashes, added),
+        'removed': records(old_df, old_hashes, removed),
+        'modified': [
+            {'key': key, 'before': before, 'after': after}
+            for key, before, after in zip(
+                changed,
+                records(old_df, old_hashes, changed),
+                records(new_df, new_hashes, changed)
+            )
+        ]
+    }
+
+def cells_equal(a, b):
+    """Loose equality between a snapshot value and a freshly read cell"""
+    def empty(v):
+        return v is None or v == '' or (isinstance(v, float) and pd.isna(v)) or v is pd.NA
+    if empty(a) or empty(b):
+        return empty(a) and empty(b)
+    if str(a) == str(b):
+        return True
+    try:
+        return float(a) == float(b)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return pd.Timestamp(a) == pd.Timestamp(b)
+    except (TypeError, ValueError):
+        return False
+
+def json_safe(value):
+    """Convert pandas/numpy scalars into values the Sheets API accepts"""
+    if value is None or value is pd.NA or (isinstance(value, float) and pd.isna(value)):
+        return ''
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat(sep=' ')
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+class SheetWriteBuffer:
+    """Pending cell edits for one spreadsheet, coalesced into one values.batchUpdate.
+
+    Each staged cell remembers the value it had in the snapshot it was edited
+    from. If the file's Drive version has moved on by flush time, the target
+    cells are re-read and any that changed underneath us are reported as
+    conflicts instead of being overwritten.
+    """
+    
+    def __init__(self, spreadsheet_id, base_version):
+        self.spreadsheet_id = spreadsheet_id
+        self.base_version = base_version
+        self.edits = {}
+        # When the oldest pending edit was staged; flush timers count from here
+        self.staged_since = None
+    
+    def __len__(self):
+        return len(self.edits)
+    
+    def stage(self, sheet, row, col, value, base_value):
+        """Record an edit at 1-based (row, col); editing back to the original drops it"""
+        key = (sheet, row, col)
+        if key in self.edits:
+            base_value = self.edits[key][1]
+        if cells_equal(value, base_value):
+            self.edits.pop(key, None)
+        else:
+            self.edits[key] = (value, base_value)
+        if not self.edits:
+            self.staged_since = None
+        elif self.staged_since is None:
+            self.staged_since = time.time()
+    
+    def coalesce(self, cells=None):
+        """Group cells into rectangular A1 ranges: runs within a row, then stacked rows"""
+        cells = self.edits if cells is None else cells
+        runs = []
+        for (sheet, row, col) in sorted(cells):
+            last = runs[-1] if runs else None
+            if last and last['sheet'] == sheet and last['row'] == row and last['end'] == col - 1:
+                last['end'] = col
+                last['values'].append(cells[(sheet, row, col)][0])
+            else:
+                runs.append({'sheet': sheet, 'row': row, 'start': col, 'end': col,
+                             'values': [cells[(sheet, row, col)][0]]})
+        
+        blocks = []
+        for run in sorted(runs, key=lambda r: (r['sheet'], r['start'], r['end'], r['row'])):
+            last = blocks[-1] if blocks else None
+            if (last and last['sheet'] == run['sheet'] and last['start'] == run['start']
+                    and last['end'] == run['end'] and last['last_row'] == run['row'] - 1):
+                last['last_row'] = run['row']
+                last['values'].append(run['values'])
+            else:
+                blocks.append({'sheet': run['sheet'], 'start': run['start'], 'end': run['end'],
+                               'first_row': run['row'], 'last_row': run['row'], 'values': [run['values']]})
+        return [
+            {
+                'range': f"{quote_sheet(b['sheet'])}!{column_letter(b['start'])}{b['first_row']}:"
+                         f"{column_letter(b['end'])}{b['last_row']}",
+                'values': [[json_safe(v) for v in row] for row in b['values']]
+            }
+            for b in blocks
+        ]
+    
+    def find_conflicts(self, sheets_service, sheets_quota):
+        """Re-read every staged cell and return the keys whose value moved since staging"""
+        data = self.coalesce()
+        response = sheets_quota.execute(sheets_service.spreadsheets().values().batchGet(
+            spreadsheetId=self.spreadsheet_id,
+            ranges=[d['range'] for d in data],
+            valueRenderOption='UNFORMATTED_VALUE',
+            dateTimeRenderOption='FORMATTED_STRING'
+        ))
+        conflicts = []
+        for d, value_range in zip(data, response.get('valueRanges', [])):
+            sheet, first_row, first_col = split_a1(d['range'])
+            current = value_range.get('values', [])
+            for i, row in enumerate(d['values']):
+                for j in range(len(row)):
+                    key = (sheet, first_row + i, first_col + j)
+                    now = current[i][j] if i < len(current) and j < len(current[i]) else ''
+                    if not cells_equal(now, self.edits[key][1]):
+                        conflicts.append({'cell': f"{sheet}!{column_letter(key[2])}{key[1]}",
+                                          'base': self.edits[key][1], 'current': now,
+                                          'attempted': self.edits[key][0]})
+                        self.edits.pop(key)
+        return conflicts
+    
+    @traced('sheets.flush_writes')
+    def flush(self, sheets_service, drive_service, sheets_quota, drive_quota):
+        """Write all staged edits; returns a summary including API calls used and conflicts"""
+        start = time.perf_counter()
+        api_calls = 1
+        current_version = drive_quota.execute(drive_service.files().get(
+            fileId=self.spreadsheet_id, fields='version'
+        )).get('version')
+        
+        conflicts = []
+        if self.base_version is None or current_version != self.base_version:
+            conflicts = self.find_conflicts(sheets_service, sheets_quota)
+            api_calls += 1
+        
+        data = self.coalesce()
+        updated = 0
+        if data:
+            # Setting values is idempotent, so a retried write is safe
+            response = sheets_quota.execute(sheets_service.spreadsheets().values().batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={'valueInputOption': 'USER_ENTERED', 'data': data}
+            ))
+            updated = response.get('totalUpdatedCells', 0)
+            api_calls += 1
+        
+        cells = len(self.edits)
+        self.edits = {}
+        self.staged_since = None
+        return {
+            'cells': cells,
+            'updated': updated,
+            'ranges': len(data),
+            'api_calls': api_calls,
+            'conflicts': conflicts,
+            'seconds': time.perf_counter() - start
+        }
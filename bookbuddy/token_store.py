@@ -0,0 +1,236 @@
+"""Encrypted, self-refreshing OAuth token store shared by the Google pages."""
+import json
+import os
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from cryptography.fernet import Fernet, InvalidToken
+from bookbuddy.lazy import lazy_import
+
+# Only needed once someone signs in or a token is due for refresh
+google_credentials = lazy_import('google.oauth2.credentials')
+transport_requests = lazy_import('google.auth.transport.requests')
+oauth_flow = lazy_import('google_auth_oauthlib.flow')
+google_jwt = lazy_import('google.auth.jwt')
+
+logger = logging.getLogger(__name__)
+
+# One consent covers every page, so the store asks for the union of their scopes
+# openid/email identify who signed in, so each user gets their own account
+SCOPES = [
+    'openid',
+    'https://www.googleapis.com/auth/userinfo.email',
+    'https://www.googleapis.com/auth/documents.readonly',
+    'https://www.googleapis.com/auth/drive.readonly',
+    'https://www.googleapis.com/auth/spreadsheets'
+]
+TOKEN_STORE_DIR = os.environ.get(
+    'BOOKBUDDY_TOKEN_DIR',
+    os.path.join(os.path.expanduser('~'), '.bookbuddy')
+)
+TOKEN_STORE_KEY = os.environ.get('BOOKBUDDY_TOKEN_KEY')
+# Refresh this long before expiry; google-auth itself only refreshes inside ~4 minutes
+REFRESH_MARGIN_SECONDS = 600
+REFRESH_CHECK_SECONDS = 30
+
+def write_private(path, data):
+    """Atomically write bytes readable only by the current user"""
+    temp_path = f"{path}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def load_key(directory, key=None):
+    """Fernet key from BOOKBUDDY_TOKEN_KEY, or from a key file created on first use"""
+    if key:
+        return key.encode()
+    # A key file beside tokens.enc only protects against readers of the token file alone
+    logger.warning("BOOKBUDDY_TOKEN_KEY is not set; the token key is kept in %s next to the tokens it encrypts",
+                   directory)
+    key_path = os.path.join(directory, 'token.key')
+    if not os.path.exists(key_path):
+        write_private(key_path, Fernet.generate_key())
+    with open(key_path, 'rb') as f:
+        return f.read().strip()
+
+def user_claims(id_token, client_id):
+    """Claims of the ID token returned with an authorization code, checked against our client"""
+    if not id_token:
+        raise ValueError("Google returned no ID token, so the signed-in user is unknown")
+    # Received straight from Google's token endpoint over TLS, so the signature needn't be re-checked
+    claims = google_jwt.decode(id_token, verify=False)
+    if claims.get('aud') != client_id or claims.get('iss') not in ('accounts.google.com', 'https://accounts.google.com'):
+        raise ValueError("ID token was not issued by Google for this client")
+    if not claims.get('sub'):
+        raise ValueError("ID token has no subject")
+    return claims
+
+class TokenStore:
+    """Encrypted, process-wide store of Google OAuth credentials, one account per Google user.
+
+    Refresh tokens are kept in an encrypted file so sign-in survives browser
+    sessions and restarts. Both Google pages read the same live Credentials
+    objects, and a daemon thread refreshes each access token well before it
+    expires. Requests therefore never wait on a token round trip. A browser
+    only gets an account back by presenting the signed cookie issued when
+    that user signed in.
+    """
+
+    def __init__(self, directory, key=None):
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(directory, 'tokens.enc')
+        secret = load_key(directory, key)
+        self.fernet = Fernet(secret)
+        self._cookie_key = hashlib.sha256(b'bookbuddy-account-cookie' + secret).digest()
+        self.lock = threading.Lock()
+        self.accounts = {}
+        self.refreshes = 0
+        self.refresh_errors = {}
+        self._load()
+        threading.Thread(target=self._refresh_loop, name='token-refresh', daemon=True).start()
+
+    @staticmethod
+    def account_id(client_id, subject):
+        """Non-secret account identifier for one Google user (``sub``) of one OAuth client"""
+        return hashlib.sha256(f"{client_id}:{subject}".encode()).hexdigest()[:16]
+
+    def account_cookie(self, account):
+        """Signed cookie value that lets this browser resume ``account``"""
+        signature = hmac.new(self._cookie_key, account.encode(), hashlib.sha256).hexdigest()
+        return f"{account}.{signature}"
+
+    def cookie_account(self, cookie):
+        """Account named by a cookie from account_cookie, or None if it is forged or signed out"""
+        if not isinstance(cookie, str):
+            return None
+        account, _, signature = cookie.partition('.')
+        expected = hmac.new(self._cookie_key, account.encode(), hashlib.sha256).hexdigest()
+        if not account or not hmac.compare_digest(signature, expected) or account not in self.accounts:
+            return None
+        return account
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                records = json.loads(self.fernet.decrypt(f.read()))
+        except (InvalidToken, ValueError):
+            # Wrong key or a damaged file; start over rather than fail every page
+            return
+        for account, record in records.items():
+            if not record.get('subject'):
+                # Saved before accounts were per user; nobody can be shown to own it
+                continue
+            credentials = google_credentials.Credentials(
+                token=record['token'],
+                refresh_token=record['refresh_token'],
+                token_uri=record['token_uri'],
+                client_id=record['client_id'],
+                client_secret=record['client_secret'],
+                scopes=record['scopes']
+            )
+            if record.get('expiry'):
+                credentials.expiry = datetime.fromisoformat(record['expiry'])
+            self.accounts[account] = {
+                'credentials': credentials,
+                'authorized_at': record.get('authorized_at', 0),
+                'subject': record['subject'],
+                'email': record.get('email')
+            }
+
+    def _save(self):
+        """Encrypt and persist every account; call with the lock held"""
+        records = {
+            account: {
+                'token': entry['credentials'].token,
+                'refresh_token': entry['credentials'].refresh_token,
+                'token_uri': entry['credentials'].token_uri,
+                'client_id': entry['credentials'].client_id,
+                'client_secret': entry['credentials'].client_secret,
+                'scopes': entry['credentials'].scopes,
+                'expiry': entry['credentials'].expiry.isoformat() if entry['credentials'].expiry else None,
+                'authorized_at': entry['authorized_at'],
+                'subject': entry['subject'],
+                'email': entry['email']
+            }
+            for account, entry in self.accounts.items()
+        }
+        write_private(self.path, self.fernet.encrypt(json.dumps(records).encode()))
+
+    def start_flow(self, client_config, redirect_uri):
+        """OAuth flow built from the client config in memory; no secret touches disk"""
+        return oauth_flow.Flow.from_client_config(client_config, scopes=SCOPES, redirect_uri=redirect_uri)
+
+    def complete_flow(self, flow, code):
+        """Exchange an authorization code, persist the credentials and return the signed-in user's account id"""
+        token = flow.fetch_token(code=code)
+        credentials = flow.credentials
+        claims = user_claims(token.get('id_token'), credentials.client_id)
+        account = self.account_id(credentials.client_id, claims['sub'])
+        with self.lock:
+            self.accounts[account] = {
+                'credentials': credentials,
+                'authorized_at': time.time(),
+                'subject': claims['sub'],
+                'email': claims.get('email')
+            }
+            self.refresh_errors.pop(account, None)
+            self._save()
+        return account
+
+    def email(self, account):
+        entry = self.accounts.get(account)
+        return entry['email'] if entry else None
+
+    def credentials(self, account):
+        """Live Credentials for an account, or None if it is not signed in"""
+        entry = self.accounts.get(account)
+        if entry is None:
+            return None
+        credentials = entry['credentials']
+        if not credentials.valid:
+            # The background refresh fell behind (e.g. the server slept); catch up now
+            self._refresh(account, credentials)
+        return credentials
+
+    def remove(self, account):
+        with self.lock:
+            if self.accounts.pop(account, None) is not None:
+                self._save()
+
+    def status(self, account):
+        """Expiry and refresh details for the sidebar"""
+        entry = self.accounts.get(account)
+        if entry is None:
+            return None
+        expiry = entry['credentials'].expiry
+        return {
+            'expires_in': (expiry - datetime.utcnow()).total_seconds() if expiry else None,
+            'refreshes': self.refreshes,
+            'error': self.refresh_errors.get(account)
+        }
+
+    def _refresh(self, account, credentials):
+        try:
+            credentials.refresh(transport_requests.Request())
+        except Exception as e:
+            self.refresh_errors[account] = str(e)
+            return
+        with self.lock:
+            self.refreshes += 1
+            self.refresh_errors.pop(account, None)
+            self._save()
+
+    def _refresh_loop(self):
+        while True:
+            deadline = datetime.utcnow() + timedelta(seconds=REFRESH_MARGIN_SECONDS)
+            for account, entry in list(self.accounts.items()):
+                credentials = entry['credentials']
+                if credentials.refresh_token and (credentials.expiry is None or credentials.expiry <= deadline):
+                    self._refresh(account, credentials)
+            time.sleep(REFRESH_CHECK_SECONDS)
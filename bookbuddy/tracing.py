@@ -0,0 +1,200 @@
+"""Lightweight spans and counters for timing where a rerun spends its time."""
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Optional exports: a JSON lines file, and OpenTelemetry when the package is installed
+TRACE_FILE = os.environ.get('BOOKBUDDY_TRACE_FILE')
+TRACE_OTEL = os.environ.get('BOOKBUDDY_TRACE_OTEL', '').lower() in ('1', 'true', 'yes')
+
+_current_trace = contextvars.ContextVar('bookbuddy_trace', default=None)
+_current_span = contextvars.ContextVar('bookbuddy_span', default=None)
+_span_ids = itertools.count(1)
+_file_lock = threading.Lock()
+
+class Trace:
+    """Spans and counters recorded while one rerun (or any unit of work) runs.
+
+    Spans are plain dicts with ``start_ms`` relative to the start of the
+    trace, so a waterfall can be drawn straight from ``spans``.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.started = time.time()
+        self.perf_start = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self.counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add_span(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self.perf_start) * 1000
+        with self._lock:
+            self.spans.sort(key=lambda record: record['start_ms'])
+        return self
+
+    def to_records(self):
+        """JSON-ready records: one per span, then a summary with the counters"""
+        records = [
+            {'type': 'span', 'trace_id': self.trace_id, 'trace': self.name, **record}
+            for record in self.spans
+        ]
+        records.append({
+            'type': 'trace',
+            'trace_id': self.trace_id,
+            'trace': self.name,
+            'started': self.started,
+            'duration_ms': self.duration_ms,
+            'counters': dict(self.counters)
+        })
+        return records
+
+def start_trace(name):
+    """Make a new trace current for this thread's context and return it"""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+def finish_trace(trace):
+    """Stop recording into ``trace``, export it if configured, and return it"""
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+        _current_span.set(None)
+    trace.finish()
+    if TRACE_FILE:
+        export_json_lines(trace, TRACE_FILE)
+    if TRACE_OTEL:
+        export_otel(trace)
+    return trace
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a span of the current trace; a no-op without one"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    record = {
+        'span_id': next(_span_ids),
+        'parent_id': parent['span_id'] if parent else None,
+        'name': name,
+        'thread': threading.current_thread().name,
+        'attributes': attributes,
+        'error': None
+    }
+    token = _current_span.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        end = time.perf_counter()
+        _current_span.reset(token)
+        record['start_ms'] = (start - trace.perf_start) * 1000
+        record['duration_ms'] = (end - start) * 1000
+        trace.add_span(record)
+
+def traced(name):
+    """Decorator that records every call of the function as a span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def annotate(**attributes):
+    """Add attributes to the innermost open span, if any"""
+    record = _current_span.get()
+    if record is not None:
+        record['attributes'].update(attributes)
+
+def count(name, amount=1):
+    """Add to a counter of the current trace, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count(name, amount)
+
+def bind(fn):
+    """Carry the caller's trace and open span into ``fn`` when it runs on a worker thread"""
+    trace = _current_trace.get()
+    if trace is None:
+        return fn
+    parent = _current_span.get()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+    return wrapper
+
+def export_json_lines(trace, path):
+    """Append the trace to a JSON lines file"""
+    lines = ''.join(json.dumps(record, default=str) + '\n' for record in trace.to_records())
+    with _file_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+def otel_attributes(attributes):
+    """Keep only values OpenTelemetry accepts as attributes"""
+    return {key: value for key, value in attributes.items() if isinstance(value, (str, bool, int, float))}
+
+def export_otel(trace):
+    """Replay the trace as OpenTelemetry spans; needs the opentelemetry package and a configured provider"""
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.trace import Status, StatusCode
+    except ImportError:
+        return
+
+    tracer = otel_trace.get_tracer('bookbuddy')
+    base_ns = int(trace.started * 1e9)
+    root = tracer.start_span(trace.name, start_time=base_ns,
+                             attributes={'bookbuddy.trace_id': trace.trace_id, **otel_attributes(trace.counters)})
+    contexts = {None: otel_trace.set_span_in_context(root)}
+    # Span ids are handed out on entry, so parents always come before their children
+    for record in sorted(trace.spans, key=lambda record: record['span_id']):
+        otel_span = tracer.start_span(
+            record['name'],
+            context=contexts.get(record['parent_id'], contexts[None]),
+            start_time=base_ns + int(record['start_ms'] * 1e6),
+            attributes={'thread.name': record['thread'], **otel_attributes(record['attributes'])}
+        )
+        if record['error']:
+            otel_span.set_status(Status(StatusCode.ERROR, record['error']))
+        contexts[record['span_id']] = otel_trace.set_span_in_context(otel_span)
+        otel_span.end(end_time=base_ns + int((record['start_ms'] + record['duration_ms']) * 1e6))
+    root.end(end_time=base_ns + int(trace.duration_ms * 1e6))
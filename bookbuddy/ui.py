@@ -0,0 +1,494 @@
+"""Streamlit glue shared by the pages: styling, session state, cached resources and Google sign-in."""
+import streamlit as st
+import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import functools
+import json
+import time
+import uuid
+from bookbuddy.docs import DOC_CACHE_DIR, DOC_CACHE_MAX_BYTES, DOC_CACHE_TTL_SECONDS, DocumentCache
+from bookbuddy.google_api import ApiQuota, QuotaGuard, build_service, credentials_key
+from bookbuddy.memory import (
+    GLOBAL_BUDGET_BYTES, SESSION_BUDGET_BYTES, SPILL_DIR, SPILL_MAX_BYTES,
+    MemoryGovernor, SpillCache, Spilled, format_bytes
+)
+from bookbuddy.mirror import SHEET_MIRROR_PATH, SheetMirror
+from bookbuddy.token_store import TOKEN_STORE_DIR, TOKEN_STORE_KEY, TokenStore
+from bookbuddy.tracing import current_trace, finish_trace, span, start_trace, traced
+
+# Signed cookie that lets a browser resume its own Google account in a new session
+ACCOUNT_COOKIE = 'bookbuddy_account'
+ACCOUNT_COOKIE_MAX_AGE = 30 * 24 * 3600
+
+# Styles every page uses; pages append their own classes
+BASE_CSS = """
+    .main-header {
+        text-align: center;
+        padding: 2rem 0;
+        background: linear-gradient(90deg, GRADIENT_START 0%, GRADIENT_END 100%);
+        color: white;
+        border-radius: 10px;
+        margin-bottom: 2rem;
+    }
+
+    .success-message {
+        background: #d4edda;
+        color: #155724;
+        padding: 1rem;
+        border-radius: 8px;
+        border: 1px solid #c3e6cb;
+        margin: 1rem 0;
+    }
+
+    .error-message {
+        background: #f8d7da;
+        color: #721c24;
+        padding: 1rem;
+        border-radius: 8px;
+        border: 1px solid #f5c6cb;
+        margin: 1rem 0;
+    }
+
+    .info-card {
+        background: #e3f2fd;
+        padding: 1.5rem;
+        border-radius: 10px;
+        border-left: 4px solid #2196f3;
+        margin: 1rem 0;
+    }
+"""
+
+AUTH_CSS = """
+    .auth-section {
+        background: #f8f9fa;
+        padding: 2rem;
+        border-radius: 15px;
+        border: 2px solid #e9ecef;
+        margin: 1rem 0;
+    }
+"""
+
+def apply_page_style(gradient, extra_css=''):
+    """Inject the shared CSS with this page's header gradient and any page-specific classes"""
+    css = BASE_CSS.replace('GRADIENT_START', gradient[0]).replace('GRADIENT_END', gradient[1])
+    st.markdown(f"<style>{css}{extra_css}</style>", unsafe_allow_html=True)
+
+def render_header(title, subtitle):
+    st.markdown(f"""
+    <div class="main-header">
+        <h1>{title}</h1>
+        <p>{subtitle}</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+def success_message(text):
+    st.markdown(f"""
+    <div class="success-message">
+        {text}
+    </div>
+    """, unsafe_allow_html=True)
+
+def error_message(text):
+    st.markdown(f"""
+    <div class="error-message">
+        {text}
+    </div>
+    """, unsafe_allow_html=True)
+
+def init_session_state(defaults):
+    """Set each session state key that is not already present"""
+    for key, value in defaults.items():
+        if key not in st.session_state:
+            st.session_state[key] = value
+
+def start_rerun_trace(page):
+    """Start timing this rerun; render_trace_panel finishes and shows it.
+
+    Pages call this first and render_trace_panel last, after
+    govern_session_memory, so the waterfall covers the whole run.
+    """
+    return start_trace(page)
+
+def fragment_only_run():
+    """True while Streamlit reruns just a fragment rather than the whole page"""
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+def traced_view(name):
+    """Trace a fragment body, including reruns of just the fragment"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if current_trace() is not None and not fragment_only_run():
+                with span(name):
+                    return fn(*args, **kwargs)
+            # Fragment-only rerun: time it on its own. A trace still current here is
+            # left over from a page run that st.rerun() cut short
+            trace = start_trace(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                st.session_state.last_fragment_trace = finish_trace(trace)
+        return wrapper
+    return decorator
+
+def span_depths(spans):
+    """Nesting depth of each span, keyed by span id"""
+    parents = {record['span_id']: record['parent_id'] for record in spans}
+    depths = {}
+    for span_id in parents:
+        depth, parent = 0, parents[span_id]
+        while parent in parents:
+            depth, parent = depth + 1, parents[parent]
+        depths[span_id] = depth
+    return depths
+
+def render_trace_panel():
+    """Finish this rerun's trace and show its timing waterfall in the sidebar"""
+    trace = current_trace()
+    if trace is None:
+        return
+    finish_trace(trace)
+
+    with st.sidebar.expander(f"⏱️ Rerun Timing · {trace.duration_ms:.0f} ms"):
+        if trace.spans:
+            depths = span_depths(trace.spans)
+            rows = [
+                {
+                    'span': f"{i + 1:>2}. {'· ' * depths[record['span_id']]}{record['name']}",
+                    'start': record['start_ms'],
+                    'end': record['start_ms'] + record['duration_ms'],
+                    'ms': round(record['duration_ms'], 1),
+                    'thread': record['thread'],
+                    'status': 'error' if record['error'] else 'ok'
+                }
+                for i, record in enumerate(trace.spans)
+            ]
+            st.vega_lite_chart({
+                'data': {'values': rows},
+                'mark': {'type': 'bar', 'cornerRadius': 2},
+                'encoding': {
+                    'y': {'field': 'span', 'type': 'nominal', 'sort': None, 'title': None},
+                    'x': {'field': 'start', 'type': 'quantitative', 'title': 'ms since rerun start'},
+                    'x2': {'field': 'end'},
+                    'color': {
+                        'field': 'status', 'type': 'nominal', 'legend': None,
+                        'scale': {'domain': ['ok', 'error'], 'range': ['#4285f4', '#ea4335']}
+                    },
+                    'tooltip': [{'field': 'span'}, {'field': 'ms'}, {'field': 'thread'}]
+                },
+                'height': 20 * len(rows) + 20
+            }, use_container_width=True)
+        else:
+            st.caption("No instrumented work ran in this rerun")
+        
+        if trace.counters:
+            st.caption(" · ".join(f"{name}: {value:,.0f}" for name, value in sorted(trace.counters.items())))
+        
+        fragment_trace = st.session_state.get('last_fragment_trace')
+        if fragment_trace is not None:
+            st.caption(f"Last fragment-only rerun ({fragment_trace.name}): {fragment_trace.duration_ms:.0f} ms")
+
+@st.cache_resource(show_spinner=False)
+def get_token_store():
+    """The shared token store for every page and session of this server"""
+    return TokenStore(TOKEN_STORE_DIR, TOKEN_STORE_KEY)
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_api_client(api, cred_key, _credentials):
+    """Build and cache a Google API service per (api, credential identity)"""
+    return build_service(api, _credentials)
+
+@st.cache_resource
+def get_quota_guard():
+    """The quota guard shared by every session in this process"""
+    return QuotaGuard()
+
+@st.cache_resource
+def get_document_cache():
+    """The document cache shared by every session in this process"""
+    return DocumentCache(DOC_CACHE_MAX_BYTES, DOC_CACHE_TTL_SECONDS, DOC_CACHE_DIR)
+
+@st.cache_resource(show_spinner=False)
+def get_sheet_mirror():
+    """One mirror connection shared by every session of this server"""
+    return SheetMirror(SHEET_MIRROR_PATH)
+
+@st.cache_resource(show_spinner=False)
+def get_spill_cache():
+    """The spill directory shared by every session of this server"""
+    return SpillCache(SPILL_DIR, SPILL_MAX_BYTES)
+
+@st.cache_resource(show_spinner=False)
+def get_memory_governor():
+    """The memory governor shared by every session of this server"""
+    return MemoryGovernor(SESSION_BUDGET_BYTES, GLOBAL_BUDGET_BYTES, get_spill_cache())
+
+def restore_spilled(value):
+    """``value`` itself, or its contents read back from the spill cache (None if since dropped)"""
+    if isinstance(value, Spilled):
+        return get_spill_cache().load(value)
+    return value
+
+@traced('memory.govern')
+def govern_session_memory(spill_keys=(), history_keys=(), evict_keys=()):
+    """Measure this session's state, enforce the memory budgets and show usage in the sidebar.
+
+    Call at the end of a rerun so everything the run stored is counted.
+    ``spill_keys``, ``history_keys`` and ``evict_keys`` are passed to
+    MemoryGovernor.enforce.
+    """
+    init_session_state({'memory_session_id': uuid.uuid4().hex})
+    report = get_memory_governor().enforce(
+        st.session_state.memory_session_id, st.session_state, spill_keys, history_keys, evict_keys
+    )
+    
+    with st.sidebar.expander(f"🧠 Session Memory · {format_bytes(report['bytes'])}"):
+        st.progress(
+            min(report['bytes'] / report['target'], 1.0) if report['target'] else 1.0,
+            text=f"This session: {format_bytes(report['bytes'])} of {format_bytes(report['target'])}"
+        )
+        st.progress(
+            min(report['global_bytes'] / GLOBAL_BUDGET_BYTES, 1.0),
+            text=f"All {report['sessions']} sessions: {format_bytes(report['global_bytes'])} of {format_bytes(GLOBAL_BUDGET_BYTES)}"
+        )
+        largest = sorted(report['by_key'].items(), key=lambda item: item[1], reverse=True)[:6]
+        st.caption(" · ".join(f"{key}: {format_bytes(size)}" for key, size in largest))
+        if report['spilled_bytes']:
+            st.caption(f"💾 {format_bytes(report['spilled_bytes'])} spilled to disk across sessions")
+        for event in report['actions']:
+            item = f" · {event['item']}" if event['item'] is not None else ""
+            st.caption(f"{'💾' if event['action'] == 'spilled' else '🗑️'} {event['action'].capitalize()} "
+                       f"{event['key']}{item} ({format_bytes(event['bytes'])})")
+    return report
+
+def write_account_cookie(value, max_age):
+    """Set (or with ``max_age=0`` clear) the account cookie in the browser"""
+    components.html(
+        f"<script>window.parent.document.cookie = "
+        f"'{ACCOUNT_COOKIE}={value}; Max-Age={max_age}; Path=/; SameSite=Strict';</script>",
+        height=0
+    )
+
+def sync_google_sign_in():
+    """Resume this browser's own account from its signed cookie, or drop one that was signed out elsewhere"""
+    init_session_state({'google_account': None, 'oauth_flow': None, 'pending_account_cookie': None})
+    token_store = get_token_store()
+
+    # Sign-in and logout rerun straight away, so their cookie change is written on the next run
+    pending = st.session_state.pending_account_cookie
+    if pending is not None:
+        write_account_cookie(*pending)
+        st.session_state.pending_account_cookie = None
+    elif st.session_state.google_account is None:
+        # Only the account this browser signed in with; never anyone else's
+        st.session_state.google_account = token_store.cookie_account(st.context.cookies.get(ACCOUNT_COOKIE))
+
+    if st.session_state.google_account not in token_store.accounts:
+        st.session_state.google_account = None
+    st.session_state.authenticated = st.session_state.google_account is not None
+
+def session_credentials():
+    """Live credentials of this session's account; refreshed in the background by the token store"""
+    return get_token_store().credentials(st.session_state.google_account)
+
+def timed_service(api):
+    """Return the cached service for the current session's credentials and record lookup time"""
+    credentials = session_credentials()
+    start = time.perf_counter()
+    client = get_api_client(api, credentials_key(credentials), credentials)
+    lookup_seconds = time.perf_counter() - start
+    return client['service'], {
+        'build_ms': client['build_seconds'] * 1000,
+        'lookup_ms': lookup_seconds * 1000
+    }
+
+def get_service(api):
+    """Return the cached service for the current session's credentials"""
+    return timed_service(api)[0]
+
+def get_quota(api):
+    """Quota scope for ``api`` under the current session's credentials"""
+    return ApiQuota(get_quota_guard(), api, credentials_key(session_credentials()))
+
+def render_quota_usage():
+    """Sidebar table of this session's API calls, throttling and retries under the shared quota guard"""
+    usage = get_quota_guard().usage(credentials_key(session_credentials()))
+    if not usage:
+        return
+    with st.sidebar:
+        st.subheader("📉 API Quota Usage")
+        st.dataframe(
+            [
+                {
+                    'API': api,
+                    'Calls': int(counters.get('calls', 0)),
+                    'Coalesced': int(counters.get('coalesced', 0)),
+                    'Throttled': int(counters.get('throttled', 0)),
+                    'Retries': int(counters.get('retries', 0)),
+                    'Errors': int(counters.get('errors', 0)),
+                    'Wait (s)': round(counters.get('wait_seconds', 0.0), 1)
+                }
+                for api, counters in sorted(usage.items())
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+
+def render_google_auth_sidebar(reset_on_logout):
+    """Credentials upload, manual configuration and sign-in status; call inside the sidebar.
+
+    ``reset_on_logout`` maps session state keys to the values they get back
+    when the user logs out.
+    """
+    st.title("🔐 Google Authentication")
+
+    # Authentication file upload
+    st.subheader("Upload Credentials")
+    uploaded_file = st.file_uploader(
+        "Upload Google OAuth2 JSON file",
+        type=['json'],
+        help="Upload your Google OAuth2 credentials JSON file from Google Cloud Console"
+    )
+
+    if uploaded_file is not None:
+        try:
+            credentials_data = json.load(uploaded_file)
+            st.session_state.credentials_data = credentials_data
+            st.success("✅ Credentials file loaded successfully!")
+
+            # Display some info about the credentials
+            if 'web' in credentials_data:
+                client_info = credentials_data['web']
+                st.info(f"**Client ID:** {client_info.get('client_id', 'N/A')[:20]}...")
+                st.info(f"**Project ID:** {client_info.get('project_id', 'N/A')}")
+
+        except Exception as e:
+            st.error(f"❌ Error loading credentials: {str(e)}")
+
+    # Manual credentials input
+    st.subheader("Manual Configuration")
+    with st.expander("Enter credentials manually"):
+        client_id = st.text_input("Client ID", type="password")
+        client_secret = st.text_input("Client Secret", type="password")
+        redirect_uri = st.text_input("Redirect URI", value="http://localhost:8501")
+
+        if st.button("Save Manual Credentials"):
+            if client_id and client_secret:
+                manual_creds = {
+                    "web": {
+                        "client_id": client_id,
+                        "client_secret": client_secret,
+                        "redirect_uris": [redirect_uri],
+                        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                        "token_uri": "https://oauth2.googleapis.com/token"
+                    }
+                }
+                st.session_state.credentials_data = manual_creds
+                st.success("Manual credentials saved!")
+
+    # Authentication status
+    st.subheader("Authentication Status")
+    if st.session_state.authenticated:
+        token_store = get_token_store()
+        email = token_store.email(st.session_state.google_account)
+        st.success(f"✅ Authenticated{f' as {email}' if email else ''}")
+        token_status = token_store.status(st.session_state.google_account)
+        if token_status and token_status['error']:
+            st.warning(f"Token refresh failing: {token_status['error']}")
+        elif token_status and token_status['expires_in'] is not None:
+            st.caption(f"🔑 Access token renews in the background · expires in {token_status['expires_in'] / 60:.0f} min")
+        if st.button("🔓 Logout"):
+            token_store.remove(st.session_state.google_account)
+            st.session_state.authenticated = False
+            st.session_state.google_account = None
+            st.session_state.pending_account_cookie = ('', 0)
+            for key, value in reset_on_logout.items():
+                st.session_state[key] = value
+            st.rerun()
+    else:
+        st.warning("❌ Not authenticated")
+    if not TOKEN_STORE_KEY:
+        st.caption("⚠️ BOOKBUDDY_TOKEN_KEY is not set, so saved tokens are encrypted with a key stored beside them")
+
+def authenticate_google():
+    """Start the Google OAuth2 flow; the code is exchanged in render_auth_prompt"""
+    if 'credentials_data' not in st.session_state:
+        st.error("Please upload credentials file first!")
+        return False
+
+    try:
+        client_info = next(iter(st.session_state.credentials_data.values()))
+        redirect_uri = (client_info.get('redirect_uris') or ['http://localhost:8501'])[0]
+        # The flow keeps its PKCE verifier, so it must survive until the code comes back
+        st.session_state.oauth_flow = get_token_store().start_flow(st.session_state.credentials_data, redirect_uri)
+        return True
+    except Exception as e:
+        st.error(f"❌ Error setting up authentication: {str(e)}")
+        return False
+
+def render_auth_prompt():
+    """Show the consent link and exchange the pasted authorization code"""
+    flow = st.session_state.oauth_flow
+    auth_url, _ = flow.authorization_url(prompt='consent', access_type='offline')
+
+    st.markdown(f"""
+    <div class="info-card">
+        <h4>🔗 Authentication Required</h4>
+        <p>Click the link below to authenticate with Google:</p>
+        <a href="{auth_url}" target="_blank" style="color: #1976d2; font-weight: bold;">
+            🔐 Authenticate with Google
+        </a>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Input for authorization code
+    auth_code = st.text_input(
+        "Enter authorization code:",
+        help="Copy the authorization code from the redirect URL"
+    )
+
+    if auth_code:
+        try:
+            token_store = get_token_store()
+            st.session_state.google_account = token_store.complete_flow(flow, auth_code)
+            st.session_state.authenticated = True
+            st.session_state.pending_account_cookie = (
+                token_store.account_cookie(st.session_state.google_account), ACCOUNT_COOKIE_MAX_AGE
+            )
+            st.session_state.oauth_flow = None
+            st.success("✅ Authentication successful!")
+            st.rerun()
+        except Exception as e:
+            st.error(f"❌ Authentication failed: {str(e)}")
+
+def render_sign_in(subject, api_names):
+    """Main-area sign-in panel with setup instructions"""
+    st.markdown("""
+    <div class="auth-section">
+    """, unsafe_allow_html=True)
+
+    st.markdown("### 🔐 Authentication Required")
+    st.markdown(f"""
+    To view {subject}, you need to authenticate with Google. Please upload your
+    OAuth2 credentials file in the sidebar and follow the authentication process.
+    """)
+
+    if st.button("🚀 Start Authentication", use_container_width=True):
+        authenticate_google()
+    if st.session_state.oauth_flow is not None:
+        render_auth_prompt()
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    # Instructions for getting credentials
+    with st.expander("📋 How to get Google OAuth2 credentials"):
+        st.markdown(f"""
+        1. Go to [Google Cloud Console](https://console.cloud.google.com/)
+        2. Create a new project or select existing one
+        3. Enable {api_names}
+        4. Go to "Credentials" → "Create Credentials" → "OAuth 2.0 Client IDs"
+        5. Set application type to "Web application"
+        6. Add `http://localhost:8501` to authorized redirect URIs
+        7. Download the JSON file and upload it here
+        """)
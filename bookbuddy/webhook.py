@@ -0,0 +1,100 @@
+"""n8n webhook client for recordings and sheet change sets."""
+import functools
+import json
+import operator
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bookbuddy.audio import AUDIO_FORMATS, encode_audio
+from bookbuddy.lazy import lazy_import
+from bookbuddy.tracing import bind, count, traced
+
+requests = lazy_import('requests')
+
+# Per-thread HTTP sessions so concurrent uploads reuse their connections
+_http_local = threading.local()
+
+def get_http_session():
+    """Return a requests session bound to the calling thread"""
+    session = getattr(_http_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        _http_local.session = session
+    return session
+
+@traced('webhook.post_recording')
+def send_recording_to_webhook(webhook_url, recording_info, audio_bytes, audio_format='WAV'):
+    """Post a single recording to the n8n webhook and return (status_code, seconds)"""
+    spec = AUDIO_FORMATS[audio_format]
+    start = time.perf_counter()
+    files = {"file": (f"{recording_info['name']}.{spec['ext']}", audio_bytes, spec['mime'])}
+    data = {
+        "name": recording_info['name'],
+        "timestamp": recording_info['timestamp'],
+        "duration": recording_info['duration'],
+        "sample_rate": recording_info['sample_rate'],
+        "format": audio_format,
+        "original_hash": recording_info['original_hash']
+    }
+    response = get_http_session().post(webhook_url, files=files, data=data, timeout=30)
+    count('webhook.posts')
+    count('webhook.bytes', len(audio_bytes))
+    return response.status_code, time.perf_counter() - start
+
+def encode_and_send(webhook_url, recording_info, load_wav, audio_format, bitrate_kbps):
+    """Load, encode and post one recording; returns (status_code, seconds, encoded_size)"""
+    payload, _ = encode_audio(load_wav(), audio_format, bitrate_kbps)
+    status_code, seconds = send_recording_to_webhook(webhook_url, recording_info, payload, audio_format)
+    return status_code, seconds, len(payload)
+
+@traced('webhook.send_batch')
+def send_recordings_concurrently(webhook_url, recordings, audio_store, max_workers,
+                                 audio_format='WAV', bitrate_kbps=64, on_result=None):
+    """Send several recordings through a bounded thread pool.
+
+    ``on_result`` is called from the calling thread as each upload finishes,
+    so it is safe to update Streamlit elements from it.
+    """
+    results = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Each worker reads its own take, so a spilled store is only loaded max_workers takes at a time
+        futures = {
+            executor.submit(
+                bind(encode_and_send), webhook_url, rec,
+                functools.partial(operator.getitem, audio_store, rec['hash']), audio_format, bitrate_kbps
+            ): rec
+            for rec in recordings
+        }
+        for future in as_completed(futures):
+            rec = futures[future]
+            result = {
+                'name': rec['name'],
+                'size_kb': rec.get('size_kb', 0.0),
+                'status': None,
+                'seconds': None,
+                'error': None
+            }
+            try:
+                result['status'], result['seconds'], encoded_size = future.result()
+                result['size_kb'] = encoded_size / 1024
+            except Exception as e:
+                result['error'] = str(e)
+            results.append(result)
+            if on_result:
+                on_result(result, len(results), len(recordings))
+    return results, time.perf_counter() - start
+
+@traced('webhook.post_changes')
+def post_change_sets(url, spreadsheet_id, change_sets):
+    """Send change sets to a downstream webhook"""
+    # Change set records are already plain values; allow_nan=False keeps bare NaN out of the JSON
+    payload = json.dumps(
+        {'spreadsheet_id': spreadsheet_id, 'changes': change_sets},
+        default=str,
+        allow_nan=False
+    )
+    response = requests.post(url, data=payload, headers={'Content-Type': 'application/json'}, timeout=30)
+    count('webhook.posts')
+    count('webhook.bytes', len(payload))
+    response.raise_for_status()
@@ -1,14 +1,23 @@
 import streamlit as st
-import json
-import requests
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-import os
-import tempfile
-from datetime import datetime
-import pandas as pd
+import html
+import random
+import time
+from bookbuddy.docs import (
+    DOC_FIELDS, block_to_markdown, check_watch_list, diff_paragraphs, fetch_document, join_blocks,
+    section_blocks, split_paragraphs, split_sections
+)
+from bookbuddy.google_api import execute_measured
+from bookbuddy.lazy import lazy_import
+from bookbuddy.tracing import traced
+from bookbuddy.ui import (
+    AUTH_CSS, apply_page_style, get_document_cache, get_quota, get_service, govern_session_memory,
+    init_session_state, render_google_auth_sidebar, render_header, render_quota_usage, render_sign_in,
+    render_trace_panel, start_rerun_trace, sync_google_sign_in, timed_service, traced_view
+)
+
+# Loaded on first use, so the sign-in screen renders without them
+pd = lazy_import('pandas')
+errors = lazy_import('googleapiclient.errors')
 
 # Page configuration
 st.set_page_config(
@@ -18,26 +27,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+start_rerun_trace("Docs Viewer")
+
 # Custom CSS
-st.markdown("""
-<style>
-    .main-header {
-        text-align: center;
-        padding: 2rem 0;
-        background: linear-gradient(90deg, #4285f4 0%, #34a853 100%);
-        color: white;
-        border-radius: 10px;
-        margin-bottom: 2rem;
-    }
-    
-    .auth-section {
-        background: #f8f9fa;
-        padding: 2rem;
-        border-radius: 15px;
-        border: 2px solid #e9ecef;
-        margin: 1rem 0;
-    }
-    
+apply_page_style(('#4285f4', '#34a853'), AUTH_CSS + """
     .doc-content {
         background: white;
         padding: 2rem;
@@ -48,116 +41,54 @@ st.markdown("""
         overflow-y: auto;
     }
     
-    .success-message {
-        background: #d4edda;
-        color: #155724;
-        padding: 1rem;
-        border-radius: 8px;
-        border: 1px solid #c3e6cb;
-        margin: 1rem 0;
+    .diff-block {
+        padding: 0.5rem 1rem;
+        border-radius: 6px;
+        margin: 0.25rem 0;
+        white-space: pre-wrap;
     }
     
-    .error-message {
-        background: #f8d7da;
-        color: #721c24;
-        padding: 1rem;
-        border-radius: 8px;
-        border: 1px solid #f5c6cb;
-        margin: 1rem 0;
+    .diff-inserted {
+        background: #e6ffed;
+        border-left: 4px solid #34a853;
     }
     
-    .info-card {
-        background: #e3f2fd;
-        padding: 1.5rem;
-        border-radius: 10px;
-        border-left: 4px solid #2196f3;
-        margin: 1rem 0;
+    .diff-removed {
+        background: #ffeef0;
+        border-left: 4px solid #ea4335;
+        text-decoration: line-through;
+        color: #6a737d;
     }
-</style>
-""", unsafe_allow_html=True)
+    
+    .diff-modified {
+        background: #fff8e1;
+        border-left: 4px solid #fbbc04;
+    }
+""")
 
 # Initialize session state
-if 'google_credentials' not in st.session_state:
-    st.session_state.google_credentials = None
-if 'authenticated' not in st.session_state:
-    st.session_state.authenticated = False
-if 'doc_content' not in st.session_state:
-    st.session_state.doc_content = None
-if 'doc_metadata' not in st.session_state:
-    st.session_state.doc_metadata = None
-
-# Google API configuration
-SCOPES = [
-    'https://www.googleapis.com/auth/documents.readonly',
-    'https://www.googleapis.com/auth/drive.readonly'
-]
+sync_google_sign_in()
+init_session_state({
+    'doc_content': None,
+    'doc_metadata': None,
+    'fetch_stats': None,
+    'doc_changes': None,
+    'poll_stats': {'polls': 0, 'skipped': 0, 'fetched': 0, 'last_poll_ms': None},
+    'last_fetch_time': 0.0,
+    # Spread sessions' polls so many open tabs don't hit the API in lockstep
+    'refresh_jitter': random.random()
+})
 
 # Main header
-st.markdown("""
-<div class="main-header">
-    <h1>📄 Google Docs Live Viewer</h1>
-    <p>View and monitor Google Documents in real-time</p>
-</div>
-""", unsafe_allow_html=True)
+render_header("📄 Google Docs Live Viewer", "View and monitor Google Documents in real-time")
 
 # Sidebar for authentication
 with st.sidebar:
-    st.title("🔐 Google Authentication")
-    
-    # Authentication file upload
-    st.subheader("Upload Credentials")
-    uploaded_file = st.file_uploader(
-        "Upload Google OAuth2 JSON file",
-        type=['json'],
-        help="Upload your Google OAuth2 credentials JSON file from Google Cloud Console"
-    )
-    
-    if uploaded_file is not None:
-        try:
-            credentials_data = json.load(uploaded_file)
-            st.session_state.credentials_data = credentials_data
-            st.success("✅ Credentials file loaded successfully!")
-            
-            # Display some info about the credentials
-            if 'web' in credentials_data:
-                client_info = credentials_data['web']
-                st.info(f"**Client ID:** {client_info.get('client_id', 'N/A')[:20]}...")
-                st.info(f"**Project ID:** {client_info.get('project_id', 'N/A')}")
-            
-        except Exception as e:
-            st.error(f"❌ Error loading credentials: {str(e)}")
-    
-    # Manual credentials input
-    st.subheader("Manual Configuration")
-    with st.expander("Enter credentials manually"):
-        client_id = st.text_input("Client ID", type="password")
-        client_secret = st.text_input("Client Secret", type="password")
-        redirect_uri = st.text_input("Redirect URI", value="http://localhost:8501")
-        
-        if st.button("Save Manual Credentials"):
-            if client_id and client_secret:
-                manual_creds = {
-                    "web": {
-                        "client_id": client_id,
-                        "client_secret": client_secret,
-                        "redirect_uris": [redirect_uri],
-                        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                        "token_uri": "https://oauth2.googleapis.com/token"
-                    }
-                }
-                st.session_state.credentials_data = manual_creds
-                st.success("Manual credentials saved!")
-    
-    # Authentication status
-    st.subheader("Authentication Status")
-    if st.session_state.authenticated:
-        st.success("✅ Authenticated")
-        if st.button("🔓 Logout"):
-            st.session_state.authenticated = False
-            st.session_state.google_credentials = None
-            st.rerun()
-    else:
-        st.warning("❌ Not authenticated")
+    render_google_auth_sidebar({
+        'fetch_stats': None,
+        'doc_changes': None,
+        'poll_stats': {'polls': 0, 'skipped': 0, 'fetched': 0, 'last_poll_ms': None}
+    })
     
     # Document settings
     st.subheader("📄 Document Settings")
@@ -166,162 +97,226 @@ with st.sidebar:
         help="Enter the Google Document ID from the URL"
     )
     
-    auto_refresh = st.checkbox("Auto-refresh (30s)", value=False)
+    section_level = st.select_slider(
+        "Split sections at heading level",
+        options=[1, 2, 3, 4, 5, 6],
+        value=1,
+        help="Long documents are shown one section at a time"
+    )
+    
+    # Watch list
+    st.subheader("👀 Watch List")
+    watch_list_text = st.text_area(
+        "Doc IDs to watch",
+        placeholder="One Google Doc ID per line",
+        help="All watched docs are checked together on the dashboard"
+    )
+    watch_workers = st.slider("Max parallel fetches", min_value=1, max_value=16, value=8)
+    
+    auto_refresh = st.checkbox("Auto-refresh", value=False)
+    refresh_interval = st.select_slider(
+        "Refresh interval (seconds)",
+        options=[15, 30, 60, 120, 300, 600],
+        value=30,
+        disabled=not auto_refresh
+    )
     
     if auto_refresh:
-        st.info("🔄 Auto-refresh enabled")
+        st.info(f"🔄 Auto-refresh every {refresh_interval}s")
+
+def compare_field_mask(doc_id):
+    """Fetch a document with and without the field mask and compare the cost"""
+    service = get_service('docs')
+    quota = get_quota('docs')
+    rows = []
+    for label, fields in [("Full document", None), ("Field mask", DOC_FIELDS)]:
+        _, measured = execute_measured(service.documents().get(documentId=doc_id, fields=fields), quota)
+        rows.append({
+            'Fetch': label,
+            'Response (KB)': measured['response_bytes'] / 1024,
+            'Parse (ms)': measured['parse_ms'],
+            'Total (ms)': measured['request_ms']
+        })
+    return pd.DataFrame(rows)
 
-# Main content area
-def authenticate_google():
-    """Handle Google OAuth2 authentication"""
-    if 'credentials_data' not in st.session_state:
-        st.error("Please upload credentials file first!")
-        return False
+def get_document_sections(section_level):
+    """Return (block spans, sections) for the current document, recomputed only when it changes"""
+    metadata = st.session_state.doc_metadata or {}
+    content = st.session_state.doc_content or ''
+    spans = metadata.get('block_spans')
+    if spans is None:
+        _, spans = join_blocks({'type': 'paragraph', 'level': 0, 'text': p} for p in split_paragraphs(content))
     
-    try:
-        # Create a temporary file for credentials
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            json.dump(st.session_state.credentials_data, f)
-            temp_creds_path = f.name
-        
-        # Create OAuth2 flow
-        flow = Flow.from_client_secrets_file(
-            temp_creds_path,
-            scopes=SCOPES,
-            redirect_uri='http://localhost:8501'
-        )
-        
-        # Generate authorization URL
-        auth_url, _ = flow.authorization_url(prompt='consent')
-        
-        st.markdown(f"""
-        <div class="info-card">
-            <h4>🔗 Authentication Required</h4>
-            <p>Click the link below to authenticate with Google:</p>
-            <a href="{auth_url}" target="_blank" style="color: #1976d2; font-weight: bold;">
-                🔐 Authenticate with Google
-            </a>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Input for authorization code
-        auth_code = st.text_input(
-            "Enter authorization code:",
-            help="Copy the authorization code from the redirect URL"
-        )
-        
-        if auth_code:
-            try:
-                # Exchange code for credentials
-                flow.fetch_token(code=auth_code)
-                credentials = flow.credentials
-                
-                # Store credentials in session state
-                st.session_state.google_credentials = {
-                    'token': credentials.token,
-                    'refresh_token': credentials.refresh_token,
-                    'token_uri': credentials.token_uri,
-                    'client_id': credentials.client_id,
-                    'client_secret': credentials.client_secret,
-                    'scopes': credentials.scopes
-                }
-                st.session_state.authenticated = True
-                
-                # Clean up temp file
-                os.unlink(temp_creds_path)
-                
-                st.success("✅ Authentication successful!")
-                st.rerun()
-                
-            except Exception as e:
-                st.error(f"❌ Authentication failed: {str(e)}")
-                os.unlink(temp_creds_path)
-        
-        return False
-        
-    except Exception as e:
-        st.error(f"❌ Error setting up authentication: {str(e)}")
-        return False
+    key = (metadata.get('document_id'), metadata.get('drive_version') or metadata.get('revision_id'),
+           section_level, len(spans))
+    if st.session_state.get('doc_sections_key') != key:
+        st.session_state.doc_sections = split_sections(content, spans, section_level)
+        st.session_state.doc_sections_key = key
+        if st.session_state.get('doc_section', 0) >= len(st.session_state.doc_sections):
+            st.session_state.doc_section = 0
+    return spans, st.session_state.doc_sections
+
+def step_section(offset):
+    """Move the section navigator by ``offset`` (used as a button callback)"""
+    count = len(st.session_state.get('doc_sections', []))
+    if count:
+        st.session_state.doc_section = min(max(st.session_state.get('doc_section', 0) + offset, 0), count - 1)
 
 def get_google_doc_content(doc_id):
     """Fetch Google Doc content"""
-    if not st.session_state.authenticated or not st.session_state.google_credentials:
+    if not st.session_state.authenticated or not st.session_state.google_account:
         return None, None
     
     try:
-        # Create credentials object
-        creds = Credentials(
-            token=st.session_state.google_credentials['token'],
-            refresh_token=st.session_state.google_credentials['refresh_token'],
-            token_uri=st.session_state.google_credentials['token_uri'],
-            client_id=st.session_state.google_credentials['client_id'],
-            client_secret=st.session_state.google_credentials['client_secret'],
-            scopes=st.session_state.google_credentials['scopes']
-        )
+        # Reuse the cached service
+        service, stats = timed_service('docs')
+        content, metadata, measured = fetch_document(service, get_quota('docs'), doc_id)
+        stats.update(measured)
+        st.session_state.fetch_stats = stats
+        return content, metadata
         
-        # Build the service
-        service = build('docs', 'v1', credentials=creds)
-        
-        # Retrieve the document
-        document = service.documents().get(documentId=doc_id).execute()
-        
-        # Extract text content
-        content = []
-        for element in document.get('body', {}).get('content', []):
-            if 'paragraph' in element:
-                paragraph = element['paragraph']
-                for text_run in paragraph.get('elements', []):
-                    if 'textRun' in text_run:
-                        content.append(text_run['textRun']['content'])
-        
-        # Document metadata
-        metadata = {
-            'title': document.get('title', 'Untitled'),
-            'document_id': document.get('documentId'),
-            'revision_id': document.get('revisionId'),
-            'created_time': document.get('createdTime'),
-            'modified_time': document.get('modifiedTime')
-        }
-        
-        return ''.join(content), metadata
-        
-    except HttpError as e:
+    except errors.HttpError as e:
         st.error(f"❌ Google API Error: {str(e)}")
         return None, None
     except Exception as e:
         st.error(f"❌ Error fetching document: {str(e)}")
         return None, None
 
-# Main interface
-if not st.session_state.authenticated:
-    st.markdown("""
-    <div class="auth-section">
-    """, unsafe_allow_html=True)
+def get_drive_version(doc_id):
+    """Cheap change check: Drive modifiedTime and version for a file"""
+    service = get_service('drive')
+    return get_quota('drive').execute(
+        service.files().get(fileId=doc_id, fields='modifiedTime,version'),
+        coalesce_key=('files.get', doc_id)
+    )
+
+def refresh_watch_list(doc_ids, max_workers):
+    """Check every watched doc in one batch and fetch changed ones in parallel"""
+    rows, stats = check_watch_list(
+        get_service('drive'), get_service('docs'), get_quota('drive'), get_quota('docs'),
+        get_document_cache(), doc_ids, max_workers
+    )
+    return pd.DataFrame(rows), stats
+
+@traced('docs.watch_dashboard')
+def render_watch_dashboard():
+    """Summary table for every document on the watch list"""
+    st.markdown("### 👀 Watch Dashboard")
+    doc_ids = list(dict.fromkeys(
+        part.strip() for part in watch_list_text.replace(',', '\n').split('\n') if part.strip()
+    ))
+    if not doc_ids:
+        st.info("Add document IDs to the watch list in the sidebar")
+        return
     
-    st.markdown("### 🔐 Authentication Required")
-    st.markdown("""
-    To view Google Docs, you need to authenticate with Google. Please upload your 
-    OAuth2 credentials file in the sidebar and follow the authentication process.
-    """)
+    if st.button(f"🔄 Check {len(doc_ids)} Watched Docs"):
+        try:
+            with st.spinner("Checking watched documents..."):
+                st.session_state.watch_results = refresh_watch_list(doc_ids, watch_workers)
+        except Exception as e:
+            st.error(f"❌ Watch refresh failed: {str(e)}")
     
-    if st.button("🚀 Start Authentication", use_container_width=True):
-        authenticate_google()
+    if st.session_state.get('watch_results'):
+        summary_df, watch_stats = st.session_state.watch_results
+        st.dataframe(
+            summary_df,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "Latency (ms)": st.column_config.NumberColumn("Latency (ms)", format="%.0f")
+            }
+        )
+        st.caption(
+            f"{watch_stats['docs']} docs checked in one batched metadata round "
+            f"({watch_stats['batch_ms']:.0f} ms); {watch_stats['fetched']} changed docs fetched "
+            f"in parallel ({watch_stats['fetch_ms']:.0f} ms)"
+        )
+
+def render_changes(changes):
+    """Render only the changed paragraphs with insert/remove/modify highlighting"""
+    for change in changes:
+        if change['type'] == 'inserted':
+            body = html.escape(change['new'])
+        elif change['type'] == 'removed':
+            body = html.escape(change['old'])
+        else:
+            body = (f"{html.escape(change['new'])}<br>"
+                    f"<small><s>{html.escape(change['old'])}</s></small>")
+        st.markdown(
+            f'<div class="diff-block diff-{change["type"]}">'
+            f'<small>¶{change["index"] + 1} · {change["type"]}</small><br>{body}</div>',
+            unsafe_allow_html=True
+        )
+
+def set_document(content, metadata):
+    """Store a new document revision, diffing it against the one it replaces"""
+    previous = st.session_state.doc_metadata
+    if (previous and st.session_state.doc_content is not None
+            and previous.get('document_id') == metadata.get('document_id')):
+        from_revision = previous.get('drive_version') or previous.get('revision_id')
+        if content != st.session_state.doc_content:
+            st.session_state.doc_changes = {
+                'from_revision': from_revision,
+                'changes': diff_paragraphs(
+                    split_paragraphs(st.session_state.doc_content), split_paragraphs(content)
+                )
+            }
+        elif from_revision != (metadata.get('drive_version') or metadata.get('revision_id')):
+            # A new revision with the same text; the last diff no longer leads up to it
+            st.session_state.doc_changes = None
+    else:
+        st.session_state.doc_changes = None
+    st.session_state.doc_content = content
+    st.session_state.doc_metadata = metadata
+
+@traced('docs.refresh')
+def refresh_document(doc_id):
+    """Fetch the document into session state, skipping the download if Drive reports no change"""
+    poll_stats = st.session_state.poll_stats
+    st.session_state.last_fetch_time = time.time()
+    
+    drive_info = None
+    try:
+        start = time.perf_counter()
+        drive_info = get_drive_version(doc_id)
+        poll_stats['last_poll_ms'] = (time.perf_counter() - start) * 1000
+        poll_stats['polls'] += 1
+    except Exception as e:
+        # Without a version we can't tell if anything changed; fall back to a full fetch
+        st.warning(f"Change check unavailable, fetching full document: {str(e)}")
     
-    st.markdown("</div>", unsafe_allow_html=True)
+    cached = st.session_state.doc_metadata
+    if (drive_info and cached and st.session_state.doc_content is not None
+            and cached.get('document_id') == doc_id
+            and cached.get('drive_version') == drive_info.get('version')):
+        poll_stats['skipped'] += 1
+        return
     
-    # Instructions for getting credentials
-    with st.expander("📋 How to get Google OAuth2 credentials"):
-        st.markdown("""
-        1. Go to [Google Cloud Console](https://console.cloud.google.com/)
-        2. Create a new project or select existing one
-        3. Enable Google Docs API and Google Drive API
-        4. Go to "Credentials" → "Create Credentials" → "OAuth 2.0 Client IDs"
-        5. Set application type to "Web application"
-        6. Add `http://localhost:8501` to authorized redirect URIs
-        7. Download the JSON file and upload it here
-        """)
+    # The Drive check above ran with this session's credentials, so a hit on
+    # the shared cache only ever serves revisions the user can already read
+    doc_cache = get_document_cache()
+    if drive_info:
+        shared = doc_cache.get(doc_id, drive_info.get('version'))
+        if shared is not None:
+            poll_stats['shared_hits'] = poll_stats.get('shared_hits', 0) + 1
+            set_document(*shared)
+            return
+    
+    content, metadata = get_google_doc_content(doc_id)
+    if content is not None:
+        poll_stats['fetched'] += 1
+        if drive_info:
+            metadata['drive_version'] = drive_info.get('version')
+            metadata['modified_time'] = drive_info.get('modifiedTime')
+            doc_cache.put(doc_id, metadata['drive_version'], content, metadata)
+        set_document(content, metadata)
 
-else:
+@traced_view('docs.document_view')
+def render_document_view():
+    """Render the document viewer, refetching when an auto-refresh is due"""
+    if auto_refresh and doc_id and time.time() - st.session_state.last_fetch_time >= refresh_interval:
+        refresh_document(doc_id)
+    
     # Document viewer interface
     col1, col2 = st.columns([3, 1])
     
@@ -329,20 +324,22 @@ else:
         st.markdown("### 📄 Document Viewer")
         
         if doc_id:
+            spans, sections = get_document_sections(section_level)
+            current = sections[st.session_state.get('doc_section', 0)] if sections else None
+            
             # Fetch document button
             col_a, col_b, col_c = st.columns(3)
             with col_a:
                 if st.button("🔄 Refresh Document", use_container_width=True):
                     with st.spinner("Fetching document..."):
-                        content, metadata = get_google_doc_content(doc_id)
-                        if content is not None:
-                            st.session_state.doc_content = content
-                            st.session_state.doc_metadata = metadata
+                        refresh_document(doc_id)
             
             with col_b:
-                if st.button("📋 Copy Content", use_container_width=True):
-                    if st.session_state.doc_content:
-                        st.code(st.session_state.doc_content)
+                if st.button("📋 Copy Section", use_container_width=True):
+                    if current:
+                        st.code('\n'.join(block['text'] for block in section_blocks(
+                            st.session_state.doc_content, spans, current[1], current[2]
+                        )))
             
             with col_c:
                 if st.button("💾 Download as Text", use_container_width=True):
@@ -356,6 +353,10 @@ else:
             
             # Display document content
             if st.session_state.doc_content:
+                # Pick up a revision fetched by the refresh button above
+                spans, sections = get_document_sections(section_level)
+                current = sections[st.session_state.get('doc_section', 0)] if sections else None
+                
                 # Document metadata
                 if st.session_state.doc_metadata:
                     metadata = st.session_state.doc_metadata
@@ -363,12 +364,54 @@ else:
                     st.markdown(f"**Last Modified:** {metadata.get('modified_time', 'N/A')}")
                     st.markdown(f"**Document ID:** {metadata.get('document_id', 'N/A')}")
                 
+                # Changes since the previous revision
+                view_mode = "Full document"
+                doc_changes = st.session_state.doc_changes
+                if doc_changes:
+                    changes = doc_changes['changes']
+                    counts = {kind: sum(1 for c in changes if c['type'] == kind)
+                              for kind in ('inserted', 'removed', 'modified')}
+                    st.markdown(
+                        f"**🔀 Changes since revision {doc_changes['from_revision']}:** "
+                        f"{counts['inserted']} inserted, {counts['removed']} removed, "
+                        f"{counts['modified']} modified"
+                    )
+                    view_mode = st.radio(
+                        "View",
+                        ["Changes only", "Full document"],
+                        horizontal=True,
+                        label_visibility="collapsed"
+                    )
+                
                 # Document content
                 st.markdown("""
                 <div class="doc-content">
                 """, unsafe_allow_html=True)
                 
-                st.markdown(st.session_state.doc_content)
+                if view_mode == "Changes only":
+                    render_changes(doc_changes['changes'])
+                elif current:
+                    # Only the visible section is serialized to the browser
+                    if len(sections) > 1:
+                        nav_prev, nav_select, nav_next = st.columns([1, 4, 1])
+                        with nav_prev:
+                            st.button("◀", on_click=step_section, args=(-1,), use_container_width=True,
+                                      disabled=st.session_state.get('doc_section', 0) == 0)
+                        with nav_select:
+                            st.selectbox(
+                                "Section",
+                                range(len(sections)),
+                                format_func=lambda i: f"{i + 1}. {sections[i][0]}",
+                                key="doc_section",
+                                label_visibility="collapsed"
+                            )
+                        with nav_next:
+                            st.button("▶", on_click=step_section, args=(1,), use_container_width=True,
+                                      disabled=st.session_state.get('doc_section', 0) >= len(sections) - 1)
+                    st.markdown('\n\n'.join(
+                        block_to_markdown(block)
+                        for block in section_blocks(st.session_state.doc_content, spans, current[1], current[2])
+                    ))
                 
                 st.markdown("</div>", unsafe_allow_html=True)
             
@@ -386,8 +429,8 @@ else:
             
             # Document statistics
             if st.session_state.doc_content:
-                word_count = len(st.session_state.doc_content.split())
-                char_count = len(st.session_state.doc_content)
+                word_count = metadata.get('word_count', len(st.session_state.doc_content.split()))
+                char_count = metadata.get('char_count', len(st.session_state.doc_content))
                 
                 st.metric("Word Count", word_count)
                 st.metric("Character Count", char_count)
@@ -403,6 +446,35 @@ else:
                 st.markdown(f"**Last Updated:**")
                 st.text(metadata['modified_time'])
         
+        # API timing
+        if st.session_state.fetch_stats:
+            stats = st.session_state.fetch_stats
+            st.markdown("### ⏱️ API Timing")
+            st.metric("Client Build (one-off)", f"{stats['build_ms']:.0f} ms")
+            st.metric("Client Lookup", f"{stats['lookup_ms']:.1f} ms")
+            st.metric("Request", f"{stats['request_ms']:.0f} ms")
+            st.metric("Response Size", f"{stats['response_bytes'] / 1024:.1f} KB")
+            st.metric("JSON Parse", f"{stats['parse_ms']:.1f} ms")
+            st.caption(f"Saved per fetch by caching: ~{stats['build_ms'] - stats['lookup_ms']:.0f} ms")
+        
+        # Change polling
+        poll_stats = st.session_state.poll_stats
+        if poll_stats['polls']:
+            st.markdown("### 🔍 Change Polling")
+            st.metric("Change Checks", poll_stats['polls'])
+            st.metric("Skipped Downloads", poll_stats['skipped'])
+            st.metric("Full Fetches", poll_stats['fetched'])
+            st.metric("Shared Cache Hits", poll_stats.get('shared_hits', 0))
+            if poll_stats['last_poll_ms'] is not None:
+                st.caption(f"Last change check: {poll_stats['last_poll_ms']:.0f} ms")
+            
+            cache_stats = get_document_cache().stats()
+            st.caption(
+                f"Shared cache: {cache_stats['entries']} docs, "
+                f"{cache_stats['bytes'] / (1024 * 1024):.1f} MB, "
+                f"{cache_stats['hits']} hits / {cache_stats['misses']} misses"
+            )
+        
         # Quick actions
         st.markdown("### ⚡ Quick Actions")
         
@@ -414,12 +486,32 @@ else:
             if doc_id:
                 share_url = f"https://docs.google.com/document/d/{doc_id}/edit"
                 st.code(share_url)
+        
+        if st.button("📏 Measure Field Mask", use_container_width=True):
+            if doc_id:
+                try:
+                    with st.spinner("Fetching full and masked document..."):
+                        st.dataframe(compare_field_mask(doc_id), use_container_width=True, hide_index=True)
+                except Exception as e:
+                    st.error(f"❌ Measurement failed: {str(e)}")
+
+# Main interface
+if not st.session_state.authenticated:
+    render_sign_in("Google Docs", "Google Docs API and Google Drive API")
+
+else:
+    # Only the viewer reruns on the timer; no script thread sleeps between polls
+    run_every = None
+    if auto_refresh and doc_id:
+        run_every = refresh_interval * (1 + 0.1 * st.session_state.refresh_jitter)
+    st.fragment(run_every=run_every)(render_document_view)()
+    
+    st.markdown("---")
+    render_watch_dashboard()
 
-# Auto-refresh functionality
-if auto_refresh and st.session_state.authenticated and doc_id:
-    import time
-    time.sleep(30)
-    st.rerun()
+# API quota usage (rendered last so it includes this run's calls)
+if st.session_state.authenticated and st.session_state.google_account:
+    render_quota_usage()
 
 # Footer
 st.markdown("---")
@@ -430,3 +522,8 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Over budget, the diff and watch results go first, then the document itself (refetched on the next refresh)
+govern_session_memory(evict_keys=(
+    'doc_changes', 'watch_results', ('doc_content', 'doc_metadata', 'doc_sections', 'doc_sections_key')
+))
+render_trace_panel()
@@ -1,432 +1,464 @@
 import streamlit as st
-import json
-import requests
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-import os
-import tempfile
-from datetime import datetime
-import pandas as pd
+import random
+import time
+from bookbuddy.lazy import lazy_import
+from bookbuddy.sheets import SheetWriteBuffer, diff_snapshots, fetch_sheet_ranges, snapshot_hashes, split_a1
+from bookbuddy.tracing import traced
+from bookbuddy.ui import (
+    AUTH_CSS, apply_page_style, get_quota, get_service, get_sheet_mirror, govern_session_memory,
+    init_session_state, render_google_auth_sidebar, render_header, render_quota_usage, render_sign_in,
+    render_trace_panel, start_rerun_trace, sync_google_sign_in, traced_view
+)
+from bookbuddy.webhook import post_change_sets
+
+# Loaded on first use, so the sign-in screen renders without them
+pd = lazy_import('pandas')
+errors = lazy_import('googleapiclient.errors')
 
 # Page configuration
 st.set_page_config(
-    page_title="📄 Google Docs Live Viewer",
-    page_icon="📄",
+    page_title="📊 Google Sheets Live",
+    page_icon="📊",
     layout="wide",
     initial_sidebar_state="expanded"
 )
 
+start_rerun_trace("Sheets Live")
+
 # Custom CSS
-st.markdown("""
-<style>
-    .main-header {
-        text-align: center;
-        padding: 2rem 0;
-        background: linear-gradient(90deg, #4285f4 0%, #34a853 100%);
-        color: white;
-        border-radius: 10px;
-        margin-bottom: 2rem;
-    }
-    
-    .auth-section {
-        background: #f8f9fa;
-        padding: 2rem;
-        border-radius: 15px;
-        border: 2px solid #e9ecef;
-        margin: 1rem 0;
-    }
-    
-    .doc-content {
+apply_page_style(('#0f9d58', '#34a853'), AUTH_CSS + """
+    .sheet-content {
         background: white;
-        padding: 2rem;
-        border-radius: 10px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        margin: 1rem 0;
-        max-height: 600px;
-        overflow-y: auto;
-    }
-    
-    .success-message {
-        background: #d4edda;
-        color: #155724;
-        padding: 1rem;
-        border-radius: 8px;
-        border: 1px solid #c3e6cb;
-        margin: 1rem 0;
-    }
-    
-    .error-message {
-        background: #f8d7da;
-        color: #721c24;
-        padding: 1rem;
-        border-radius: 8px;
-        border: 1px solid #f5c6cb;
-        margin: 1rem 0;
-    }
-    
-    .info-card {
-        background: #e3f2fd;
         padding: 1.5rem;
         border-radius: 10px;
-        border-left: 4px solid #2196f3;
+        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
         margin: 1rem 0;
     }
-</style>
-""", unsafe_allow_html=True)
+""")
 
 # Initialize session state
-if 'google_credentials' not in st.session_state:
-    st.session_state.google_credentials = None
-if 'authenticated' not in st.session_state:
-    st.session_state.authenticated = False
-if 'doc_content' not in st.session_state:
-    st.session_state.doc_content = None
-if 'doc_metadata' not in st.session_state:
-    st.session_state.doc_metadata = None
-
-# Google API configuration
-SCOPES = [
-    'https://www.googleapis.com/auth/documents.readonly',
-    'https://www.googleapis.com/auth/drive.readonly'
-]
+sync_google_sign_in()
+init_session_state({
+    'sheet_frames': {},
+    'sheet_stats': None,
+    'sheet_snapshots': {},
+    'sheet_changes': [],
+    'sheet_version': None,
+    'sheet_poll_stats': {'polls': 0, 'skipped': 0, 'fetched': 0, 'changed_rows': 0},
+    'write_buffer': None,
+    'last_flush': None,
+    'editor_generation': 0,
+    'last_fetch_time': 0.0,
+    # Spread sessions' polls so many open tabs don't hit the API in lockstep
+    'refresh_jitter': random.random()
+})
 
 # Main header
-st.markdown("""
-<div class="main-header">
-    <h1>📄 Google Docs Live Viewer</h1>
-    <p>View and monitor Google Documents in real-time</p>
-</div>
-""", unsafe_allow_html=True)
+render_header("📊 Google Sheets Live", "Monitor production tracking spreadsheets in real-time")
 
 # Sidebar for authentication
 with st.sidebar:
-    st.title("🔐 Google Authentication")
+    render_google_auth_sidebar({
+        'sheet_frames': {},
+        'sheet_stats': None,
+        'sheet_snapshots': {},
+        'sheet_changes': [],
+        'sheet_version': None
+    })
     
-    # Authentication file upload
-    st.subheader("Upload Credentials")
-    uploaded_file = st.file_uploader(
-        "Upload Google OAuth2 JSON file",
-        type=['json'],
-        help="Upload your Google OAuth2 credentials JSON file from Google Cloud Console"
+    # Spreadsheet settings
+    st.subheader("📊 Spreadsheet Settings")
+    spreadsheet_id = st.text_input(
+        "Spreadsheet ID",
+        help="Enter the spreadsheet ID from the Google Sheets URL"
+    )
+    ranges_text = st.text_area(
+        "Ranges (A1 notation)",
+        value="Sheet1",
+        help="One range per line, e.g. Sheet1 or Tracker!A1:H500"
+    )
+    has_header = st.checkbox("First row is header", value=True)
+    page_rows = st.select_slider(
+        "Rows per page",
+        options=[2000, 5000, 10000, 20000, 50000],
+        value=10000,
+        help="Ranges longer than this are read in row windows"
+    )
+    page_workers = st.slider("Parallel page reads", min_value=1, max_value=8, value=4)
+    key_column = st.text_input(
+        "Row key column",
+        value="",
+        help="Column that identifies a row (e.g. Chapter). Leave empty to match rows by position"
+    )
+    change_webhook_url = st.text_input(
+        "Change webhook URL",
+        placeholder="https://example.com/webhook",
+        help="Each non-empty change set is POSTed here as JSON"
     )
     
-    if uploaded_file is not None:
-        try:
-            credentials_data = json.load(uploaded_file)
-            st.session_state.credentials_data = credentials_data
-            st.success("✅ Credentials file loaded successfully!")
-            
-            # Display some info about the credentials
-            if 'web' in credentials_data:
-                client_info = credentials_data['web']
-                st.info(f"**Client ID:** {client_info.get('client_id', 'N/A')[:20]}...")
-                st.info(f"**Project ID:** {client_info.get('project_id', 'N/A')}")
-            
-        except Exception as e:
-            st.error(f"❌ Error loading credentials: {str(e)}")
-    
-    # Manual credentials input
-    st.subheader("Manual Configuration")
-    with st.expander("Enter credentials manually"):
-        client_id = st.text_input("Client ID", type="password")
-        client_secret = st.text_input("Client Secret", type="password")
-        redirect_uri = st.text_input("Redirect URI", value="http://localhost:8501")
-        
-        if st.button("Save Manual Credentials"):
-            if client_id and client_secret:
-                manual_creds = {
-                    "web": {
-                        "client_id": client_id,
-                        "client_secret": client_secret,
-                        "redirect_uris": [redirect_uri],
-                        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                        "token_uri": "https://oauth2.googleapis.com/token"
-                    }
-                }
-                st.session_state.credentials_data = manual_creds
-                st.success("Manual credentials saved!")
-    
-    # Authentication status
-    st.subheader("Authentication Status")
-    if st.session_state.authenticated:
-        st.success("✅ Authenticated")
-        if st.button("🔓 Logout"):
-            st.session_state.authenticated = False
-            st.session_state.google_credentials = None
-            st.rerun()
-    else:
-        st.warning("❌ Not authenticated")
+    # Write-back settings
+    st.subheader("✏️ Write-back")
+    flush_after_seconds = st.number_input("Auto-flush after (seconds)", min_value=5, max_value=600, value=30)
+    flush_max_cells = st.number_input("Flush at pending cells", min_value=1, max_value=100000, value=500)
     
-    # Document settings
-    st.subheader("📄 Document Settings")
-    doc_id = st.text_input(
-        "Google Doc ID",
-        help="Enter the Google Document ID from the URL"
+    auto_refresh = st.checkbox("Auto-refresh", value=False)
+    refresh_interval = st.select_slider(
+        "Refresh interval (seconds)",
+        options=[15, 30, 60, 120, 300, 600],
+        value=60,
+        disabled=not auto_refresh
     )
     
-    auto_refresh = st.checkbox("Auto-refresh (30s)", value=False)
-    
     if auto_refresh:
-        st.info("🔄 Auto-refresh enabled")
+        st.info(f"🔄 Auto-refresh every {refresh_interval}s")
 
-# Main content area
-def authenticate_google():
-    """Handle Google OAuth2 authentication"""
-    if 'credentials_data' not in st.session_state:
-        st.error("Please upload credentials file first!")
-        return False
-    
+def get_write_buffer():
+    """The session's write buffer for the current spreadsheet"""
+    buffer = st.session_state.write_buffer
+    if buffer is None or buffer.spreadsheet_id != spreadsheet_id:
+        version = st.session_state.sheet_version[1] if st.session_state.sheet_version else None
+        buffer = SheetWriteBuffer(spreadsheet_id, version)
+        st.session_state.write_buffer = buffer
+    return buffer
+
+def stage_dataframe_edits(range_name, df, changes):
+    """Stage {row position: {column: value}} edits made to a fetched range"""
+    sheet, first_row, first_col = split_a1(st.session_state.sheet_stats['resolved'].get(range_name, range_name))
+    header_offset = 1 if has_header else 0
+    buffer = get_write_buffer()
+    columns = list(df.columns)
+    for position, row_changes in changes.items():
+        for column, value in row_changes.items():
+            col = columns.index(column)
+            buffer.stage(sheet, first_row + header_offset + position, first_col + col,
+                         value, df.iat[position, col])
+
+def stage_editor_edits(range_name, df):
+    """Stage what the current data editor for ``range_name`` holds; returns the editor's key"""
+    editor_key = f"editor_{st.session_state.editor_generation}_{range_name}"
+    edited_rows = st.session_state.get(editor_key, {}).get('edited_rows', {})
+    if edited_rows:
+        stage_dataframe_edits(range_name, df, {int(k): v for k, v in edited_rows.items()})
+    return editor_key
+
+@traced('sheets.flush')
+def flush_write_buffer():
+    """Flush pending edits and reload the sheet so the view reflects the write"""
+    buffer = get_write_buffer()
     try:
-        # Create a temporary file for credentials
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            json.dump(st.session_state.credentials_data, f)
-            temp_creds_path = f.name
+        result = buffer.flush(get_service('sheets'), get_service('drive'), get_quota('sheets'), get_quota('drive'))
+        st.session_state.last_flush = result
+    except errors.HttpError as e:
+        st.error(f"❌ Write-back failed: {str(e)}")
+        return
+    st.session_state.write_buffer = None
+    st.session_state.editor_generation += 1
+    st.session_state.sheet_version = None
+
+@traced('sheets.refresh')
+def refresh_sheets(spreadsheet_id, ranges):
+    """Poll the spreadsheet, refetching and diffing the ranges only if Drive reports a change"""
+    st.session_state.last_fetch_time = time.time()
+    poll_stats = st.session_state.sheet_poll_stats
+    state_key = (spreadsheet_id, tuple(ranges), has_header, key_column)
+    try:
+        drive_info = None
+        try:
+            drive_info = get_quota('drive').execute(get_service('drive').files().get(
+                fileId=spreadsheet_id, fields='modifiedTime,version'
+            ))
+            poll_stats['polls'] += 1
+        except Exception as e:
+            st.warning(f"Change check unavailable, fetching all ranges: {str(e)}")
         
-        # Create OAuth2 flow
-        flow = Flow.from_client_secrets_file(
-            temp_creds_path,
-            scopes=SCOPES,
-            redirect_uri='http://localhost:8501'
-        )
+        if drive_info and st.session_state.sheet_version == (state_key, drive_info.get('version')):
+            poll_stats['skipped'] += 1
+            return
         
-        # Generate authorization URL
-        auth_url, _ = flow.authorization_url(prompt='consent')
+        # Show the first page of the first range while the rest stream in
+        preview = st.empty()
+        progress = st.progress(0.0, text="Reading pages...")
         
-        st.markdown(f"""
-        <div class="info-card">
-            <h4>🔗 Authentication Required</h4>
-            <p>Click the link below to authenticate with Google:</p>
-            <a href="{auth_url}" target="_blank" style="color: #1976d2; font-weight: bold;">
-                🔐 Authenticate with Google
-            </a>
-        </div>
-        """, unsafe_allow_html=True)
+        def show_chunk(requested, page_index, chunk, pages_done, pages_total):
+            progress.progress(pages_done / pages_total, text=f"Read {pages_done} of {pages_total} pages")
+            if requested == ranges[0] and page_index == 0 and pages_done < pages_total:
+                with preview.container():
+                    st.caption(f"Showing the first page of {requested} while the rest loads")
+                    st.dataframe(chunk, use_container_width=True, height=300)
         
-        # Input for authorization code
-        auth_code = st.text_input(
-            "Enter authorization code:",
-            help="Copy the authorization code from the redirect URL"
-        )
+        try:
+            frames, stats = fetch_sheet_ranges(
+                get_service('sheets'), get_quota('sheets'), spreadsheet_id, ranges, has_header,
+                page_rows=page_rows, max_workers=page_workers, on_chunk=show_chunk
+            )
+        finally:
+            preview.empty()
+            progress.empty()
+        poll_stats['fetched'] += 1
         
-        if auth_code:
-            try:
-                # Exchange code for credentials
-                flow.fetch_token(code=auth_code)
-                credentials = flow.credentials
-                
-                # Store credentials in session state
-                st.session_state.google_credentials = {
-                    'token': credentials.token,
-                    'refresh_token': credentials.refresh_token,
-                    'token_uri': credentials.token_uri,
-                    'client_id': credentials.client_id,
-                    'client_secret': credentials.client_secret,
-                    'scopes': credentials.scopes
-                }
-                st.session_state.authenticated = True
-                
-                # Clean up temp file
-                os.unlink(temp_creds_path)
-                
-                st.success("✅ Authentication successful!")
-                st.rerun()
-                
-            except Exception as e:
-                st.error(f"❌ Authentication failed: {str(e)}")
-                os.unlink(temp_creds_path)
+        # Diff against the previous snapshot of the same configuration
+        previous = st.session_state.sheet_snapshots if st.session_state.get('sheet_state_key') == state_key else {}
+        snapshots = {}
+        change_sets = []
+        for name, df in frames.items():
+            hashes = snapshot_hashes(df, key_column)
+            snapshots[name] = (df, hashes)
+            if name in previous:
+                change = diff_snapshots(name, *previous[name], df, hashes)
+                if change['added'] or change['removed'] or change['modified']:
+                    change_sets.append(change)
         
-        return False
+        # Keep the local SQL mirror in step with the new snapshot
+        mirror = get_sheet_mirror()
+        for name, (df, hashes) in snapshots.items():
+            mirror.sync(spreadsheet_id, name, df, hashes, key_column)
         
-    except Exception as e:
-        st.error(f"❌ Error setting up authentication: {str(e)}")
-        return False
-
-def get_google_doc_content(doc_id):
-    """Fetch Google Doc content"""
-    if not st.session_state.authenticated or not st.session_state.google_credentials:
-        return None, None
-    
-    try:
-        # Create credentials object
-        creds = Credentials(
-            token=st.session_state.google_credentials['token'],
-            refresh_token=st.session_state.google_credentials['refresh_token'],
-            token_uri=st.session_state.google_credentials['token_uri'],
-            client_id=st.session_state.google_credentials['client_id'],
-            client_secret=st.session_state.google_credentials['client_secret'],
-            scopes=st.session_state.google_credentials['scopes']
+        poll_stats['changed_rows'] += sum(
+            len(c['added']) + len(c['removed']) + len(c['modified']) for c in change_sets
         )
+        st.session_state.sheet_snapshots = snapshots
+        st.session_state.sheet_state_key = state_key
+        st.session_state.sheet_version = (state_key, drive_info.get('version')) if drive_info else None
+        st.session_state.sheet_frames = frames
+        st.session_state.sheet_stats = stats
+        # The editors' row positions refer to the replaced frames
+        st.session_state.editor_generation += 1
+        if change_sets or state_key != st.session_state.get('sheet_changes_key'):
+            st.session_state.sheet_changes = change_sets
+            st.session_state.sheet_changes_key = state_key
         
-        # Build the service
-        service = build('docs', 'v1', credentials=creds)
-        
-        # Retrieve the document
-        document = service.documents().get(documentId=doc_id).execute()
-        
-        # Extract text content
-        content = []
-        for element in document.get('body', {}).get('content', []):
-            if 'paragraph' in element:
-                paragraph = element['paragraph']
-                for text_run in paragraph.get('elements', []):
-                    if 'textRun' in text_run:
-                        content.append(text_run['textRun']['content'])
-        
-        # Document metadata
-        metadata = {
-            'title': document.get('title', 'Untitled'),
-            'document_id': document.get('documentId'),
-            'revision_id': document.get('revisionId'),
-            'created_time': document.get('createdTime'),
-            'modified_time': document.get('modifiedTime')
-        }
-        
-        return ''.join(content), metadata
-        
-    except HttpError as e:
+        if change_sets and change_webhook_url:
+            try:
+                post_change_sets(change_webhook_url, spreadsheet_id, change_sets)
+            except Exception as e:
+                st.warning(f"Change webhook failed: {str(e)}")
+    except errors.HttpError as e:
         st.error(f"❌ Google API Error: {str(e)}")
-        return None, None
     except Exception as e:
-        st.error(f"❌ Error fetching document: {str(e)}")
-        return None, None
+        st.error(f"❌ Error fetching spreadsheet: {str(e)}")
 
-# Main interface
-if not st.session_state.authenticated:
-    st.markdown("""
-    <div class="auth-section">
-    """, unsafe_allow_html=True)
-    
-    st.markdown("### 🔐 Authentication Required")
-    st.markdown("""
-    To view Google Docs, you need to authenticate with Google. Please upload your 
-    OAuth2 credentials file in the sidebar and follow the authentication process.
-    """)
+@traced_view('sheets.sheet_view')
+def render_sheet_view():
+    """Render the fetched ranges, refetching when an auto-refresh is due"""
+    ranges = [line.strip() for line in ranges_text.splitlines() if line.strip()]
+    # The edit that triggered this rerun must be staged against the frame it was made on,
+    # before a refresh replaces that frame or a flush retires its editor
+    if st.session_state.get('edit_range') in st.session_state.sheet_frames:
+        stage_editor_edits(st.session_state.edit_range, st.session_state.sheet_frames[st.session_state.edit_range])
+    if auto_refresh and spreadsheet_id and ranges and \
+            time.time() - st.session_state.last_fetch_time >= refresh_interval:
+        refresh_sheets(spreadsheet_id, ranges)
     
-    if st.button("🚀 Start Authentication", use_container_width=True):
-        authenticate_google()
+    st.markdown("### 📊 Sheet Data")
+    if not spreadsheet_id:
+        st.info("📝 Enter a spreadsheet ID in the sidebar to get started")
+        return
+    if not ranges:
+        st.info("📝 Enter at least one range in the sidebar")
+        return
     
-    st.markdown("</div>", unsafe_allow_html=True)
+    col_a, col_b = st.columns(2)
+    with col_a:
+        if st.button("🔄 Refresh Data", use_container_width=True):
+            with st.spinner("Fetching ranges..."):
+                refresh_sheets(spreadsheet_id, ranges)
+    with col_b:
+        if st.button("🔗 Open in Google Sheets", use_container_width=True):
+            st.markdown(f"[Open Spreadsheet](https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit)")
     
-    # Instructions for getting credentials
-    with st.expander("📋 How to get Google OAuth2 credentials"):
-        st.markdown("""
-        1. Go to [Google Cloud Console](https://console.cloud.google.com/)
-        2. Create a new project or select existing one
-        3. Enable Google Docs API and Google Drive API
-        4. Go to "Credentials" → "Create Credentials" → "OAuth 2.0 Client IDs"
-        5. Set application type to "Web application"
-        6. Add `http://localhost:8501` to authorized redirect URIs
-        7. Download the JSON file and upload it here
-        """)
-
-else:
-    # Document viewer interface
-    col1, col2 = st.columns([3, 1])
+    frames = st.session_state.sheet_frames
+    stats = st.session_state.sheet_stats
+    if not frames:
+        st.info("👆 Click 'Refresh Data' to load the ranges")
+        return
     
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.markdown("### 📄 Document Viewer")
-        
-        if doc_id:
-            # Fetch document button
-            col_a, col_b, col_c = st.columns(3)
-            with col_a:
-                if st.button("🔄 Refresh Document", use_container_width=True):
-                    with st.spinner("Fetching document..."):
-                        content, metadata = get_google_doc_content(doc_id)
-                        if content is not None:
-                            st.session_state.doc_content = content
-                            st.session_state.doc_metadata = metadata
-            
-            with col_b:
-                if st.button("📋 Copy Content", use_container_width=True):
-                    if st.session_state.doc_content:
-                        st.code(st.session_state.doc_content)
-            
-            with col_c:
-                if st.button("💾 Download as Text", use_container_width=True):
-                    if st.session_state.doc_content:
-                        st.download_button(
-                            "Download",
-                            st.session_state.doc_content,
-                            f"google_doc_{doc_id}.txt",
-                            "text/plain"
-                        )
-            
-            # Display document content
-            if st.session_state.doc_content:
-                # Document metadata
-                if st.session_state.doc_metadata:
-                    metadata = st.session_state.doc_metadata
-                    st.markdown(f"**Title:** {metadata.get('title', 'N/A')}")
-                    st.markdown(f"**Last Modified:** {metadata.get('modified_time', 'N/A')}")
-                    st.markdown(f"**Document ID:** {metadata.get('document_id', 'N/A')}")
-                
-                # Document content
-                st.markdown("""
-                <div class="doc-content">
-                """, unsafe_allow_html=True)
-                
-                st.markdown(st.session_state.doc_content)
-                
-                st.markdown("</div>", unsafe_allow_html=True)
-            
-            else:
-                st.info("👆 Click 'Refresh Document' to load content")
-        
-        else:
-            st.info("📝 Enter a Google Doc ID in the sidebar to get started")
-    
+        st.metric("Ranges", len(frames))
     with col2:
-        st.markdown("### 📊 Document Info")
+        st.metric("Total Rows", f"{sum(len(df) for df in frames.values()):,}")
+    with col3:
+        st.metric("First Page", f"{stats['first_page_ms']:.0f} ms")
+    with col4:
+        st.metric("All Pages", f"{stats['fetch_ms']:.0f} ms", f"{stats['pages']} pages", delta_color="off")
+    
+    # Timer or size triggered flush of pending edits
+    buffer = st.session_state.write_buffer
+    if buffer and len(buffer) and (len(buffer) >= flush_max_cells
+                                   or time.time() - buffer.staged_since >= flush_after_seconds):
+        flush_write_buffer()
+        refresh_sheets(spreadsheet_id, ranges)
+        if st.session_state.write_buffer is None:
+            # Nothing pending any more; rerun the page so the fragment drops the flush timer
+            st.rerun()
+    
+    # Latest change set
+    poll_stats = st.session_state.sheet_poll_stats
+    change_sets = st.session_state.sheet_changes
+    if change_sets:
+        st.markdown("#### 🔀 Latest Changes")
+        for change in change_sets:
+            st.markdown(
+                f"**{change['range']}:** {len(change['added'])} added, "
+                f"{len(change['removed'])} removed, {len(change['modified'])} modified"
+            )
+            if change['modified']:
+                st.dataframe(
+                    pd.DataFrame([c['after'] for c in change['modified']],
+                                 index=[c['key'] for c in change['modified']]),
+                    use_container_width=True
+                )
+            if change['added']:
+                st.caption("Added rows")
+                st.dataframe(pd.DataFrame(change['added']), use_container_width=True, hide_index=True)
+            if change['removed']:
+                st.caption("Removed rows")
+                st.dataframe(pd.DataFrame(change['removed']), use_container_width=True, hide_index=True)
+    st.caption(
+        f"Polls: {poll_stats['polls']} · skipped (unchanged): {poll_stats['skipped']} · "
+        f"full fetches: {poll_stats['fetched']} · changed rows seen: {poll_stats['changed_rows']}"
+    )
+    
+    tabs = st.tabs([f"📄 {name}" for name in frames])
+    for tab, (name, df) in zip(tabs, frames.items()):
+        with tab:
+            st.dataframe(df, use_container_width=True, height=500)
+    
+    # Local mirror queries; no API traffic
+    with st.expander("🔎 Query Local Mirror"):
+        query_range = st.selectbox("Range", list(frames.keys()), key="query_range")
+        query_columns = list(frames[query_range].columns)
+        col1, col2 = st.columns(2)
+        with col1:
+            filter_column = st.selectbox("Filter column", ["(none)"] + query_columns, key="query_filter_column")
+            filter_values = st.multiselect(
+                "Values",
+                [] if filter_column == "(none)" else
+                get_sheet_mirror().distinct_values(spreadsheet_id, query_range, filter_column),
+                key="query_filter_values"
+            )
+        with col2:
+            search = st.text_input("Search text", key="query_search")
+            group_by = st.selectbox("Group by", ["(none)"] + query_columns, key="query_group_by")
+        numeric_columns = [
+            col for col in query_columns
+            if pd.api.types.is_numeric_dtype(frames[query_range][col].dtype)
+            and not pd.api.types.is_bool_dtype(frames[query_range][col].dtype)
+        ]
+        sum_column = st.selectbox("Sum column", ["(none)"] + numeric_columns, key="query_sum_column",
+                                  disabled=group_by == "(none)")
         
-        if st.session_state.doc_metadata:
-            metadata = st.session_state.doc_metadata
-            
-            # Document statistics
-            if st.session_state.doc_content:
-                word_count = len(st.session_state.doc_content.split())
-                char_count = len(st.session_state.doc_content)
-                
-                st.metric("Word Count", word_count)
-                st.metric("Character Count", char_count)
-                st.metric("Estimated Reading Time", f"{word_count // 200} min")
-            
-            # Document details
-            st.markdown("**Document Details:**")
-            st.text(f"Title: {metadata.get('title', 'N/A')}")
-            st.text(f"Revision: {metadata.get('revision_id', 'N/A')}")
-            
-            # Last update
-            if metadata.get('modified_time'):
-                st.markdown(f"**Last Updated:**")
-                st.text(metadata['modified_time'])
+        result, query_ms = get_sheet_mirror().query(
+            spreadsheet_id,
+            query_range,
+            filters={filter_column: filter_values} if filter_column != "(none)" else None,
+            search=search,
+            group_by=None if group_by == "(none)" else group_by,
+            sum_column=None if sum_column == "(none)" else sum_column
+        )
+        st.caption(f"{len(result):,} rows in {query_ms:.1f} ms from the {get_sheet_mirror().backend} mirror")
+        if group_by != "(none)" and not result.empty:
+            st.bar_chart(result.set_index(group_by)['total' if 'total' in result else 'count'])
+        st.dataframe(result, use_container_width=True, hide_index=True, height=300)
+    
+    # Write-back
+    with st.expander("✏️ Edit & Write Back"):
+        edit_range = st.selectbox("Range to edit", list(frames.keys()), key="edit_range")
+        df = frames[edit_range]
+        editor_key = f"editor_{st.session_state.editor_generation}_{edit_range}"
+        st.data_editor(df, key=editor_key, use_container_width=True, height=300, disabled=False)
+        stage_editor_edits(edit_range, df)
         
-        # Quick actions
-        st.markdown("### ⚡ Quick Actions")
+        st.markdown("**Bulk update**")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            target_column = st.selectbox("Set column", list(df.columns), key="bulk_column")
+        with col2:
+            new_value = st.text_input("To value", value="Complete", key="bulk_value")
+        with col3:
+            filter_column = st.selectbox("Where column", list(df.columns), key="bulk_filter_column")
+        filter_values = st.multiselect(
+            "Has any of",
+            sorted(df[filter_column].dropna().astype(str).unique())[:1000],
+            key="bulk_filter_values"
+        )
+        if st.button("➕ Stage Bulk Update", disabled=not filter_values):
+            mask = df[filter_column].astype(str).isin(filter_values).to_numpy()
+            stage_dataframe_edits(
+                edit_range, df,
+                {int(position): {target_column: new_value} for position in mask.nonzero()[0]}
+            )
         
-        if st.button("🔗 Open in Google Docs", use_container_width=True):
-            if doc_id:
-                st.markdown(f"[Open Document](https://docs.google.com/document/d/{doc_id}/edit)")
+        buffer = get_write_buffer()
+        pending_ranges = buffer.coalesce() if len(buffer) else []
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Pending Cells", len(buffer))
+        with col2:
+            st.metric("Coalesced Ranges", len(pending_ranges))
+        with col3:
+            if st.button("💾 Flush Now", disabled=not len(buffer), use_container_width=True):
+                flush_write_buffer()
+                refresh_sheets(spreadsheet_id, ranges)
+                st.rerun()
+        with col4:
+            if st.button("🗑️ Discard", disabled=not len(buffer), use_container_width=True):
+                st.session_state.write_buffer = None
+                st.session_state.editor_generation += 1
+                st.rerun()
         
-        if st.button("📤 Share Document", use_container_width=True):
-            if doc_id:
-                share_url = f"https://docs.google.com/document/d/{doc_id}/edit"
-                st.code(share_url)
+        result = st.session_state.last_flush
+        if result:
+            st.caption(
+                f"Last flush: {result['updated']} cells in {result['ranges']} ranges with "
+                f"{result['api_calls']} API calls ({result['seconds'] * 1000:.0f} ms)"
+            )
+            if result['conflicts']:
+                st.warning(f"{len(result['conflicts'])} cells changed in the sheet since they were edited and were not written")
+                st.dataframe(pd.DataFrame(result['conflicts']), use_container_width=True, hide_index=True)
+    
+    with st.expander("⏱️ Fetch & Convert Timing"):
+        st.dataframe(
+            pd.DataFrame(stats['ranges']),
+            use_container_width=True,
+            hide_index=True,
+            column_config={"Convert (ms)": st.column_config.NumberColumn("Convert (ms)", format="%.1f")}
+        )
+    
+    # Edits staged by this fragment run need the flush timer, which only a full page run can start
+    if st.session_state.write_buffer and len(st.session_state.write_buffer) and not flush_timer_running:
+        st.rerun()
+
+# Main interface
+if not st.session_state.authenticated:
+    render_sign_in("Google Sheets", "Google Sheets API and Google Drive API")
+
+else:
+    # Only the data view reruns on the timer: for auto-refresh, and to flush pending edits on time
+    run_every = None
+    if auto_refresh and spreadsheet_id:
+        run_every = refresh_interval * (1 + 0.1 * st.session_state.refresh_jitter)
+    flush_timer_running = bool(st.session_state.write_buffer and len(st.session_state.write_buffer))
+    if flush_timer_running:
+        run_every = min(run_every or flush_after_seconds, flush_after_seconds)
+    st.fragment(run_every=run_every)(render_sheet_view)()
 
-# Auto-refresh functionality
-if auto_refresh and st.session_state.authenticated and doc_id:
-    import time
-    time.sleep(30)
-    st.rerun()
+# API quota usage (rendered last so it includes this run's calls)
+if st.session_state.authenticated:
+    render_quota_usage()
 
 # Footer
 st.markdown("---")
 st.markdown("""
 <div style="text-align: center; color: #666; padding: 1rem;">
-    📄 Google Docs Live Viewer | Powered by Google Docs API | 
-    <a href="https://developers.google.com/docs" style="color: #4285f4;">API Documentation</a>
+    📊 Google Sheets Live | Powered by Google Sheets API | 
+    <a href="https://developers.google.com/sheets/api" style="color: #0f9d58;">API Documentation</a>
 </div>
 """, unsafe_allow_html=True)
 
+# Over budget, the change sets go first, then the fetched ranges (refetched on the next refresh)
+govern_session_memory(evict_keys=(
+    'sheet_changes', 'last_flush',
+    ('sheet_frames', 'sheet_snapshots', 'sheet_stats', 'sheet_version', 'sheet_state_key')
+))
+render_trace_panel()
@@ -1,12 +1,18 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 import io
-import json
 from datetime import datetime
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from bookbuddy.csv_tools import analyze_data, parse_csv
+from bookbuddy.lazy import lazy_import
+from bookbuddy.tracing import span
+from bookbuddy.ui import (
+    apply_page_style, error_message, govern_session_memory, init_session_state, render_header,
+    render_trace_panel, restore_spilled, start_rerun_trace, success_message
+)
+
+# Loaded on first use, so the upload screen renders without them
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+px = lazy_import('plotly.express')
 
 # Page configuration
 st.set_page_config(
@@ -16,18 +22,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+start_rerun_trace("CSV Upload Manager")
+
 # Custom CSS
-st.markdown("""
-<style>
-    .main-header {
-        text-align: center;
-        padding: 2rem 0;
-        background: linear-gradient(90deg, #ff6b6b 0%, #4ecdc4 100%);
-        color: white;
-        border-radius: 10px;
-        margin-bottom: 2rem;
-    }
-    
+apply_page_style(('#ff6b6b', '#4ecdc4'), """
     .upload-section {
         background: #f8f9fa;
         padding: 2rem;
@@ -45,32 +43,6 @@ st.markdown("""
         margin: 1rem 0;
     }
     
-    .success-message {
-        background: #d4edda;
-        color: #155724;
-        padding: 1rem;
-        border-radius: 8px;
-        border: 1px solid #c3e6cb;
-        margin: 1rem 0;
-    }
-    
-    .error-message {
-        background: #f8d7da;
-        color: #721c24;
-        padding: 1rem;
-        border-radius: 8px;
-        border: 1px solid #f5c6cb;
-        margin: 1rem 0;
-    }
-    
-    .info-card {
-        background: #e3f2fd;
-        padding: 1.5rem;
-        border-radius: 10px;
-        border-left: 4px solid #2196f3;
-        margin: 1rem 0;
-    }
-    
     .metric-card {
         background: white;
         padding: 1.5rem;
@@ -87,26 +59,31 @@ st.markdown("""
         margin: 1rem 0;
         min-height: 500px;
     }
-</style>
-""", unsafe_allow_html=True)
+""")
 
 # Initialize session state
-if 'uploaded_data' not in st.session_state:
-    st.session_state.uploaded_data = None
-if 'data_history' not in st.session_state:
-    st.session_state.data_history = []
-if 'current_file_name' not in st.session_state:
-    st.session_state.current_file_name = None
-if 'data_analysis' not in st.session_state:
-    st.session_state.data_analysis = None
+init_session_state({
+    'uploaded_data': None,
+    'data_history': [],
+    'current_file_name': None,
+    'data_analysis': None
+})
 
 # Main header
-st.markdown("""
-<div class="main-header">
-    <h1>📁 CSV Upload & Data Manager</h1>
-    <p>Upload, analyze, and manage your CSV data with advanced visualization</p>
-</div>
-""", unsafe_allow_html=True)
+render_header("📁 CSV Upload & Data Manager", "Upload, analyze, and manage your CSV data with advanced visualization")
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def process_uploaded_file(file_bytes, encoding, delimiter, has_header, skip_rows, remove_empty_rows, remove_empty_cols, convert_types):
+    """Parse the uploaded bytes once per file and option set; reruns reuse the result"""
+    return parse_csv(
+        io.BytesIO(file_bytes), encoding, delimiter, has_header,
+        skip_rows, remove_empty_rows, remove_empty_cols, convert_types
+    )
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def get_analysis(df):
+    """Analysis of a parsed upload, cached on the DataFrame contents"""
+    return analyze_data(df)
 
 # Sidebar for file management and settings
 with st.sidebar:
@@ -150,141 +127,49 @@ with st.sidebar:
     if st.session_state.data_history:
         for i, item in enumerate(st.session_state.data_history[-5:]):  # Show last 5
             if st.button(f"📄 {item['name'][:20]}...", key=f"history_{i}"):
-                st.session_state.uploaded_data = item['data']
-                st.session_state.current_file_name = item['name']
-                st.rerun()
+                # Older entries may have been spilled to disk by the memory governor
+                data = restore_spilled(item['data'])
+                if data is None:
+                    st.warning(f"⚠️ {item['name']} is no longer cached; upload it again")
+                else:
+                    st.session_state.uploaded_data = data
+                    st.session_state.current_file_name = item['name']
+                    st.rerun()
     else:
         st.info("No upload history")
 
-def analyze_data(df):
-    """Perform comprehensive data analysis"""
-    analysis = {
-        'basic_info': {
-            'rows': len(df),
-            'columns': len(df.columns),
-            'memory_usage': df.memory_usage(deep=True).sum(),
-            'missing_values': df.isnull().sum().sum(),
-            'duplicate_rows': df.duplicated().sum()
-        },
-        'column_info': {},
-        'data_quality': {}
-    }
-    
-    # Analyze each column
-    for col in df.columns:
-        col_data = df[col]
-        analysis['column_info'][col] = {
-            'dtype': str(col_data.dtype),
-            'non_null_count': col_data.count(),
-            'null_count': col_data.isnull().sum(),
-            'unique_count': col_data.nunique(),
-            'memory_usage': col_data.memory_usage(deep=True)
-        }
-        
-        # Additional stats for numeric columns
-        if pd.api.types.is_numeric_dtype(col_data):
-            analysis['column_info'][col].update({
-                'mean': col_data.mean(),
-                'median': col_data.median(),
-                'std': col_data.std(),
-                'min': col_data.min(),
-                'max': col_data.max(),
-                'q25': col_data.quantile(0.25),
-                'q75': col_data.quantile(0.75)
-            })
-        
-        # Additional stats for text columns
-        elif col_data.dtype == 'object':
-            analysis['column_info'][col].update({
-                'avg_length': col_data.astype(str).str.len().mean(),
-                'max_length': col_data.astype(str).str.len().max(),
-                'most_common': col_data.mode().iloc[0] if len(col_data.mode()) > 0 else None
-            })
-    
-    return analysis
-
-def process_uploaded_file(uploaded_file, encoding, delimiter, has_header, skip_rows, remove_empty_rows, remove_empty_cols, convert_types):
-    """Process the uploaded CSV file"""
-    try:
-        # Read CSV with specified options
-        df = pd.read_csv(
-            uploaded_file,
-            encoding=encoding,
-            delimiter=delimiter,
-            header=0 if has_header else None,
-            skiprows=skip_rows
-        )
-        
-        # Data cleaning
-        if remove_empty_rows:
-            df = df.dropna(how='all')
-        
-        if remove_empty_cols:
-            df = df.dropna(axis=1, how='all')
-        
-        # Auto-convert data types
-        if convert_types:
-            for col in df.columns:
-                # Try to convert to numeric
-                if df[col].dtype == 'object':
-                    try:
-                        df[col] = pd.to_numeric(df[col], errors='ignore')
-                    except:
-                        pass
-                    
-                    # Try to convert to datetime
-                    try:
-                        if df[col].dtype == 'object':
-                            df[col] = pd.to_datetime(df[col], errors='ignore', infer_datetime_format=True)
-                    except:
-                        pass
-        
-        return df, None
-        
-    except Exception as e:
-        return None, str(e)
-
 # Main content area
 if uploaded_file is not None:
     # Process the uploaded file
     with st.spinner("Processing uploaded file..."):
         df, error = process_uploaded_file(
-            uploaded_file, encoding, delimiter, has_header, 
+            uploaded_file.getvalue(), encoding, delimiter, has_header, 
             skip_rows, remove_empty_rows, remove_empty_cols, convert_types
         )
     
     if error:
-        st.markdown(f"""
-        <div class="error-message">
-            ❌ Error processing file: {error}
-        </div>
-        """, unsafe_allow_html=True)
+        error_message(f"❌ Error processing file: {error}")
     else:
         # Store data in session state
         st.session_state.uploaded_data = df
         st.session_state.current_file_name = uploaded_file.name
         
-        # Add to history
-        history_item = {
-            'name': uploaded_file.name,
-            'data': df.copy(),
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'size': len(df)
-        }
-        
-        # Avoid duplicates in history
+        # Add to history (copied only when actually added, not on every rerun)
         if not any(item['name'] == uploaded_file.name for item in st.session_state.data_history):
-            st.session_state.data_history.append(history_item)
+            st.session_state.data_history.append({
+                'name': uploaded_file.name,
+                'data': df.copy(),
+                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'size': len(df)
+            })
         
         # Perform analysis
-        st.session_state.data_analysis = analyze_data(df)
+        st.session_state.data_analysis = get_analysis(df)
         
-        st.markdown(f"""
-        <div class="success-message">
-            ✅ File "{uploaded_file.name}" uploaded successfully! 
-            Loaded {len(df)} rows and {len(df.columns)} columns.
-        </div>
-        """, unsafe_allow_html=True)
+        success_message(
+            f'✅ File "{uploaded_file.name}" uploaded successfully! '
+            f"Loaded {len(df)} rows and {len(df.columns)} columns."
+        )
 
 # Display data if available
 if st.session_state.uploaded_data is not None:
@@ -424,13 +309,14 @@ if st.session_state.uploaded_data is not None:
                     missing_data = missing_data[missing_data > 0].sort_values(ascending=False)
                     
                     if len(missing_data) > 0:
-                        fig = px.bar(
-                            x=missing_data.index,
-                            y=missing_data.values,
-                            title="Missing Values by Column",
-                            labels={'x': 'Columns', 'y': 'Missing Count'}
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
+                        with span('chart.missing_values'):
+                            fig = px.bar(
+                                x=missing_data.index,
+                                y=missing_data.values,
+                                title="Missing Values by Column",
+                                labels={'x': 'Columns', 'y': 'Missing Count'}
+                            )
+                            st.plotly_chart(fig, use_container_width=True)
                 
                 # Data distribution for numeric columns
                 if len(numeric_cols) > 0:
@@ -438,26 +324,28 @@ if st.session_state.uploaded_data is not None:
                     selected_numeric_col = st.selectbox("Select column for distribution:", numeric_cols)
                     
                     if selected_numeric_col:
-                        fig = px.histogram(
-                            df,
-                            x=selected_numeric_col,
-                            title=f"Distribution of {selected_numeric_col}",
-                            marginal="box"
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
+                        with span('chart.distribution'):
+                            fig = px.histogram(
+                                df,
+                                x=selected_numeric_col,
+                                title=f"Distribution of {selected_numeric_col}",
+                                marginal="box"
+                            )
+                            st.plotly_chart(fig, use_container_width=True)
                 
                 # Correlation matrix for numeric columns
                 if len(numeric_cols) > 1:
                     st.markdown("#### 🔗 Correlation Matrix")
                     corr_matrix = df[numeric_cols].corr()
                     
-                    fig = px.imshow(
-                        corr_matrix,
-                        title="Correlation Matrix",
-                        color_continuous_scale="RdBu",
-                        aspect="auto"
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
+                    with span('chart.correlation'):
+                        fig = px.imshow(
+                            corr_matrix,
+                            title="Correlation Matrix",
+                            color_continuous_scale="RdBu",
+                            aspect="auto"
+                        )
+                        st.plotly_chart(fig, use_container_width=True)
         
         # Individual column tabs (full-screen views)
         for i, col in enumerate(df.columns[:12], 2):  # Start from index 2 (after main tabs)
@@ -501,17 +389,19 @@ if st.session_state.uploaded_data is not None:
                         
                         # Distribution chart
                         st.markdown("#### 📈 Distribution")
-                        fig = px.histogram(
-                            col_data,
-                            title=f"Distribution of {col}",
-                            marginal="box",
-                            nbins=50
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
+                        with span('chart.column_histogram', column=str(col)):
+                            fig = px.histogram(
+                                col_data,
+                                title=f"Distribution of {col}",
+                                marginal="box",
+                                nbins=50
+                            )
+                            st.plotly_chart(fig, use_container_width=True)
                         
                         # Box plot
-                        fig_box = px.box(y=col_data, title=f"Box Plot of {col}")
-                        st.plotly_chart(fig_box, use_container_width=True)
+                        with span('chart.column_box', column=str(col)):
+                            fig_box = px.box(y=col_data, title=f"Box Plot of {col}")
+                            st.plotly_chart(fig_box, use_container_width=True)
                     
                     else:
                         # Text/categorical column analysis
@@ -534,14 +424,15 @@ if st.session_state.uploaded_data is not None:
                         value_counts = col_data.value_counts().head(20)
                         
                         if len(value_counts) > 0:
-                            fig = px.bar(
-                                x=value_counts.index.astype(str),
-                                y=value_counts.values,
-                                title=f"Top 20 Values in {col}",
-                                labels={'x': 'Values', 'y': 'Frequency'}
-                            )
-                            fig.update_xaxes(tickangle=45)
-                            st.plotly_chart(fig, use_container_width=True)
+                            with span('chart.value_frequency', column=str(col)):
+                                fig = px.bar(
+                                    x=value_counts.index.astype(str),
+                                    y=value_counts.values,
+                                    title=f"Top 20 Values in {col}",
+                                    labels={'x': 'Values', 'y': 'Frequency'}
+                                )
+                                fig.update_xaxes(tickangle=45)
+                                st.plotly_chart(fig, use_container_width=True)
                     
                     # Full column data display
                     st.markdown("#### 📋 Complete Data")
@@ -620,3 +511,5 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+govern_session_memory(history_keys=('data_history',))
+render_trace_panel()